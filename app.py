@@ -1,67 +1,565 @@
-from flask import Flask, request, jsonify
-import pandas as pd
+import json
+import os
+import threading
+from collections import namedtuple
+from functools import partial
 
-from util import content_based_recommendations, collaborative_recommendations, hybrid_recommendations
-from flask_sqlalchemy import SQLAlchemy
+from flask import Blueprint, Flask, Response, current_app, request, jsonify, stream_with_context
 from flask_cors import CORS
 
-app = Flask(__name__)
-
-# Load the product data
-# train_data = pd.read_csv("models/clean_data.csv")
-train_data = pd.read_csv("models/final_data.csv")
-
-# Flask configuration
-app.secret_key = "secret_key"
-app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:///ecom_db.sqlite"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
-
-# Define the database models
-class Signup(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(100), nullable=False)
-    email = db.Column(db.String(100), nullable=False, unique=True)
-    password = db.Column(db.String(100), nullable=False)
-
-class Product(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
-    quantity = db.Column(db.Integer, nullable=False)
-    price = db.Column(db.Float, nullable=False)
-    img = db.Column(db.String(255), nullable=True)
-    category_id = db.Column(db.Integer, nullable=True)
-    factory = db.Column(db.String(100), nullable=True)
-    description = db.Column(db.String(500), nullable=True)
-
-class Cart(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user_email = db.Column(db.String(100), nullable=False)
-    product_id = db.Column(db.Integer, nullable=False)
-
-class UserInteraction(db.Model):
-    _tablename_ = 'user_interaction'
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, nullable=False)
-    product_id = db.Column(db.Integer, nullable=False)
-    interaction_count = db.Column(db.Integer, default=1)
+import metrics
+from cache import RecommendationCache
+from interaction_buffer import InteractionBuffer
+from trending import TrendingCounter
+from database import db, database_config, migrate, Signup, Product, Cart, UserInteraction, ProductChange
+
+# pandas, scikit-learn, SciPy and the model artifacts are imported and loaded on first use (or by warm_up),
+# so importing this module and creating the app stays fast
+
+routes = Blueprint('routes', __name__)
+
+def create_app(config=None):
+    """Create the Flask app; ``config`` overrides the settings read from the environment."""
+    app = Flask(__name__)
+
+    # Flask configuration
+    app.secret_key = "secret_key"
+    # DATABASE_URL selects SQLite (WAL, busy timeout) or a pooled server database, see database.py
+    app.config.update(database_config())
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Product data: the memory-mapped columnar catalog if catalog_store.py has built it, else this CSV
+    app.config['CATALOG_CSV'] = os.environ.get('CATALOG_CSV', 'models/final_data.csv')
+    # "exact" scores every item; "ivf" trades a little recall for much lower latency on large catalogs
+    app.config['SIMILARITY_BACKEND'] = os.environ.get('SIMILARITY_BACKEND', 'exact')
+    # Precomputed top-K neighbours (built by neighbours.py); items it cannot answer use SIMILARITY_BACKEND
+    app.config['NEIGHBOURS_DIR'] = os.environ.get('NEIGHBOURS_DIR', 'models/neighbours')
+    app.config['MAX_BATCH_SIZE'] = int(os.environ.get('MAX_BATCH_SIZE', 10000))
+    # Recommendation response cache: in-process LRU tier plus an optional SQLite file shared by all workers
+    app.config['CACHE_MAX_ENTRIES'] = int(os.environ.get('CACHE_MAX_ENTRIES', 10000))
+    app.config['CACHE_TTL'] = int(os.environ.get('CACHE_TTL', 300))
+    app.config['CACHE_SHARED_PATH'] = os.environ.get('CACHE_SHARED_PATH')
+    # Concurrent requests that miss the cache with the same key share one computation
+    app.config['CACHE_COALESCE'] = os.environ.get('CACHE_COALESCE', '1') != '0'
+    # Product views are buffered and written in batches; at most this many views / seconds of views
+    # can be lost if a worker dies. An interval of 0 writes every view through immediately.
+    app.config['INTERACTION_FLUSH_MAX_PENDING'] = int(os.environ.get('INTERACTION_FLUSH_MAX_PENDING', 500))
+    app.config['INTERACTION_FLUSH_INTERVAL'] = float(os.environ.get('INTERACTION_FLUSH_INTERVAL', 1.0))
+    # After this many flushes in a row fail, the views that failed are dropped (and counted) instead of retried
+    app.config['INTERACTION_FLUSH_MAX_RETRIES'] = int(os.environ.get('INTERACTION_FLUSH_MAX_RETRIES', 5))
+    app.config['PRODUCT_PAGE_MAX'] = int(os.environ.get('PRODUCT_PAGE_MAX', 1000))
+    # Admin product edits reach the content index incrementally: each worker polls the change log this often
+    # (0 only applies its own edits) and refits after this many updates or seconds with updates pending
+    app.config['CONTENT_UPDATE_INTERVAL'] = float(os.environ.get('CONTENT_UPDATE_INTERVAL', 2.0))
+    app.config['CONTENT_REFIT_THRESHOLD'] = int(os.environ.get('CONTENT_REFIT_THRESHOLD', 1000))
+    app.config['CONTENT_REFIT_INTERVAL'] = float(os.environ.get('CONTENT_REFIT_INTERVAL', 3600))
+    # Refits are written here and shared by every worker; the change log is pruned up to the latest one.
+    # Empty keeps refits in memory, per worker, and the whole log.
+    app.config['CONTENT_CHECKPOINT_DIR'] = os.environ.get('CONTENT_CHECKPOINT_DIR', 'models/content_checkpoint')
+    # Hybrid blending: score normalization (minmax, zscore or rrf), default signal weights, and how many
+    # content candidates are scored (at most the neighbour table's k); requests may override the first three
+    app.config['HYBRID_NORMALIZATION'] = os.environ.get('HYBRID_NORMALIZATION', 'minmax')
+    app.config['HYBRID_CONTENT_WEIGHT'] = float(os.environ.get('HYBRID_CONTENT_WEIGHT', 0.5))
+    app.config['HYBRID_COLLABORATIVE_WEIGHT'] = float(os.environ.get('HYBRID_COLLABORATIVE_WEIGHT', 0.5))
+    app.config['HYBRID_CANDIDATES'] = int(os.environ.get('HYBRID_CANDIDATES', 100))
+    # Trending products: views in the last TRENDING_WINDOW seconds, counted in TRENDING_BUCKETS time buckets of
+    # at most about 2 x TRENDING_CAPACITY products each; a TRENDING_HALF_LIFE > 0 also decays older views
+    app.config['TRENDING_WINDOW'] = float(os.environ.get('TRENDING_WINDOW', 3600))
+    app.config['TRENDING_BUCKETS'] = int(os.environ.get('TRENDING_BUCKETS', 60))
+    app.config['TRENDING_CAPACITY'] = int(os.environ.get('TRENDING_CAPACITY', 10000))
+    app.config['TRENDING_HALF_LIFE'] = float(os.environ.get('TRENDING_HALF_LIFE', 0))
+    # Opt-in sampling profiler: requests slower than PROFILE_SLOW_REQUEST_MS (0 disables it) have their stacks,
+    # sampled every PROFILE_INTERVAL_MS, written to PROFILE_DIR as folded stacks for flamegraph.pl or speedscope
+    app.config['PROFILE_SLOW_REQUEST_MS'] = float(os.environ.get('PROFILE_SLOW_REQUEST_MS', 0))
+    app.config['PROFILE_INTERVAL_MS'] = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+    app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', 'profiles')
+    # Load the models and indexes when the app is created instead of on the first request
+    app.config['WARM_UP'] = os.environ.get('WARM_UP', '0') != '0'
+    # Create missing tables and indexes when the app is created (DB_MIGRATE=0 leaves the schema alone)
+    app.config['DB_MIGRATE'] = os.environ.get('DB_MIGRATE', '1') != '0'
+    if config:
+        app.config.update(config)
+
+    db.init_app(app)
+    if app.config['DB_MIGRATE']:
+        with app.app_context():
+            migrate()
+    app.register_blueprint(routes)
+    app.register_error_handler(500, internal_error)
+
+    global profiler
+    profiler = None
+    if app.config['PROFILE_SLOW_REQUEST_MS'] > 0:
+        profiler = metrics.SamplingProfiler(app.config['PROFILE_DIR'], threshold=app.config['PROFILE_SLOW_REQUEST_MS'] / 1000,
+                                            interval=app.config['PROFILE_INTERVAL_MS'] / 1000)
+    metrics.init_app(app, profiler)
+
+    global recommendation_cache, interaction_buffer, trending
+    recommendation_cache = RecommendationCache(
+        max_entries=app.config['CACHE_MAX_ENTRIES'],
+        ttl=app.config['CACHE_TTL'],
+        shared_path=app.config['CACHE_SHARED_PATH'],
+        coalesce=app.config['CACHE_COALESCE'],
+    )
+    interaction_buffer = InteractionBuffer(
+        partial(flush_interactions, app),
+        max_pending=app.config['INTERACTION_FLUSH_MAX_PENDING'],
+        max_delay=app.config['INTERACTION_FLUSH_INTERVAL'],
+        max_retries=app.config['INTERACTION_FLUSH_MAX_RETRIES'],
+    )
+    trending = TrendingCounter(
+        window=app.config['TRENDING_WINDOW'],
+        n_buckets=app.config['TRENDING_BUCKETS'],
+        capacity=app.config['TRENDING_CAPACITY'],
+        half_life=app.config['TRENDING_HALF_LIFE'] or None,
+    )
+
+    if app.config['WARM_UP']:
+        warm_up(app)
+    return app
+
+def warm_up(app):
+    """Load the catalog, indexes and published collaborative model now rather than on the first request."""
+    with app.app_context():
+        load_content()
+        get_factor_registry().current()
+
+def internal_error(error):
+    """Unhandled exceptions are logged with their traceback and counted in /metrics; the client gets JSON."""
+    return jsonify({"message": "Internal server error"}), 500
+
+@metrics.register_collector
+def service_metrics():
+    """Gauges read from the recommendation services at scrape time (only those already loaded)."""
+    if recommendation_cache is not None:
+        for name, value in recommendation_cache.snapshot().items():
+            yield f"recommender_cache_{name}", "Response cache counters and size.", value, {}
+    if interaction_buffer is not None:
+        for name, value in interaction_buffer.stats.items():
+            yield f"recommender_interaction_buffer_{name}", "Buffered product view writes.", value, {}
+        yield "recommender_interaction_buffer_pending", "Product views waiting to be written.", interaction_buffer.pending, {}
+    if trending is not None:
+        for name, value in trending.snapshot().items():
+            yield f"recommender_trending_{name}", "Trending counter state.", value, {}
+    if profiler is not None:
+        for name, value in profiler.stats.items():
+            yield f"recommender_profiler_{name}", "Sampling profiler counters.", value, {}
+    if catalog_updater is not None:
+        content = catalog_updater.content
+        for name, value in catalog_updater.stats.items():
+            yield f"recommender_catalog_{name}", "Incremental catalog update counters.", value, {}
+        yield "recommender_catalog_products", "Products in the content index, tombstones included.", content.content_index.shape[0], {}
+        yield "recommender_catalog_pending_updates", "Content index rows appended or tombstoned since the last fit.", content.content_index.n_updates, {}
+        for name, value in getattr(content.similarity_backend, 'stats', {}).items():
+            yield f"recommender_similarity_{name}", "Similarity backend counters.", value, {"backend": content.similarity_backend.name}
+    model = factor_registry.model if factor_registry is not None else None
+    if model is not None:
+        meta = model.meta or {}
+        for name in ('train_seconds', 'trained_at', 'n_users', 'n_products', 'n_interactions'):
+            yield f"recommender_factor_model_{name}", "Collaborative model build statistics.", meta.get(name), {"version": model.version}
+
+# Recommendation services, created by create_app or loaded lazily by the getters below
+recommendation_cache = None
+interaction_buffer = None
+trending = None
+profiler = None
+catalog_updater = None
+interaction_store = None
+factor_registry = None
+_services_lock = threading.Lock()
+
+Content = namedtuple('Content', ['train_data', 'content_index', 'name_index', 'similarity_backend'])
+
+def load_content():
+    """Load the catalog, its TF-IDF content index, name index and similarity backend together, once."""
+    global catalog_updater
+    if catalog_updater is None:
+        with _services_lock:
+            if catalog_updater is None:
+                from catalog_store import load_catalog
+                from catalog_updates import CatalogUpdater
+                from content_index import load_content_index
+                from name_index import NameIndex
+                from neighbours import NeighbourTable, make_backend
+
+                # train_data = pd.read_csv("models/clean_data.csv")
+                with metrics.span('catalog_load'):
+                    train_data = load_catalog(current_app.config['CATALOG_CSV'])
+                # Fit the TF-IDF content index once (or load it from disk) instead of on every request
+                with metrics.span('content_index_load'):
+                    content_index = load_content_index(train_data)
+                # Resolve product names through an index instead of scanning every name per request
+                name_index = NameIndex(train_data['Name'])
+                # Serve similar items from the precomputed neighbour table (neighbours.py) while it matches the index
+                neighbour_table = NeighbourTable.load(current_app.config['NEIGHBOURS_DIR'])
+                if neighbour_table is not None and not neighbour_table.matches(content_index):
+                    print(f"Neighbour table in '{current_app.config['NEIGHBOURS_DIR']}' does not match the content index, using live search. Rebuild with neighbours.py.")
+                backend = partial(make_backend, current_app.config['SIMILARITY_BACKEND'])
+                updater = CatalogUpdater(
+                    Content(train_data, content_index, name_index, backend(content_index, table=neighbour_table)),
+                    partial(fetch_product_changes, current_app._get_current_object()),
+                    backend,
+                    poll_interval=current_app.config['CONTENT_UPDATE_INTERVAL'],
+                    refit_threshold=current_app.config['CONTENT_REFIT_THRESHOLD'],
+                    refit_interval=current_app.config['CONTENT_REFIT_INTERVAL'],
+                    checkpoint_dir=current_app.config['CONTENT_CHECKPOINT_DIR'] or None,
+                    prune_changes=partial(prune_product_changes, current_app._get_current_object()),
+                    # Refits rebuild the neighbour table, as wide as the one built offline, so lookups survive them
+                    neighbours_k=neighbour_table.k if neighbour_table is not None else None,
+                )
+                # Load the latest refit checkpoint, then catch up with the product edits logged after it
+                updater.poll()
+                catalog_updater = updater
+    return catalog_updater
+
+def get_content():
+    """The current content snapshot; admin product edits are applied to it by the catalog updater."""
+    updater = load_content()
+    updater.ensure_thread()
+    return updater.content
+
+def fetch_product_changes(app, after_id):
+    """``(last_id, [(product_id, fields or None), ...])`` for the product edits logged after ``after_id``."""
+    with app.app_context():
+        rows = (db.session.query(ProductChange, Product)
+                .outerjoin(Product, Product.id == ProductChange.product_id)
+                .filter(ProductChange.id > after_id)
+                .order_by(ProductChange.id)
+                .all())
+    if not rows:
+        return after_id, []
+    changes = [(change.product_id, None if change.deleted or product is None else {
+            "Name": product.name, "Factory": product.factory, "Img": product.img, "Description": product.description
+        }) for change, product in rows]
+    return rows[-1][0].id, changes
+
+def prune_product_changes(app, revision):
+    """Delete the logged product edits up to ``revision``, which a content checkpoint now includes."""
+    with app.app_context():
+        deleted = ProductChange.query.filter(ProductChange.id <= revision).delete(synchronize_session=False)
+        db.session.commit()
+    return deleted
+
+def refresh_content():
+    """Apply this worker's own product edit right away instead of at the next poll."""
+    if catalog_updater is not None:
+        catalog_updater.poll()
+
+# Product listing helpers
+PRODUCT_COLUMNS = {
+    "id": Product.id,
+    "Name": Product.name,
+    "Quantity": Product.quantity,
+    "Price": Product.price,
+    "Img": Product.img,
+    "Categoryid": Product.category_id,
+    "Factory": Product.factory,
+    "Description": Product.description,
+}
+
+def product_to_dict(product, fields=tuple(PRODUCT_COLUMNS)):
+    """Serialize a Product (or a row projected from Product columns) with the API field names."""
+    return {field: getattr(product, PRODUCT_COLUMNS[field].key) for field in fields}
+
+def parse_fields():
+    fields = request.args.get('fields')
+    if not fields:
+        return list(PRODUCT_COLUMNS)
+    fields = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in PRODUCT_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+def parse_cursor(cursor, order_by):
+    values = cursor.split(',')
+    if len(values) != len(order_by):
+        raise ValueError("Invalid cursor")
+    return [column.type.python_type(value) for column, value in zip(order_by, values)]
+
+def keyset_after(order_by, values):
+    """Rows strictly after ``values`` in ``order_by`` order, as an index-friendly OR of prefixes."""
+    from sqlalchemy import and_, or_
+
+    return or_(*[
+        and_(*[order_by[j] == values[j] for j in range(i)], column > values[i])
+        for i, column in enumerate(order_by)
+    ])
+
+def list_products(query, order_by=(Product.id,)):
+    """Serve a Product query with keyset pagination, field projection and optional streaming.
+
+    Query parameters: ``fields`` (comma-separated), ``limit`` and ``after`` (the
+    ``X-Next-Cursor`` of the previous page), and ``format=ndjson`` or ``stream=1``
+    to stream every matching row in constant memory. Without them the response is
+    the full JSON list, as before.
+    """
+    try:
+        fields = parse_fields()
+        cursor = request.args.get('after')
+        if cursor:
+            query = query.filter(keyset_after(order_by, parse_cursor(cursor, order_by)))
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    columns = list(dict.fromkeys([PRODUCT_COLUMNS[field] for field in fields] + list(order_by)))
+    query = query.with_entities(*columns).order_by(*order_by)
+    limit = request.args.get('limit', type=int)
+    if limit is not None:
+        limit = max(1, min(limit, current_app.config['PRODUCT_PAGE_MAX']))
+        query = query.limit(limit)
+
+    output_format = request.args.get('format', 'json')
+    if output_format == 'ndjson' or request.args.get('stream'):
+        rows = query.yield_per(1000)
+
+        def generate():
+            if output_format == 'ndjson':
+                for row in rows:
+                    yield json.dumps(product_to_dict(row, fields)) + "\n"
+                return
+            yield "["
+            for i, row in enumerate(rows):
+                yield ("," if i else "") + json.dumps(product_to_dict(row, fields))
+            yield "]"
+
+        mimetype = 'application/x-ndjson' if output_format == 'ndjson' else 'application/json'
+        return Response(stream_with_context(generate()), mimetype=mimetype), 200
+
+    rows = query.all()
+    response = jsonify([product_to_dict(row, fields) for row in rows])
+    if limit is not None and len(rows) == limit:
+        last = rows[-1]
+        response.headers['X-Next-Cursor'] = ','.join(str(getattr(last, column.key)) for column in order_by)
+    return response, 200
 
 # Helper Functions
-def record_interaction(user_id, product_id):
-    ui = UserInteraction.query.filter_by(user_id=user_id, product_id=product_id).first()
-    if ui:
-        ui.interaction_count += 1
+def get_interaction_store():
+    """Load the interaction store from the database on first use."""
+    global interaction_store
+    if interaction_store is None:
+        with _services_lock:
+            if interaction_store is None:
+                from interaction_store import InteractionStore
+
+                # User x product interaction counts, loaded once and kept current by record_interaction
+                interaction_store = InteractionStore()
+    if not interaction_store.loaded:
+        with metrics.span('interaction_load'):
+            interaction_store.load(db.session.query(UserInteraction.user_id, UserInteraction.product_id, UserInteraction.interaction_count))
+    return interaction_store
+
+def get_factor_registry():
+    global factor_registry
+    if factor_registry is None:
+        with _services_lock:
+            if factor_registry is None:
+                from factor_model import ModelRegistry
+
+                # Collaborative factors are trained by training.py and hot-swapped when a new version is published
+                factor_registry = ModelRegistry()
+    return factor_registry
+
+def get_factor_model():
+    """The newest collaborative model published by training.py, or None until there is one.
+
+    Requests never train a model themselves: until training.py publishes one, users get the
+    cold-start (trending) results and hybrid recommendations use the content signal alone.
+    """
+    return get_factor_registry().current()
+
+def upsert_interactions(table, dialect):
+    """``INSERT`` of interaction rows that adds to the count of a (user_id, product_id) pair already present,
+    or None when the dialect has no upsert."""
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+
+        statement = insert(table)
+        return statement.on_duplicate_key_update(interaction_count=table.c.interaction_count + statement.inserted.interaction_count)
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
     else:
-        ui = UserInteraction(user_id=user_id, product_id=product_id, interaction_count=1)
-        db.session.add(ui)
-    db.session.commit()
+        return None
+    statement = insert(table)
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.product_id],
+        set_={"interaction_count": table.c.interaction_count + statement.excluded.interaction_count})
+
+def flush_interactions(app, batch, chunk_size=400):
+    """Apply coalesced ``{(user_id, product_id): views}`` increments in one transaction.
+
+    One executemany upsert against the unique (user_id, product_id) index
+    (``ON CONFLICT ... DO UPDATE`` on SQLite and PostgreSQL, ``ON DUPLICATE KEY
+    UPDATE`` on MySQL), so workers flushing the same pair at once both count.
+    Rows go in key order, so concurrent flushes lock them in the same order.
+    Other databases find existing pairs with one SELECT per chunk, bump them with
+    an executemany UPDATE and INSERT the rest.
+    """
+    from sqlalchemy import bindparam, tuple_
 
-def get_personal_recommendations(user_id):
-    interactions = UserInteraction.query.filter_by(user_id=user_id).order_by(UserInteraction.interaction_count.desc()).limit(5).all()
-    return [interaction.product_id for interaction in interactions]
+    table = UserInteraction.__table__
+    keys = sorted(batch)
+    with app.app_context():
+        upsert = upsert_interactions(table, db.engine.dialect.name)
+        if upsert is not None:
+            db.session.execute(upsert, [{"user_id": user_id, "product_id": product_id, "interaction_count": batch[(user_id, product_id)]}
+                                        for user_id, product_id in keys])
+            db.session.commit()
+            return
+
+        existing = set()
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start:start + chunk_size]
+            rows = db.session.query(UserInteraction.user_id, UserInteraction.product_id).filter(
+                tuple_(UserInteraction.user_id, UserInteraction.product_id).in_(chunk)).distinct()
+            existing.update((row.user_id, row.product_id) for row in rows)
+
+        updates = [{"u": user_id, "p": product_id, "views": batch[(user_id, product_id)]} for user_id, product_id in keys if (user_id, product_id) in existing]
+        inserts = [{"user_id": user_id, "product_id": product_id, "interaction_count": batch[(user_id, product_id)]} for user_id, product_id in keys if (user_id, product_id) not in existing]
+        if updates:
+            db.session.execute(
+                table.update()
+                .where(table.c.user_id == bindparam("u"), table.c.product_id == bindparam("p"))
+                .values(interaction_count=table.c.interaction_count + bindparam("views")),
+                updates)
+        if inserts:
+            db.session.execute(table.insert(), inserts)
+        db.session.commit()
+
+def record_interaction(user_id, product_id):
+    from factor_model import fold_in_interaction
+    from interaction_store import normalise_id
+
+    user_id, product_id = normalise_id(user_id), normalise_id(product_id)
+    store = get_interaction_store()
+    interaction_buffer.add(user_id, product_id)
+    trending.add(product_id)
+    store.increment(user_id, product_id)
+    recommendation_cache.invalidate_user(user_id)
+
+    # Fold the new view into the live collaborative model instead of waiting for the next training
+    model = get_factor_registry().model
+    if model is not None:
+        fold_in_interaction(model, store, user_id, product_id)
+
+# Most reviewed catalog products of the current content snapshot, used while few products have recent views
+_catalog_popular = (None, [])
+
+def catalog_popular_ids(content, n):
+    global _catalog_popular
+    cached_for, ids = _catalog_popular
+    if cached_for is not content.content_index or len(ids) < n:
+        from interaction_store import normalise_id
+        from ranking import top_k_indices
+
+        index = content.content_index
+        positions = top_k_indices(content.train_data['ReviewCount'].to_numpy(), max(n, 100), exclude=index.deleted if index.n_deleted else None)
+        ids = [normalise_id(product_id) for product_id in content.train_data['id'].to_numpy()[positions]]
+        _catalog_popular = (index, ids)
+    return ids[:n]
+
+def trending_product_ids(n, exclude=()):
+    """``[(product_id, score), ...]`` for the ``n`` products viewed most in the trending window, best first.
+
+    Topped up with the catalog's most reviewed products (score None) when too few have been viewed.
+    """
+    exclude = set(exclude)
+    ranking = [(product_id, score) for product_id, score in trending.top(n + len(exclude)) if product_id not in exclude][:n]
+    if len(ranking) < n:
+        counted = exclude.union(product_id for product_id, _ in ranking)
+        popular = catalog_popular_ids(get_content(), n + len(counted))
+        ranking += [(product_id, None) for product_id in popular if product_id not in counted][:n - len(ranking)]
+    return ranking
+
+def loaded_trending_product_ids(n, user_id=None):
+    """Ids of the ``n`` trending products, from what is already in memory, for fallbacks that must not block.
+
+    Unlike :func:`trending_product_ids` it never reads the database or loads the catalog: ``user_id``'s
+    viewed products are only excluded once the interaction store is loaded, and the top-up is the popular
+    list cached by the last request that needed one.
+    """
+    store = interaction_store
+    exclude = set(store.seen_products(user_id)) if user_id is not None and store is not None and store.loaded else set()
+    ranking = [product_id for product_id, _ in trending.top(n + len(exclude)) if product_id not in exclude][:n]
+    counted = exclude.union(ranking)
+    return ranking + [product_id for product_id in _catalog_popular[1] if product_id not in counted][:n - len(ranking)]
+
+def get_personal_recommendations(user_id, limit=5, fields=tuple(PRODUCT_COLUMNS)):
+    """The user's most viewed products, most viewed first, fetched with one joined query.
+
+    Served by the (user_id, interaction_count) index on UserInteraction.
+    """
+    return (Product.query
+            .join(UserInteraction, UserInteraction.product_id == Product.id)
+            .filter(UserInteraction.user_id == user_id)
+            .order_by(UserInteraction.interaction_count.desc(), UserInteraction.id)
+            .with_entities(*[PRODUCT_COLUMNS[field] for field in fields])
+            .limit(limit)
+            .all())
+
+def content_recommendations(prod, nbr=5):
+    """Content-based recommendations for the product named ``prod``, as JSON-ready rows, through the response cache."""
+    from util import content_based_recommendations
+
+    content = get_content()
+    key = recommendation_cache.make_key('recommendations', [content.content_index.fingerprint, content.content_index.revision], backend=content.similarity_backend.name, prod=(prod or '').lower(), nbr=nbr)
+    return recommendation_cache.get_or_compute(key, lambda: content_based_recommendations(
+        content.train_data, prod, top_n=nbr, backend=content.similarity_backend, name_index=content.name_index).to_dict(orient="records"))
+
+def collaborative_recommendation_ids(user_id):
+    """Collaborative recommendations (product ids) for ``user_id``; trending products for users the model does not know."""
+    from interaction_store import normalise_id
+    from util import collaborative_recommendations
+
+    # "42" from JSON and 42 are the same user, and must share one cache key
+    user_id = normalise_id(user_id)
+    model = get_factor_model()
+    if model is None or not model.has_user(user_id):
+        # Cold start: users the model does not know get what is trending
+        seen = get_interaction_store().seen_products(user_id)
+        return [product_id for product_id, _ in trending_product_ids(5, exclude=seen)]
+    key = recommendation_cache.make_key('collaborative_recommendations', model and model.version, user_id=user_id)
+    return recommendation_cache.get_or_compute(key, lambda: collaborative_recommendations(
+        user_id, model, interaction_store=get_interaction_store()), user_id=user_id)
+
+def hybrid_params(data):
+    """``(params, None)`` with the keyword arguments of :func:`hybrid_recommendation_rows`, or ``(None, message)``."""
+    config = current_app.config
+    user_id = data.get('user_id')
+    item_name = data.get('item_name')
+    normalization = data.get('normalization', config['HYBRID_NORMALIZATION'])
+
+    if not user_id or not item_name:
+        return None, "User ID and item name are required"
+    if normalization not in ('minmax', 'zscore', 'rrf'):
+        return None, "normalization must be one of minmax, zscore, rrf"
+    try:
+        content_weight = float(data.get('content_weight', config['HYBRID_CONTENT_WEIGHT']))
+        collaborative_weight = float(data.get('collaborative_weight', config['HYBRID_COLLABORATIVE_WEIGHT']))
+    except (TypeError, ValueError):
+        return None, "content_weight and collaborative_weight must be numbers"
+    return dict(user_id=user_id, item_name=item_name, nbr=data.get('nbr', 5), normalization=normalization,
+                content_weight=content_weight, collaborative_weight=collaborative_weight), None
+
+def hybrid_recommendation_rows(user_id, item_name, nbr=5, normalization='minmax', content_weight=0.5, collaborative_weight=0.5):
+    """Hybrid recommendations as JSON-ready rows, through the response cache."""
+    from interaction_store import normalise_id
+    from util import hybrid_recommendations
+
+    user_id = normalise_id(user_id)
+    content = get_content()
+    model = get_factor_model()
+    key = recommendation_cache.make_key('hybrid_recommendations', [content.content_index.fingerprint, content.content_index.revision, model and model.version],
+                                        backend=content.similarity_backend.name, user_id=user_id, item_name=item_name.lower(), nbr=nbr,
+                                        normalization=normalization, content_weight=content_weight, collaborative_weight=collaborative_weight)
+    return recommendation_cache.get_or_compute(key, lambda: hybrid_recommendations(
+        content.train_data, user_id, item_name, model, top_n=nbr, content_weight=content_weight, collaborative_weight=collaborative_weight,
+        backend=content.similarity_backend, name_index=content.name_index, interaction_store=get_interaction_store(),
+        normalization=normalization, candidates=current_app.config['HYBRID_CANDIDATES']).to_dict(orient="records"), user_id=user_id)
 
 # Routes
-@app.route('/users', methods=['POST'])
+@routes.route('/users', methods=['POST'])
 def add_user():
     data = request.get_json()
     new_user = Signup(username=data['fullName'], email=data['email'], password=data['password'])
@@ -69,14 +567,14 @@ def add_user():
     db.session.commit()
     return jsonify({"message": "User added successfully", "user": data}), 201
 
-@app.route('/viewProduct', methods=['POST'])
+@routes.route('/viewProduct', methods=['POST'])
 def view_product():
     data = request.get_json()
     record_interaction(data['user_id'],product_id=data['product_id'])
     
     return jsonify({"message": "Interaction added successfully"}), 201
 
-@app.route('/fetchUser', methods=['POST'])
+@routes.route('/fetchUser', methods=['POST'])
 def fetch_user():
     data = request.get_json()
     user = Signup.query.filter_by(email=data['email'], password=data['password']).first()
@@ -88,20 +586,10 @@ def fetch_user():
                         "role":role}), 200
     return jsonify({"message": "Invalid credentials"}), 401
 
-@app.route('/products', methods=['GET', 'POST'])
+@routes.route('/products', methods=['GET', 'POST'])
 def manage_products():
     if request.method == 'GET':
-        products = Product.query.all()
-        return jsonify([{
-            "id": product.id,
-            "Name": product.name,
-            "Quantity": product.quantity,
-            "Price": product.price,
-            "Img": product.img,
-            "Categoryid": product.category_id,
-            "Factory": product.factory,
-            "Description": product.description
-        } for product in products]), 200
+        return list_products(Product.query)
     elif request.method == 'POST':
         data = request.get_json()
         new_product = Product(
@@ -114,26 +602,20 @@ def manage_products():
             description=data.get('Description')
         )
         db.session.add(new_product)
+        db.session.flush()
+        db.session.add(ProductChange(product_id=new_product.id))
         db.session.commit()
+        refresh_content()
         return jsonify({"message": "Product added successfully"}), 201
 
-@app.route('/products/<int:prdID>', methods=['GET', 'PUT', 'DELETE'])
+@routes.route('/products/<int:prdID>', methods=['GET', 'PUT', 'DELETE'])
 def product_operations(prdID):
     product = Product.query.get(prdID)
     if not product:
         return jsonify({"message": "Product not found"}), 404
 
     if request.method == 'GET':
-        return jsonify({
-            "id": product.id,
-            "Name": product.name,
-            "Quantity": product.quantity,
-            "Price": product.price,
-            "Img": product.img,
-            "Categoryid": product.category_id,
-            "Factory": product.factory,
-            "Description": product.description
-        }), 200
+        return jsonify(product_to_dict(product)), 200
     elif request.method == 'PUT':
         data = request.get_json()
         product.name = data['Name']
@@ -143,14 +625,18 @@ def product_operations(prdID):
         product.category_id = data.get('Categoryid')
         product.factory = data.get('Factory')
         product.description = data.get('Description')
+        db.session.add(ProductChange(product_id=product.id))
         db.session.commit()
+        refresh_content()
         return jsonify({"message": "Product updated successfully"}), 200
     elif request.method == 'DELETE':
         db.session.delete(product)
+        db.session.add(ProductChange(product_id=prdID, deleted=True))
         db.session.commit()
+        refresh_content()
         return jsonify({"message": "Product deleted successfully"}), 200
 
-@app.route('/cart', methods=['POST', 'GET', 'DELETE'])
+@routes.route('/cart', methods=['POST', 'GET', 'DELETE'])
 def manage_cart():
     if request.method == 'POST':
         data = request.get_json()
@@ -160,106 +646,148 @@ def manage_cart():
         return jsonify({"message": "Product added to cart"}), 201
     elif request.method == 'GET':
         user_email = request.args.get('email')
-        cart_items = Cart.query.filter_by(user_email=user_email).all()
-        products = Product.query.filter(Product.id.in_([item.product_id for item in cart_items])).all()
-        return jsonify([{
-            "id": product.id,
-            "Name": product.name,
-            "Quantity": product.quantity,
-            "Price": product.price,
-            "Img": product.img,
-            "Categoryid": product.category_id,
-            "Factory": product.factory,
-            "Description": product.description
-        } for product in products]), 200
+        cart_products = Product.query.join(Cart, Cart.product_id == Product.id).filter(Cart.user_email == user_email).distinct()
+        return list_products(cart_products)
     elif request.method == 'DELETE':
         #data = request.get_json()
         Cart.query.filter_by(user_email=request.args.get('email'), product_id=request.args.get('product_id')).delete()
         db.session.commit()
         return jsonify({"message": "Product removed from cart"}), 200
 
-@app.route('/personal_recommendations', methods=['GET'])
+@routes.route('/personal_recommendations', methods=['GET'])
 def personal_recommendations():
     user_id = request.args.get('user_id')
 
     if not user_id:
         return jsonify({"message": "Please log in to view recommendations"}), 401
-    recommended_productids = get_personal_recommendations(user_id)
-    products = Product.query.filter(Product.id.in_(recommended_productids)).all()
-    return jsonify([{
-            "id": product.id,
-            "Name": product.name,
-            "Quantity": product.quantity,
-            "Price": product.price,
-            "Img": product.img,
-            "Categoryid": product.category_id,
-            "Factory": product.factory,
-            "Description": product.description
-        } for product in products]), 200
-
-@app.route("/recommendations", methods=['POST']) 
+    products = get_personal_recommendations(user_id)
+    return jsonify([product_to_dict(product) for product in products]), 200
+
+@routes.route("/recommendations", methods=['POST']) 
 def recommendations(): 
     data = request.get_json(); 
     prod = data.get('prod'); 
     nbr = data.get('nbr', 5)
-    content_based_rec = content_based_recommendations(train_data, prod, top_n=nbr) 
-    return jsonify(content_based_rec.to_dict(orient="records")), 200
+    content_based_rec = content_recommendations(prod, nbr)
+    with metrics.span('serialize'):
+        return jsonify(content_based_rec), 200
+
+@routes.route('/trending', methods=['GET'])
+def trending_products():
+    limit = request.args.get('limit', default=8, type=int)
+    limit = max(1, min(limit, current_app.config['PRODUCT_PAGE_MAX']))
+
+    from catalog_store import take_rows
+    from hybrid import product_index_for
+
+    # Not cached: the ranking changes with every view, and looking up `limit` rows is cheap
+    content = get_content()
+    ranking = trending_product_ids(limit)
+    positions = product_index_for(content.train_data, content.content_index).positions([product_id for product_id, _ in ranking])
+    found = positions >= 0
+    products = take_rows(content.train_data, positions[found], ['id', 'Name', 'ReviewCount', 'Factory', 'Img', 'Rating', 'Description'])
+    scores = [score for (_, score), in_catalog in zip(ranking, found) if in_catalog]
+    return jsonify([dict(product, trending_score=score) for product, score in zip(products.to_dict(orient="records"), scores)]), 200
+
+@routes.route('/trending/stats', methods=['GET'])
+def trending_stats():
+    return jsonify(trending.snapshot()), 200
+
+@routes.route('/products/resolve', methods=['GET'])
+def resolve_product_name():
+    query = request.args.get('q')
+    limit = request.args.get('limit', default=10, type=int)
+    if not query:
+        return jsonify({"message": "Query parameter 'q' is required"}), 400
+
+    from name_index import MATCH_KINDS
+
+    content = get_content()
+    matches = content.name_index.search(query, limit=limit)
+    return jsonify([{
+            "id": int(content.train_data['id'].iat[position]),
+            "Name": content.name_index.name(position),
+            "match": MATCH_KINDS[kind]
+        } for position, kind in matches]), 200
 
 # Collaborative Rcommendations
-@app.route('/collaborative_recommendations', methods=['POST'])
+@routes.route('/collaborative_recommendations', methods=['POST'])
 def collaborative_recommendations_route():
     data = request.get_json()
-    user_id = data.get('user_id')
-    recommendations = collaborative_recommendations(user_id,UserInteraction.query.all())
-    return jsonify(recommendations), 200
+    recommendations = collaborative_recommendation_ids(data.get('user_id'))
+    with metrics.span('serialize'):
+        return jsonify(recommendations), 200
 
 # Hybrid Recommendations
-@app.route("/hybrid_recommendations", methods=['POST'])
+@routes.route("/hybrid_recommendations", methods=['POST'])
 def hybrid_recommendations_api():
+    params, error = hybrid_params(request.get_json())
+    if error:
+        return jsonify({"message": error}), 400
+    hybrid_rec = hybrid_recommendation_rows(**params)
+    with metrics.span('serialize'):
+        return jsonify(hybrid_rec), 200
+
+@routes.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(recommendation_cache.snapshot()), 200
+
+@routes.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4'), 200
+
+# Batch Recommendations
+@routes.route('/batch_recommendations', methods=['POST'])
+def batch_recommendations():
     data = request.get_json()
-    user_id = data.get('user_id')
-    item_name = data.get('item_name')
+    user_ids = data.get('user_ids', [])
+    item_names = data.get('item_names', [])
     nbr = data.get('nbr', 5)
 
-    if not user_id or not item_name:
-        return jsonify({"message": "User ID and item name are required"}), 400
+    if len(user_ids) + len(item_names) > current_app.config['MAX_BATCH_SIZE']:
+        return jsonify({"message": f"At most {current_app.config['MAX_BATCH_SIZE']} user ids and item names per request"}), 413
 
-    try:
-        interaction_data = UserInteraction.query.all()
-        interaction_df = pd.DataFrame([(i.user_id, i.product_id, i.interaction_count) for i in interaction_data], columns=['user_id', 'product_id', 'interaction_count'])
-        user_item_matrix = interaction_df.pivot_table(index='user_id', columns='product_id', values='interaction_count', fill_value=0)
+    from util import batch_collaborative_recommendations, batch_content_based_recommendations
 
-        hybrid_rec = hybrid_recommendations(train_data, user_id, item_name, user_item_matrix, top_n=nbr)
-        return jsonify(hybrid_rec.to_dict(orient="records")), 200
-    except Exception as e:
-        return jsonify({"message": str(e)}), 500
+    model = get_factor_model()
+    store = get_interaction_store()
+    content = get_content()
+
+    def user_results():
+        if model is None:
+            return ({"user_id": user_id, "recommendations": []} for user_id in user_ids)
+        return batch_collaborative_recommendations(user_ids, model, top_n=nbr, interaction_store=store)
+
+    def item_results():
+        return batch_content_based_recommendations(content.train_data, item_names, content.content_index, content.name_index, top_n=nbr)
+
+    if request.args.get('format') == 'ndjson':
+        def generate():
+            for result in user_results():
+                yield json.dumps(result) + "\n"
+            for result in item_results():
+                yield json.dumps(result) + "\n"
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson'), 200
+
+    return jsonify({"users": list(user_results()), "items": list(item_results())}), 200
 
 # Filter by price 
-@app.route('/products/filterByPrice', methods=['GET'])
+@routes.route('/products/filterByPrice', methods=['GET'])
 def filter_by_price():
     try:
         min_price = request.args.get('min_price', default=0, type=float)
         max_price = request.args.get('max_price', default=float('inf'), type=float)
 
-        products = Product.query.filter(Product.price >= min_price, Product.price <= max_price).all()
-
-        return jsonify([{
-            "id": product.id,
-            "Name": product.name,
-            "Quantity": product.quantity,
-            "Price": product.price,
-            "Img": product.img,
-            "Categoryid": product.category_id,
-            "Factory": product.factory,
-            "Description": product.description
-        } for product in products]), 200
+        return list_products(Product.query.filter(Product.price >= min_price, Product.price <= max_price),
+                             order_by=(Product.price, Product.id))
     except Exception as e:
         return jsonify({"message": f"Error: {str(e)}"}), 500
 
 
+app = create_app()
+
 if __name__ == "__main__":
     with app.app_context():
-        db.create_all()
         print("Database initialized")
         CORS(app)
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,231 @@
+"""ASGI entry point: the recommendation routes as async endpoints over the same app.
+
+    uvicorn asgi:app --host 127.0.0.1 --port 5000
+
+/recommendations, /collaborative_recommendations and /hybrid_recommendations are
+served by the event loop, which hands their scoring to a bounded pool of
+ASYNC_SCORING_THREADS threads. The pool scores with the models, indexes and
+response cache that app.py already loads: it calls the same helpers as the
+Flask routes do. NumPy and SciPy release the GIL in the heavy kernels, so the
+scoring threads overlap. Every other route goes to the Flask app unchanged.
+
+Each route admits at most ASYNC_CONCURRENCY requests to the pool at once. At most
+ASYNC_QUEUE more wait for a slot. Further requests get 503 with Retry-After right
+away instead of joining an unbounded queue. Both limits can be set per route,
+e.g. ASYNC_CONCURRENCY_HYBRID_RECOMMENDATIONS=2.
+
+A request that is not answered within ASYNC_DEADLINE seconds, counting the wait,
+degrades instead of failing where a cheaper answer exists:
+
+- hybrid recommendations fall back to the content-based ones for the item
+- collaborative recommendations fall back to the trending products
+
+These responses carry an ``X-Degraded`` header. A content-based request that
+times out gets a 504. A scoring job that overruns keeps its slot until it
+finishes, so overload turns into rejections instead of piling up in the pool.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+
+import app as flask_module
+import metrics
+
+flask_app = flask_module.app
+
+SCORING_THREADS = int(os.environ.get("ASYNC_SCORING_THREADS", os.cpu_count() or 4))
+# Threads serving the routes handed to the Flask app
+WSGI_THREADS = int(os.environ.get("ASYNC_WSGI_THREADS", 10))
+
+REJECTED = metrics.register(metrics.Counter(
+    "recommender_async_rejected_total", "Requests turned away with 503 because the route's queue was full.", ("route",)))
+DEGRADED = metrics.register(metrics.Counter(
+    "recommender_async_degraded_total", "Requests that missed their deadline, by the fallback they got.", ("route", "fallback")))
+
+
+def _route_setting(name, route, default, cast=int):
+    """ASYNC_<NAME>_<ROUTE> if set, else ASYNC_<NAME>, else ``default``."""
+    value = os.environ.get(f"ASYNC_{name}_{route.upper()}", os.environ.get(f"ASYNC_{name}"))
+    return cast(value) if value is not None else default
+
+
+class Overloaded(Exception):
+    """The route has no free slot and its queue is full."""
+
+
+class RouteLimiter:
+    """At most ``concurrency`` requests of one route scoring at once and at most ``max_queue`` waiting."""
+
+    def __init__(self, route, concurrency, max_queue, deadline):
+        self.route = route
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.deadline = deadline
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.waiting = 0
+        self.running = 0
+
+    async def acquire(self, timeout):
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            raise Overloaded(self.route)
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), max(timeout, 0))
+        finally:
+            self.waiting -= 1
+        self.running += 1
+
+    def release(self):
+        self.running -= 1
+        self._semaphore.release()
+
+
+LIMITERS = {
+    route: RouteLimiter(route,
+                        _route_setting("CONCURRENCY", route, SCORING_THREADS),
+                        _route_setting("QUEUE", route, 2 * SCORING_THREADS),
+                        _route_setting("DEADLINE", route, 2.0, float))
+    for route in ("recommendations", "collaborative_recommendations", "hybrid_recommendations")
+}
+
+executor = ThreadPoolExecutor(max_workers=SCORING_THREADS, thread_name_prefix="scoring")
+
+
+def _in_app_context(function, *args, **kwargs):
+    with flask_app.app_context():
+        return function(*args, **kwargs)
+
+
+async def score(route, deadline, function, *args, **kwargs):
+    """Run ``function`` on the scoring pool under ``route``'s limits; ``deadline`` is in loop time.
+
+    Raises :class:`Overloaded` when the route's queue is full and ``asyncio.TimeoutError``
+    when the deadline passes first.
+    """
+    limiter = LIMITERS[route]
+    loop = asyncio.get_running_loop()
+    await limiter.acquire(deadline - loop.time())
+    future = loop.run_in_executor(executor, partial(_in_app_context, function, *args, **kwargs))
+
+    def finished(future):
+        # The slot is freed when the work ends, not when the request stops waiting for it
+        limiter.release()
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Scoring for {route} failed: {future.exception()!r}")
+
+    future.add_done_callback(finished)
+    return await asyncio.wait_for(asyncio.shield(future), max(deadline - loop.time(), 0))
+
+
+def json_response(body, status=200, headers=None):
+    # Flask's JSON provider, so the body matches what the Flask routes return (NaN included)
+    return Response(flask_app.json.dumps(body), status_code=status, headers=headers, media_type="application/json")
+
+
+def message(text, status, headers=None):
+    return json_response({"message": text}, status, headers)
+
+
+def overloaded(route):
+    REJECTED.inc(route=f"/{route}")
+    return message("Too many requests in progress, try again shortly", 503, {"Retry-After": "1"})
+
+
+def endpoint(route):
+    """Turn ``handler(data, deadline)`` into a Starlette endpoint counted in /metrics like the Flask routes."""
+    def decorate(handler):
+        async def run(request):
+            started = time.perf_counter()
+            try:
+                data = await request.json()
+            except ValueError:
+                data = None
+            if not isinstance(data, dict):
+                response = message("Request body must be a JSON object", 400)
+            else:
+                deadline = asyncio.get_running_loop().time() + LIMITERS[route].deadline
+                try:
+                    response = await handler(data, deadline)
+                except Overloaded:
+                    response = overloaded(route)
+                except Exception as e:
+                    metrics.ERRORS.inc(route=f"/{route}", exception=type(e).__name__)
+                    print(f"Unhandled exception in /{route}: {e!r}")
+                    response = message("Internal server error", 500)
+            seconds = time.perf_counter() - started
+            metrics.REQUESTS.inc(route=f"/{route}", method="POST", status=response.status_code)
+            metrics.REQUEST_SECONDS.observe(seconds, route=f"/{route}")
+            response.headers["Server-Timing"] = metrics.server_timing({"total": seconds})
+            return response
+        return Route(f"/{route}", run, methods=["POST"])
+    return decorate
+
+
+@endpoint("recommendations")
+async def recommendations(data, deadline):
+    try:
+        rows = await score("recommendations", deadline, flask_module.content_recommendations, data.get('prod'), data.get('nbr', 5))
+    except asyncio.TimeoutError:
+        return message("Recommendations took too long", 504)
+    return json_response(rows)
+
+
+@endpoint("collaborative_recommendations")
+async def collaborative_recommendations(data, deadline):
+    user_id = data.get('user_id')
+    try:
+        ids = await score("collaborative_recommendations", deadline, flask_module.collaborative_recommendation_ids, user_id)
+    except asyncio.TimeoutError:
+        DEGRADED.inc(route="/collaborative_recommendations", fallback="trending")
+        # Only reads state already in memory (no database or catalog load), so it can run on the event loop
+        ids = flask_module.loaded_trending_product_ids(5, user_id)
+        return json_response(ids, headers={"X-Degraded": "trending"})
+    return json_response(ids)
+
+
+@endpoint("hybrid_recommendations")
+async def hybrid_recommendations(data, deadline):
+    with flask_app.app_context():
+        params, error = flask_module.hybrid_params(data)
+    if error:
+        return message(error, 400)
+    try:
+        rows = await score("hybrid_recommendations", deadline, flask_module.hybrid_recommendation_rows, **params)
+    except asyncio.TimeoutError:
+        DEGRADED.inc(route="/hybrid_recommendations", fallback="content")
+        # Content-only results under the content route's limits, with a deadline of their own
+        fallback_deadline = asyncio.get_running_loop().time() + LIMITERS["recommendations"].deadline
+        try:
+            rows = await score("recommendations", fallback_deadline, flask_module.content_recommendations, params['item_name'], params['nbr'])
+        except asyncio.TimeoutError:
+            return message("Recommendations took too long", 504)
+        return json_response(rows, headers={"X-Degraded": "content"})
+    return json_response(rows)
+
+
+@metrics.register_collector
+def async_metrics():
+    for route, limiter in LIMITERS.items():
+        yield "recommender_async_running", "Requests of the route scoring on the pool.", limiter.running, {"route": f"/{route}"}
+        yield "recommender_async_waiting", "Requests of the route waiting for a scoring slot.", limiter.waiting, {"route": f"/{route}"}
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+app = Starlette(
+    routes=[recommendations, collaborative_recommendations, hybrid_recommendations,
+            Mount("/", app=WSGIMiddleware(flask_app, workers=WSGI_THREADS))],
+    lifespan=lifespan,
+)
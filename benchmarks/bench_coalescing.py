@@ -0,0 +1,116 @@
+"""Concurrent-burst benchmark of request coalescing in front of the content recommender.
+
+Each burst releases ``--burst`` threads at once, asking for the recommendations of
+``--distinct`` products nobody has asked for yet. That is what a product going viral
+looks like: many identical cache misses together. The callers go through
+RecommendationCache.get_or_compute exactly as the /recommendations route does, once
+with coalescing off and once with it on.
+
+Per mode: p50/p95/p99 latency of the calls, throughput, and how many times
+content_based_recommendations actually ran (``computations``); written as JSON.
+
+    python benchmarks/bench_coalescing.py --items 50000 --burst 64 --bursts 20 --output coalescing.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from benchmarks.report import compare, print_comparison, summarize, write_results  # noqa: E402
+
+MODES = ("off", "on")
+
+
+def run_bursts(env, coalesce, burst, bursts, distinct, top_n, seed):
+    """Latencies, wall-clock seconds and the number of computations of ``bursts`` bursts."""
+    from cache import RecommendationCache
+    from util import content_based_recommendations
+
+    cache = RecommendationCache(max_entries=100000, ttl=3600, coalesce=coalesce)
+    train_data = env["train_data"]
+    # Every burst asks for products no earlier burst has asked for, so each one misses the fresh cache
+    names = random.Random(seed).sample(list(train_data['Name']), bursts * distinct)
+    computations = [0]
+    lock = threading.Lock()
+
+    def compute(prod):
+        with lock:
+            computations[0] += 1
+        return content_based_recommendations(train_data, prod, top_n=top_n, backend=env["backend"],
+                                             name_index=env["name_index"]).to_dict(orient="records")
+
+    latencies = []
+    seconds = 0.0
+    for n in range(bursts):
+        products = names[n * distinct:(n + 1) * distinct]
+        barrier = threading.Barrier(burst + 1)
+        burst_latencies = [None] * burst
+
+        def caller(i):
+            prod = products[i % distinct]
+            key = cache.make_key('recommendations', 0, prod=prod.lower(), nbr=top_n)
+            barrier.wait()
+            started = time.perf_counter()
+            cache.get_or_compute(key, lambda: compute(prod))
+            burst_latencies[i] = time.perf_counter() - started
+
+        threads = [threading.Thread(target=caller, args=(i,)) for i in range(burst)]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        seconds += time.perf_counter() - started
+        latencies += burst_latencies
+    return latencies, seconds, computations[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure request coalescing under bursts of identical recommendation requests.")
+    parser.add_argument("--items", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--burst", type=int, default=32, help="concurrent callers per burst")
+    parser.add_argument("--bursts", type=int, default=20)
+    parser.add_argument("--distinct", type=int, default=1, help="different products asked for within a burst")
+    parser.add_argument("--top-n", type=int, default=10)
+    parser.add_argument("--backend", default="exact", help="similarity backend (exact or ivf)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="a previous JSON result file to compare against")
+    args = parser.parse_args()
+
+    from benchmarks.bench_recommenders import _setup
+    from benchmarks.synthetic import make_workdir
+
+    parameters = {key: getattr(args, key) for key in ("items", "burst", "bursts", "distinct", "top_n", "backend", "seed")}
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        _, interactions, _ = make_workdir(workdir, args.items, args.users, 0.001, args.seed)
+        interactions_path = os.path.join(workdir, "interactions.csv")
+        interactions.to_csv(interactions_path, index=False)
+        env = _setup(workdir, interactions_path, args.backend)
+
+        # One untimed call so lazy imports and first-touch page faults are not measured
+        run_bursts(env, False, 1, 1, 1, args.top_n, args.seed + 1)
+        for mode in MODES:
+            latencies, seconds, computations = run_bursts(env, mode == "on", args.burst, args.bursts, args.distinct, args.top_n, args.seed)
+            results[mode] = dict(summarize(latencies, seconds), computations=computations)
+            print(json.dumps({mode: results[mode]}), file=sys.stderr)
+
+    document = write_results(args.output, "coalescing", parameters, results) if args.output else {"parameters": parameters, "results": results}
+    print(json.dumps(document, indent=2))
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(compare(document, json.load(f)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Concurrent /viewProduct and /cart writers against a local database.
+
+Each worker process imports the app (as a gunicorn worker would) and issues a mix
+of product views and cart additions through the Flask test client. Reports total
+throughput and how many requests failed on database locks.
+
+    python benchmarks/bench_concurrent_writes.py --workers 8 --requests 500
+    python benchmarks/bench_concurrent_writes.py --database-url mysql+pymysql://user:pw@localhost/echomart
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+
+def _import_app(workdir, env):
+    os.chdir(workdir)
+    os.environ.update(env)
+    sys.path.insert(0, REPO)
+    import app as app_module
+    return app_module
+
+
+def _init(workdir, env):
+    app_module = _import_app(workdir, env)
+    from database import db, ensure_indexes
+
+    with app_module.app.app_context():
+        db.create_all()
+        ensure_indexes()
+
+
+def _writer(workdir, env, worker_id, n_requests, n_users, n_items, view_share):
+    from sqlalchemy.exc import OperationalError
+
+    app_module = _import_app(workdir, env)
+    app_module.app.config['PROPAGATE_EXCEPTIONS'] = True
+    client = app_module.app.test_client()
+    rng = random.Random(worker_id)
+    stats = {"ok": 0, "lock_errors": 0, "other_errors": 0}
+
+    for _ in range(n_requests):
+        user_id = rng.randint(1, n_users)
+        product_id = rng.randint(1, n_items)
+        try:
+            if rng.random() < view_share:
+                response = client.post('/viewProduct', json={"user_id": user_id, "product_id": product_id})
+            else:
+                response = client.post('/cart', json={"email": f"user{user_id}@example.com", "product": {"id": product_id}})
+            stats["ok" if response.status_code < 400 else "other_errors"] += 1
+        except OperationalError as e:
+            stats["lock_errors" if "locked" in str(e) or "busy" in str(e) else "other_errors"] += 1
+        except Exception:
+            stats["other_errors"] += 1
+
+    app_module.interaction_buffer.close()
+    stats["flush_errors"] = app_module.interaction_buffer.stats["flush_errors"]
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent write throughput and lock errors for /viewProduct and /cart.")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=500, help="requests per worker")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--items", type=int, default=2000)
+    parser.add_argument("--view-share", type=float, default=0.8, help="fraction of requests that are /viewProduct")
+    parser.add_argument("--flush-interval", default="0", help="INTERACTION_FLUSH_INTERVAL; 0 writes every view through")
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file in a temp directory")
+    args = parser.parse_args()
+
+    from benchmarks.synthetic import make_catalog
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.makedirs(os.path.join(workdir, "models"))
+        make_catalog(args.items).to_csv(os.path.join(workdir, "models", "final_data.csv"), index=False)
+        env = {
+            "DATABASE_URL": args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.sqlite')}",
+            "INTERACTION_FLUSH_INTERVAL": str(args.flush_interval),
+        }
+
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(1) as pool:
+            pool.apply(_init, (workdir, env))
+
+        with ctx.Pool(args.workers) as pool:
+            started = time.perf_counter()
+            results = pool.starmap(_writer, [
+                (workdir, env, worker_id, args.requests, args.users, args.items, args.view_share)
+                for worker_id in range(args.workers)])
+            elapsed = time.perf_counter() - started
+
+    totals = {key: sum(result[key] for result in results) for key in results[0]}
+    total_requests = args.workers * args.requests
+    print(json.dumps(dict(
+        totals,
+        workers=args.workers,
+        requests=total_requests,
+        seconds=round(elapsed, 3),
+        throughput_rps=round(total_requests / elapsed, 1),
+        database=env["DATABASE_URL"].split("://")[0],
+        flush_interval=args.flush_interval,
+    ), indent=2))
+
+
+if __name__ == "__main__":
+    main()
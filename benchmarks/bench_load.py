@@ -0,0 +1,192 @@
+"""Concurrent HTTP load test of the recommendation routes on synthetic data.
+
+Serves the app from a synthetic working directory (gunicorn with gunicorn.conf.py
+by default, or the single-process Werkzeug server) and drives it with
+``--concurrency`` client threads for ``--duration`` seconds. The request mix is
+/recommendations, /collaborative_recommendations and /hybrid_recommendations, in the
+``--mix`` proportions.
+
+Per route and overall: p50/p95/p99 latency, throughput and errors; plus the peak
+RSS of the server processes (sampled every 100 ms), all written as JSON.
+
+    python benchmarks/bench_load.py --items 50000 --users 20000 --concurrency 32 --output before.json
+    python benchmarks/bench_load.py --items 50000 --users 20000 --concurrency 32 --compare before.json
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+import psutil
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from benchmarks.report import compare, print_comparison, summarize, write_results  # noqa: E402
+
+ROUTES = ("recommendations", "collaborative_recommendations", "hybrid_recommendations")
+
+WERKZEUG_SERVER = ("import sys; from werkzeug.serving import run_simple; from app import app; "
+                   "run_simple('127.0.0.1', int(sys.argv[1]), app, threaded=True)")
+
+
+def _post(url, payload, timeout=60):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"), headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.read()
+
+
+def start_server(workdir, server, port, workers, env):
+    env = dict(os.environ, **env, PYTHONPATH=REPO + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    if server == "gunicorn":
+        env.update(GUNICORN_WORKERS=str(workers), GUNICORN_BIND=f"127.0.0.1:{port}")
+        command = [sys.executable, "-m", "gunicorn", "-c", os.path.join(REPO, "gunicorn.conf.py"), "app:app"]
+    else:
+        command = [sys.executable, "-c", WERKZEUG_SERVER, str(port)]
+    process = subprocess.Popen(command, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    started = time.perf_counter()
+    while True:
+        if process.poll() is not None:
+            raise SystemExit(f"{server} exited with status {process.returncode}")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/cache/stats", timeout=5).read()
+            return process
+        except OSError:
+            pass
+        if time.perf_counter() - started > 300:
+            process.terminate()
+            raise SystemExit(f"{server} did not become ready within 300s")
+        time.sleep(0.2)
+
+
+class MemorySampler(threading.Thread):
+    """Samples the summed RSS of a process and its children until stopped; keeps the peak."""
+
+    def __init__(self, pid, interval=0.1):
+        super().__init__(daemon=True)
+        self.process = psutil.Process(pid)
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.is_set():
+            total = 0
+            for process in [self.process] + self.process.children(recursive=True):
+                try:
+                    total += process.memory_info().rss
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    continue
+            self.peak_mb = max(self.peak_mb, total / 2 ** 20)
+            self._done.wait(self.interval)
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        return round(self.peak_mb, 1)
+
+
+def run_load(base, names, user_ids, mix, concurrency, duration, top_n, seed):
+    """``{route: (latencies, errors)}`` from ``concurrency`` threads issuing requests for ``duration`` seconds."""
+    latencies = {route: [] for route in ROUTES}
+    errors = {route: 0 for route in ROUTES}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(n):
+        rng = random.Random(seed + n)
+        local_latencies = {route: [] for route in ROUTES}
+        local_errors = {route: 0 for route in ROUTES}
+        while time.perf_counter() < deadline:
+            route = rng.choices(ROUTES, weights=mix)[0]
+            if route == "recommendations":
+                payload = {"prod": rng.choice(names), "nbr": top_n}
+            elif route == "collaborative_recommendations":
+                payload = {"user_id": rng.choice(user_ids)}
+            else:
+                payload = {"user_id": rng.choice(user_ids), "item_name": rng.choice(names), "nbr": top_n}
+            started = time.perf_counter()
+            try:
+                _post(f"{base}/{route}", payload)
+                local_latencies[route].append(time.perf_counter() - started)
+            except OSError:
+                local_errors[route] += 1
+        with lock:
+            for route in ROUTES:
+                latencies[route].extend(local_latencies[route])
+                errors[route] += local_errors[route]
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {route: (latencies[route], errors[route]) for route in ROUTES}, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the recommendation routes with concurrent clients.")
+    parser.add_argument("--items", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--density", type=float, default=0.001, help="share of the user x item matrix with a view")
+    parser.add_argument("--server", choices=("gunicorn", "werkzeug"), default="gunicorn")
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn workers")
+    parser.add_argument("--concurrency", type=int, default=16, help="client threads")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of load")
+    parser.add_argument("--warmup", type=float, default=5.0, help="seconds of untimed load first")
+    parser.add_argument("--mix", type=float, nargs=3, default=[0.5, 0.25, 0.25], metavar=("CONTENT", "COLLABORATIVE", "HYBRID"))
+    parser.add_argument("--top-n", type=int, default=10)
+    parser.add_argument("--cache", action="store_true", help="keep the response cache on (default: every request is computed)")
+    parser.add_argument("--port", type=int, default=5056)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="a previous JSON result file to compare against")
+    args = parser.parse_args()
+
+    from benchmarks.synthetic import make_workdir
+
+    parameters = {key: getattr(args, key) for key in
+                  ("items", "users", "density", "server", "workers", "concurrency", "duration", "mix", "top_n", "cache", "seed")}
+    with tempfile.TemporaryDirectory() as workdir:
+        catalog, interactions, database_url = make_workdir(workdir, args.items, args.users, args.density, args.seed)
+        parameters["interactions"] = len(interactions)
+        names = catalog["Name"].tolist()
+        user_ids = sorted(set(interactions["user_id"].tolist()))
+
+        env = {"DATABASE_URL": database_url, "WARM_UP": "1"}
+        if not args.cache:
+            env.update(CACHE_MAX_ENTRIES="1", CACHE_TTL="0")
+        server = start_server(workdir, args.server, args.port, args.workers, env)
+        sampler = MemorySampler(server.pid)
+        sampler.start()
+        base = f"http://127.0.0.1:{args.port}"
+        try:
+            if args.warmup > 0:
+                run_load(base, names, user_ids, args.mix, args.concurrency, args.warmup, args.top_n, args.seed + 10 ** 6)
+            by_route, seconds = run_load(base, names, user_ids, args.mix, args.concurrency, args.duration, args.top_n, args.seed)
+        finally:
+            peak_rss = sampler.stop()
+            server.terminate()
+            server.wait(timeout=30)
+
+    results = {route: summarize(latencies, seconds, errors) for route, (latencies, errors) in by_route.items()}
+    results["all"] = dict(summarize([latency for latencies, _ in by_route.values() for latency in latencies], seconds,
+                                    sum(errors for _, errors in by_route.values())), peak_rss_mb=peak_rss)
+
+    document = write_results(args.output, "load", parameters, results) if args.output else {"parameters": parameters, "results": results}
+    print(json.dumps(document, indent=2))
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(compare(document, json.load(f)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Per-request query count and latency of /personal_recommendations and the cart listing.
+
+Seeds a throwaway SQLite database through the app's own models (10^6 interaction
+rows by default) and compares the old two-round-trip fetch, without the indexes,
+against what the app runs now: ``app.get_personal_recommendations`` and the
+``GET /cart`` route (its timings include building the JSON response), after
+``database.ensure_indexes`` has built the indexes the models declare.
+
+    python benchmarks/bench_personal_queries.py --interactions 1000000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from sqlalchemy import event
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from database import Cart, Product, UserInteraction, db, ensure_indexes  # noqa: E402
+
+
+def seed(n_products, n_users, n_interactions, n_cart_rows, seed=0):
+    rng = random.Random(seed)
+    db.create_all()
+    db.session.execute(Product.__table__.insert(), [
+        {"id": i, "name": f"Product {i}", "quantity": 10, "price": rng.uniform(1, 500),
+         "img": f"https://example.com/{i}.jpg", "category_id": i % 50, "factory": f"Factory {i % 200}",
+         "description": "Lorem ipsum " * 8}
+        for i in range(1, n_products + 1)])
+    pairs = set()
+    while len(pairs) < n_interactions:
+        pairs.add((rng.randint(1, n_users), rng.randint(1, n_products)))
+    pairs = list(pairs)
+    for start in range(0, len(pairs), 50000):
+        db.session.execute(UserInteraction.__table__.insert(), [
+            {"user_id": u, "product_id": p, "interaction_count": rng.randint(1, 20)}
+            for u, p in pairs[start:start + 50000]])
+    db.session.execute(Cart.__table__.insert(), [
+        {"user_email": f"user{rng.randint(1, n_users)}@example.com", "product_id": rng.randint(1, n_products)}
+        for _ in range(n_cart_rows)])
+    db.session.commit()
+
+
+def drop_indexes():
+    """Drop the indexes declared on UserInteraction and Cart, as in a database created before them."""
+    for table in (UserInteraction.__table__, Cart.__table__):
+        for index in table.indexes:
+            index.drop(db.engine)
+
+
+# The fetches as they were before the indexes and the joined queries
+
+def personal_two_queries(user_id):
+    interactions = (UserInteraction.query.filter_by(user_id=user_id)
+                    .order_by(UserInteraction.interaction_count.desc()).limit(5).all())
+    ids = [i.product_id for i in interactions]
+    return Product.query.filter(Product.id.in_(ids)).all()
+
+
+def cart_two_queries(user_id):
+    items = Cart.query.filter_by(user_email=f"user{user_id}@example.com").all()
+    return Product.query.filter(Product.id.in_([item.product_id for item in items])).all()
+
+
+# What the app runs now
+
+def personal_app(user_id):
+    from app import get_personal_recommendations
+
+    return get_personal_recommendations(user_id)
+
+
+def cart_app(client):
+    def fetch(user_id):
+        response = client.get("/cart", query_string={"email": f"user{user_id}@example.com"})
+        assert response.status_code == 200, response.status_code
+        return response.get_json()
+    return fetch
+
+
+def measure(fn, user_ids):
+    queries = []
+
+    def count_query(*args):
+        queries.append(1)
+
+    event.listen(db.engine, "before_cursor_execute", count_query)
+    timings = []
+    for user_id in user_ids:
+        start = time.perf_counter()
+        fn(user_id)
+        timings.append((time.perf_counter() - start) * 1000)
+        db.session.expunge_all()
+    event.remove(db.engine, "before_cursor_execute", count_query)
+    timings.sort()
+    return {
+        "queries_per_request": len(queries) / len(user_ids),
+        "p50_ms": statistics.median(timings),
+        "p95_ms": timings[int(len(timings) * 0.95) - 1],
+        "mean_ms": statistics.fmean(timings),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--interactions", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=50_000)
+    parser.add_argument("--products", type=int, default=20_000)
+    parser.add_argument("--cart-rows", type=int, default=100_000)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Set before app.py is imported, since importing it creates the app (and migrates its database)
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.sqlite')}"
+        from app import app
+
+        with app.app_context():
+            print(f"Seeding {args.interactions} interactions...")
+            seed(args.products, args.users, args.interactions, args.cart_rows)
+            drop_indexes()
+            user_ids = random.Random(1).sample(range(1, args.users + 1), min(args.requests, args.users))
+
+            results = {
+                "personal_two_queries_no_index": measure(personal_two_queries, user_ids),
+                "cart_two_queries_no_index": measure(cart_two_queries, user_ids),
+            }
+            ensure_indexes()
+            results["personal_app_indexed"] = measure(personal_app, user_ids)
+            results["cart_app_indexed"] = measure(cart_app(app.test_client()), user_ids)
+            db.engine.dispose()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Microbenchmarks of the recommenders in util.py on synthetic data.
+
+Generates a catalog of ``--items`` products and ``--users`` users whose views cover
+``--density`` of the user x item matrix, then times, each in a fresh process so the
+peak RSS belongs to that benchmark alone:
+
+- ``content``: content_based_recommendations
+- ``svd``: perform_svd (factorizing the interaction store)
+- ``collaborative``: recommend_products
+- ``hybrid``: hybrid_recommendations
+
+Results (p50/p95/p99 latency, throughput, peak RSS) are printed and written as JSON.
+
+    python benchmarks/bench_recommenders.py --items 50000 --users 20000 --density 0.0005 --output before.json
+    python benchmarks/bench_recommenders.py --items 50000 --users 20000 --density 0.0005 --compare before.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from benchmarks.report import compare, peak_rss_mb, print_comparison, summarize, write_results  # noqa: E402
+
+BENCHMARKS = ("content", "svd", "collaborative", "hybrid")
+
+
+def _setup(workdir, interactions_path, backend_name):
+    from catalog_store import load_catalog
+    from content_index import ContentIndex
+    from interaction_store import InteractionStore
+    from name_index import NameIndex
+    from similarity import make_backend
+
+    import pandas as pd
+
+    train_data = load_catalog(os.path.join(workdir, "models", "final_data.csv"), os.path.join(workdir, "models", "catalog"))
+    content_index = ContentIndex.build(train_data['Tags'])
+    interactions = pd.read_csv(interactions_path)
+    store = InteractionStore.from_rows(interactions.itertuples(index=False, name=None))
+    return dict(train_data=train_data, content_index=content_index, name_index=NameIndex(train_data['Name']),
+                backend=make_backend(backend_name, content_index), store=store)
+
+
+def _run(name, workdir, interactions_path, backend_name, calls, top_n, seed):
+    """Run one benchmark in this (fresh) process; returns its summary."""
+    sys.path.insert(0, REPO)
+    from util import content_based_recommendations, hybrid_recommendations, perform_svd, recommend_products
+
+    started = time.perf_counter()
+    env = _setup(workdir, interactions_path, backend_name)
+    setup_seconds = time.perf_counter() - started
+    train_data, store = env["train_data"], env["store"]
+
+    rng = random.Random(seed)
+    names = list(train_data['Name'])
+    user_ids = list(store.user_ids)
+    model = perform_svd(store) if name in ("collaborative", "hybrid") else None
+
+    if name == "content":
+        def call():
+            content_based_recommendations(train_data, rng.choice(names), top_n=top_n, backend=env["backend"], name_index=env["name_index"])
+    elif name == "svd":
+        calls = max(1, calls // 100)
+
+        def call():
+            perform_svd(store)
+    elif name == "collaborative":
+        def call():
+            user_id = rng.choice(user_ids)
+            recommend_products(user_id, model, top_n=top_n, seen=store.seen_products(user_id))
+    else:
+        def call():
+            hybrid_recommendations(train_data, rng.choice(user_ids), rng.choice(names), model, top_n=top_n,
+                                   backend=env["backend"], name_index=env["name_index"], interaction_store=store)
+
+    # One untimed call so lazy imports and first-touch page faults are not measured
+    call()
+    latencies = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - started)
+    return dict(summarize(latencies), setup_seconds=round(setup_seconds, 2), peak_rss_mb=peak_rss_mb())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark the recommenders on a synthetic catalog and interaction log.")
+    parser.add_argument("--items", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--density", type=float, default=0.001, help="share of the user x item matrix with a view")
+    parser.add_argument("--calls", type=int, default=500, help="timed calls per benchmark (svd: calls / 100)")
+    parser.add_argument("--top-n", type=int, default=10)
+    parser.add_argument("--backend", default="exact", help="similarity backend (exact or ivf)")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="a previous JSON result file to compare against")
+    args = parser.parse_args()
+
+    from benchmarks.synthetic import make_workdir
+
+    parameters = {key: getattr(args, key) for key in ("items", "users", "density", "calls", "top_n", "backend", "seed")}
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        _, interactions, _ = make_workdir(workdir, args.items, args.users, args.density, args.seed)
+        interactions_path = os.path.join(workdir, "interactions.csv")
+        interactions.to_csv(interactions_path, index=False)
+        parameters["interactions"] = len(interactions)
+
+        context = multiprocessing.get_context("spawn")
+        for name in args.only:
+            with context.Pool(1) as pool:
+                results[name] = pool.apply(_run, (name, workdir, interactions_path, args.backend, args.calls, args.top_n, args.seed))
+            print(json.dumps({name: results[name]}), file=sys.stderr)
+
+    document = write_results(args.output, "recommenders", parameters, results) if args.output else {"parameters": parameters, "results": results}
+    print(json.dumps(document, indent=2))
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(compare(document, json.load(f)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Import-time profile and startup-latency regression check for app.py.
+
+Importing app.py creates the Flask app but must not import the numeric stack or
+load any model; those happen on first use or in warm_up(). This script times
+``import app`` in fresh interpreters and lists the slowest imports from
+``python -X importtime``.
+
+    python benchmarks/bench_startup.py                       # profile
+    python benchmarks/bench_startup.py --check --budget-ms 800
+    python benchmarks/bench_startup.py --write-baseline startup.json
+    python benchmarks/bench_startup.py --check --baseline startup.json --tolerance 0.25
+
+``--check`` exits with status 1 if a heavy module is imported at startup, the median
+import time exceeds ``--budget-ms``, or it is more than ``--tolerance`` slower than
+the ``--baseline``.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must only be imported on first use, never by "import app"
+HEAVY_MODULES = ("numpy", "pandas", "scipy", "sklearn")
+
+TIMED_IMPORT = "import time; started = time.perf_counter(); import app; print((time.perf_counter() - started) * 1000)"
+
+
+def _run(args):
+    env = dict(os.environ, PYTHONPATH=REPO + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    result = subprocess.run([sys.executable, *args], cwd=REPO, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise SystemExit(f"'import app' failed:\n{result.stderr}")
+    return result
+
+
+def import_times(runs):
+    """Wall-clock milliseconds of ``import app`` in ``runs`` fresh interpreters."""
+    return [float(_run(["-c", TIMED_IMPORT]).stdout.strip().splitlines()[-1]) for _ in range(runs)]
+
+
+def import_profile():
+    """``(module, self_us, cumulative_us)`` for every module imported by ``import app``, from -X importtime."""
+    stderr = _run(["-X", "importtime", "-c", "import app"]).stderr
+    profile = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        profile.append((name.strip(), int(self_us), int(cumulative_us)))
+    return profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile and check the cold-start time of 'import app'.")
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    parser.add_argument("--check", action="store_true", help="exit with status 1 on a regression")
+    parser.add_argument("--budget-ms", type=float, help="maximum median import time")
+    parser.add_argument("--baseline", help="JSON written by --write-baseline to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown relative to --baseline")
+    parser.add_argument("--write-baseline", help="save this run's result as a baseline")
+    args = parser.parse_args()
+
+    times = import_times(args.runs)
+    profile = import_profile()
+    imported = {name for name, _, _ in profile}
+    result = {
+        "import_ms": {"median": round(statistics.median(times), 1), "min": round(min(times), 1), "max": round(max(times), 1)},
+        "modules_imported": len(profile),
+        "heavy_modules": sorted(module for module in HEAVY_MODULES if module in imported),
+        "slowest_imports": [
+            {"module": name, "cumulative_ms": round(cumulative / 1000, 1), "self_ms": round(self_us / 1000, 1)}
+            for name, self_us, cumulative in sorted(profile, key=lambda entry: entry[2], reverse=True)[:args.top]
+        ],
+    }
+    print(json.dumps(result, indent=2))
+
+    if args.write_baseline:
+        with open(args.write_baseline, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if not args.check:
+        return
+    failures = []
+    if result["heavy_modules"]:
+        failures.append(f"heavy modules imported at startup: {', '.join(result['heavy_modules'])}")
+    median = result["import_ms"]["median"]
+    if args.budget_ms is not None and median > args.budget_ms:
+        failures.append(f"median import time {median} ms exceeds the {args.budget_ms} ms budget")
+    if args.baseline:
+        with open(args.baseline) as f:
+            limit = json.load(f)["import_ms"]["median"] * (1 + args.tolerance)
+        if median > limit:
+            failures.append(f"median import time {median} ms is above the baseline limit of {limit:.1f} ms")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
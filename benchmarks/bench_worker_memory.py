@@ -0,0 +1,120 @@
+"""Memory of a gunicorn deployment with 1, 4 and 16 workers, with and without preloading.
+
+Starts ``gunicorn -c gunicorn.conf.py app:app`` for each worker count, sends enough
+/recommendations requests that every worker has touched the content index, and sums
+the proportional set size (PSS, shared pages divided among the processes that map
+them) and the unique set size of the master and its workers. RSS is reported too,
+but it counts shared pages once per process.
+
+    python benchmarks/bench_worker_memory.py                     # synthetic 50k-item catalog
+    python benchmarks/bench_worker_memory.py --workdir .         # the real models/ directory
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import psutil
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+
+def _get(url, payload=None):
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return response.read()
+
+
+def _memory(processes):
+    totals = {"rss_mb": 0.0, "pss_mb": 0.0, "uss_mb": 0.0}
+    for process in processes:
+        try:
+            info = process.memory_full_info()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+        totals["rss_mb"] += info.rss / 2 ** 20
+        totals["uss_mb"] += getattr(info, "uss", 0) / 2 ** 20
+        # PSS is Linux-only; elsewhere fall back to RSS
+        totals["pss_mb"] += getattr(info, "pss", info.rss) / 2 ** 20
+    return {key: round(value, 1) for key, value in totals.items()}
+
+
+def measure(workdir, workers, preload, port, requests_per_worker, item_names):
+    env = dict(os.environ, GUNICORN_WORKERS=str(workers), GUNICORN_PRELOAD="1" if preload else "0",
+               GUNICORN_BIND=f"127.0.0.1:{port}", PYTHONPATH=REPO + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", os.path.join(REPO, "gunicorn.conf.py"), "app:app"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    master = psutil.Process(server.pid)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        started = time.perf_counter()
+        while True:
+            if server.poll() is not None:
+                raise SystemExit(f"gunicorn exited with status {server.returncode}")
+            try:
+                _get(f"{base}/cache/stats")
+                if len(master.children()) >= workers:
+                    break
+            except OSError:
+                pass
+            if time.perf_counter() - started > 300:
+                raise SystemExit("gunicorn did not become ready within 300s")
+            time.sleep(0.2)
+        ready_seconds = time.perf_counter() - started
+
+        for i in range(workers * requests_per_worker):
+            _get(f"{base}/recommendations", {"prod": item_names[i % len(item_names)], "nbr": 10})
+
+        return dict(workers=workers, preload=preload, ready_seconds=round(ready_seconds, 2),
+                    **_memory([master] + master.children(recursive=True)))
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure resident memory of gunicorn workers sharing the recommendation artifacts.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--items", type=int, default=50000, help="synthetic catalog size when --workdir is not given")
+    parser.add_argument("--workdir", help="directory containing models/final_data.csv (default: a synthetic catalog)")
+    parser.add_argument("--requests-per-worker", type=int, default=20)
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--no-compare", action="store_true", help="only measure with preloading")
+    args = parser.parse_args()
+
+    import pandas as pd
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = args.workdir
+        if workdir is None:
+            from benchmarks.synthetic import make_catalog
+            from catalog_store import build_catalog
+
+            workdir = tmp
+            os.makedirs(os.path.join(workdir, "models"))
+            csv_path = os.path.join(workdir, "models", "final_data.csv")
+            make_catalog(args.items).to_csv(csv_path, index=False)
+            build_catalog(pd.read_csv(csv_path), os.path.join(workdir, "models", "catalog"), source=csv_path)
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tmp, 'bench.sqlite')}")
+        subprocess.run([sys.executable, "-c", "from app import app; from database import db; app.app_context().push(); db.create_all()"],
+                       cwd=workdir, env=dict(os.environ, PYTHONPATH=REPO), check=True)
+
+        item_names = pd.read_csv(os.path.join(workdir, "models", "final_data.csv"), usecols=["Name"], nrows=1000)["Name"].tolist()
+        results = []
+        for preload in ([True] if args.no_compare else [True, False]):
+            for workers in args.workers:
+                result = measure(workdir, workers, preload, args.port, args.requests_per_worker, item_names)
+                print(json.dumps(result), file=sys.stderr)
+                results.append(result)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Latency summaries and the JSON result files the benchmark suite writes and compares.
+
+    python benchmarks/report.py results/after.json --baseline results/before.json
+"""
+import argparse
+import json
+import platform
+import resource
+import sys
+import time
+
+
+def summarize(latencies, seconds=None, errors=0):
+    """p50/p95/p99/mean in ms and throughput for per-call ``latencies`` in seconds.
+
+    ``seconds`` is the wall-clock span of the run (default: the sum of the latencies,
+    i.e. calls made one after another).
+    """
+    values = sorted(latency * 1000 for latency in latencies)
+    if not values:
+        return {"calls": 0, "errors": errors}
+
+    def percentile(p):
+        return values[min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))]
+
+    seconds = seconds if seconds is not None else sum(latencies)
+    return {
+        "calls": len(values),
+        "errors": errors,
+        "p50_ms": round(percentile(50), 3),
+        "p95_ms": round(percentile(95), 3),
+        "p99_ms": round(percentile(99), 3),
+        "mean_ms": round(sum(values) / len(values), 3),
+        "throughput_per_s": round(len(values) / seconds, 1) if seconds > 0 else None,
+    }
+
+
+def peak_rss_mb(children=False):
+    """Peak resident set size of this process (or of its waited-for children) so far."""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    return round(usage.ru_maxrss / (2 ** 20 if sys.platform == "darwin" else 2 ** 10), 1)
+
+
+def write_results(path, benchmark, parameters, results):
+    document = {
+        "benchmark": benchmark,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "parameters": parameters,
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2)
+    return document
+
+
+# Metrics where a higher value is better; for all other numeric metrics lower is better
+HIGHER_IS_BETTER = ("throughput_per_s",)
+NOT_COMPARED = ("calls",)
+
+
+def compare(current, baseline):
+    """``{name: {metric: {"baseline", "current", "change"}}}`` for the numeric metrics both runs report.
+
+    ``change`` is the relative difference, signed so that a positive value is an improvement.
+    """
+    comparison = {}
+    for name, metrics in current["results"].items():
+        before = baseline["results"].get(name)
+        if not isinstance(before, dict):
+            continue
+        for metric, value in metrics.items():
+            old = before.get(metric)
+            if metric in NOT_COMPARED or isinstance(value, bool) or not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or not old:
+                continue
+            change = (value - old) / old
+            if metric not in HIGHER_IS_BETTER:
+                change = -change
+            comparison.setdefault(name, {})[metric] = {"baseline": old, "current": value, "change": round(change, 3)}
+    return comparison
+
+
+def print_comparison(comparison, file=sys.stdout):
+    for name, metrics in comparison.items():
+        print(name, file=file)
+        for metric, values in metrics.items():
+            print(f"  {metric:<18} {values['baseline']:>12} -> {values['current']:>12}  {values['change']:+.1%}", file=file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("results")
+    parser.add_argument("--baseline", required=True)
+    args = parser.parse_args()
+
+    with open(args.results) as f:
+        current = json.load(f)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    print_comparison(compare(current, baseline))
+
+
+if __name__ == "__main__":
+    main()
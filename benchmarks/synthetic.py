@@ -0,0 +1,77 @@
+"""Synthetic catalog data shaped like models/final_data.csv, for benchmarks that cannot ship real data."""
+import numpy as np
+import pandas as pd
+
+WORDS = (
+    "nail polish lacquer shine gel matte gloss shampoo conditioner hair color dye serum cream lotion "
+    "moisturizer sunscreen spf face body hand foot lip balm stick mascara eyeliner brow palette blush "
+    "bronzer powder foundation concealer primer spray mist perfume cologne fragrance deodorant soap "
+    "wash scrub mask peel toner cleanser wipes cotton brush comb dryer straightener curler razor blade "
+    "shave trimmer vitamin supplement protein organic natural vegan unscented sensitive travel size pack"
+).split()
+FACTORIES = [f"Factory {i}" for i in range(200)]
+
+
+def make_catalog(n_items, tags_per_item=12, seed=0):
+    """A catalog frame with the columns the recommenders read: id, Name, Tags, Factory, ..."""
+    rng = np.random.default_rng(seed)
+    words = np.array(WORDS)
+    # Zipf-ish word popularity so TF-IDF weights look like a real catalog
+    weights = 1.0 / np.arange(1, len(words) + 1)
+    weights /= weights.sum()
+    tags = [", ".join(rng.choice(words, size=tags_per_item, p=weights)) for _ in range(n_items)]
+    names = [f"{' '.join(rng.choice(words, size=3)).title()} {i}" for i in range(n_items)]
+    return pd.DataFrame({
+        "id": np.arange(1, n_items + 1),
+        "Name": names,
+        "Tags": tags,
+        "ReviewCount": rng.integers(0, 5000, size=n_items),
+        "Factory": rng.choice(FACTORIES, size=n_items),
+        "Img": [f"https://example.com/img/{i}.jpg" for i in range(1, n_items + 1)],
+        "Rating": rng.uniform(0, 5, size=n_items).round(1),
+        "Description": [f"{name}. {tag}" for name, tag in zip(names, tags)],
+    })
+
+
+def make_interactions(n_users, n_items, density=0.001, seed=0):
+    """``user_id, product_id, interaction_count`` rows covering about ``density`` of the user x item matrix.
+
+    Users are uniform and items Zipf-popular, as in real view logs; repeated pairs add up in the count.
+    """
+    rng = np.random.default_rng(seed)
+    n_views = max(1, int(n_users * n_items * density))
+    weights = 1.0 / np.arange(1, n_items + 1)
+    weights /= weights.sum()
+    users = rng.integers(1, n_users + 1, size=n_views)
+    items = rng.permutation(n_items)[rng.choice(n_items, size=n_views, p=weights)] + 1
+    pairs, counts = np.unique(np.stack([users, items], axis=1), axis=0, return_counts=True)
+    return pd.DataFrame({"user_id": pairs[:, 0], "product_id": pairs[:, 1], "interaction_count": counts})
+
+
+def make_workdir(directory, n_items, n_users, density=0.001, seed=0):
+    """Lay out ``directory`` like the app's working directory: the catalog CSV and columnar
+    catalog under models/, and a SQLite database (returned as a URL) holding the interactions.
+    """
+    import os
+
+    from sqlalchemy import create_engine
+
+    from catalog_store import build_catalog
+    from database import UserInteraction, db
+
+    os.makedirs(os.path.join(directory, "models"), exist_ok=True)
+    csv_path = os.path.join(directory, "models", "final_data.csv")
+    catalog = make_catalog(n_items, seed=seed)
+    catalog.to_csv(csv_path, index=False)
+    build_catalog(pd.read_csv(csv_path), os.path.join(directory, "models", "catalog"), source=csv_path)
+
+    interactions = make_interactions(n_users, n_items, density, seed)
+    database_url = f"sqlite:///{os.path.join(directory, 'bench.sqlite')}"
+    engine = create_engine(database_url)
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        rows = interactions.to_dict(orient="records")
+        for start in range(0, len(rows), 50000):
+            conn.execute(UserInteraction.__table__.insert(), rows[start:start + 50000])
+    engine.dispose()
+    return catalog, interactions, database_url
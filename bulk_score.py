@@ -0,0 +1,173 @@
+"""Offline bulk scoring for the email and homepage precompute jobs.
+
+    python bulk_score.py users --output recs.jsonl --workers 8
+    python bulk_score.py items --input names.txt --output recs.parquet --format parquet
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from catalog_store import CATALOG_CSV, load_catalog
+from content_index import CONTENT_INDEX_DIR, ContentIndex
+from factor_model import FACTORS_DIR, FactorModel, current_version
+from name_index import NameIndex
+from util import batch_collaborative_recommendations, batch_content_based_recommendations
+
+# Artifacts loaded once per worker process by _init_users / _init_items
+_worker = {}
+
+
+class _SeenProducts:
+    """Stands in for the InteractionStore inside worker processes, which only need seen products."""
+
+    def __init__(self, seen):
+        self.seen = seen
+
+    def seen_products(self, user_id):
+        return self.seen.get(user_id, ())
+
+
+def _init_users(model_dir, top_n, block_size):
+    _worker.update(
+        model=FactorModel.load(model_dir),
+        top_n=top_n,
+        block_size=block_size,
+    )
+
+
+def _score_users(chunk):
+    user_ids = [user_id for user_id, _ in chunk]
+    seen = _SeenProducts({user_id: products for user_id, products in chunk})
+    return list(batch_collaborative_recommendations(
+        user_ids, _worker["model"], top_n=_worker["top_n"], interaction_store=seen, block_size=_worker["block_size"]))
+
+
+def _init_items(catalog, index_dir, top_n, block_size):
+    train_data = load_catalog(catalog)
+    _worker.update(
+        train_data=train_data,
+        content_index=ContentIndex.load(index_dir),
+        name_index=NameIndex(train_data['Name']),
+        top_n=top_n,
+        block_size=block_size,
+    )
+
+
+def _score_items(chunk):
+    return list(batch_content_based_recommendations(
+        _worker["train_data"], chunk, _worker["content_index"], _worker["name_index"],
+        top_n=_worker["top_n"], block_size=_worker["block_size"]))
+
+
+class JsonlWriter:
+    def __init__(self, path):
+        self.file = open(path, "w")
+
+    def write(self, records):
+        for record in records:
+            self.file.write(json.dumps(record) + "\n")
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    """Appends one row group per chunk, so memory stays bounded by the chunk size."""
+
+    def __init__(self, path):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow: pip install pyarrow")
+        self.path = path
+        self.writer = None
+
+    def write(self, records):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pylist(records)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def _chunks(values, size):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _run(score, initializer, initargs, chunks, writer, workers):
+    """Score ``chunks`` in order, inline or across a process pool, streaming each result to ``writer``."""
+    if workers <= 1:
+        initializer(*initargs)
+        for records in map(score, chunks):
+            writer.write(records)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as executor:
+        for records in executor.map(score, chunks):
+            writer.write(records)
+
+
+def _read_lines(path):
+    with open(path) as f:
+        return [line.rstrip("\n") for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score recommendations in bulk and stream them to JSONL or Parquet.")
+    parser.add_argument("mode", choices=["users", "items"])
+    parser.add_argument("--input", help="one user id or item name per line (default: every user in the model)")
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--format", choices=["jsonl", "parquet"], default="jsonl")
+    parser.add_argument("--top-n", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--chunk-size", type=int, default=10000, help="users or items per worker task")
+    parser.add_argument("--block-size", type=int, default=256, help="rows per matrix product inside a task")
+    parser.add_argument("--factors", default=FACTORS_DIR)
+    parser.add_argument("--content-index", default=CONTENT_INDEX_DIR)
+    parser.add_argument("--catalog", default=CATALOG_CSV)
+    parser.add_argument("--include-seen", action="store_true", help="do not exclude products users already viewed")
+    args = parser.parse_args()
+
+    writer = ParquetWriter(args.output) if args.format == "parquet" else JsonlWriter(args.output)
+    try:
+        if args.mode == "users":
+            version = current_version(args.factors)
+            if version is None:
+                raise SystemExit(f"No collaborative model published in '{args.factors}', run training.py first")
+            model_dir = os.path.join(args.factors, version)
+
+            if args.input:
+                user_ids = [int(line) if line.lstrip('-').isdigit() else line for line in _read_lines(args.input)]
+            else:
+                user_ids = FactorModel.load(model_dir).user_ids
+
+            if args.include_seen:
+                seen = {}
+            else:
+                from training import load_store_from_database
+                store = load_store_from_database()
+                seen = {user_id: store.seen_products(user_id) for user_id in user_ids}
+
+            chunks = [[(user_id, seen.get(user_id, ())) for user_id in chunk] for chunk in _chunks(user_ids, args.chunk_size)]
+            _run(_score_users, _init_users, (model_dir, args.top_n, args.block_size), chunks, writer, args.workers)
+        else:
+            if not args.input:
+                raise SystemExit("--input with one item name per line is required in items mode")
+            chunks = list(_chunks(_read_lines(args.input), args.chunk_size))
+            _run(_score_items, _init_items, (args.catalog, args.content_index, args.top_n, args.block_size),
+                 chunks, writer, args.workers)
+    finally:
+        writer.close()
+    print(f"Recommendations written to '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
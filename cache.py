@@ -0,0 +1,238 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from singleflight import SingleFlight
+
+
+class LRUCache:
+    """Bounded in-process cache with least-recently-used eviction and a per-entry TTL."""
+
+    def __init__(self, max_entries=10000, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """Shared cache tier in a local SQLite file, so every worker process sees the same entries."""
+
+    def __init__(self, path, ttl=3600, purge_interval=60):
+        self.path = path
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._next_purge = time.time() + purge_interval
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS recommendation_cache ("
+                " key TEXT PRIMARY KEY, user_id TEXT, value TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_recommendation_cache_user ON recommendation_cache (user_id)")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        # A connection inherited from the parent of a forked worker must not be used in the child
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        """``(value, user_id)`` for an unexpired entry (``user_id`` as a string, or None), else None."""
+        row = self._connection().execute(
+            "SELECT value, user_id FROM recommendation_cache WHERE key = ? AND expires >= ?", (key, time.time())
+        ).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def set(self, key, value, user_id=None):
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO recommendation_cache (key, user_id, value, expires) VALUES (?, ?, ?, ?)",
+                (key, None if user_id is None else str(user_id), json.dumps(value), time.time() + self.ttl),
+            )
+        # Expired rows are never read again; the writers drop them at most once per purge_interval
+        if time.time() >= self._next_purge:
+            self._next_purge = time.time() + self.purge_interval
+            self.purge_expired()
+
+    def delete_user(self, user_id):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM recommendation_cache WHERE user_id = ?", (str(user_id),))
+
+    def purge_expired(self):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM recommendation_cache WHERE expires < ?", (time.time(),))
+
+
+class RecommendationCache:
+    """Two-tier response cache in front of the recommendation routes.
+
+    Keys carry the route, the model version and the normalised request parameters,
+    so publishing a new model never serves stale results. Entries computed for a
+    user are tracked so ``invalidate_user`` can drop them when that user's history
+    changes; a result computed for a user who was invalidated while it was being
+    computed is returned to its caller but not stored. With ``coalesce``,
+    concurrent misses for the same key share one computation (see singleflight.py).
+    """
+
+    def __init__(self, max_entries=10000, ttl=300, shared_path=None, shared_ttl=3600, coalesce=True):
+        self.local = LRUCache(max_entries, ttl)
+        self.shared = SQLiteCache(shared_path, shared_ttl) if shared_path else None
+        self.flights = SingleFlight() if coalesce else None
+        self.max_tracked_users = max_entries
+        self._user_keys = OrderedDict()
+        # Every invalidate_user takes the next sequence number; user id -> that of their latest one.
+        # Users dropped from the bounded map count as invalidated at the latest sequence dropped.
+        self._sequence = 0
+        self._invalidated = OrderedDict()
+        self._invalidated_floor = 0
+        self._lock = threading.Lock()
+        self.stats = {"local_hits": 0, "shared_hits": 0, "misses": 0, "invalidations": 0}
+
+    @staticmethod
+    def make_key(route, version, **params):
+        return json.dumps([route, version, sorted(params.items())], default=str)
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is not None:
+            self._count("local_hits")
+            return value
+        if self.shared is not None:
+            entry = self.shared.get(key)
+            if entry is not None:
+                value, user_id = entry
+                with self._lock:
+                    # Tracked like a local set, so invalidate_user also drops this copy
+                    self._set_local(key, value, user_id)
+                self._count("shared_hits")
+                return value
+        self._count("misses")
+        return None
+
+    def set(self, key, value, user_id=None, computed_after=None):
+        """Store ``value``; with ``computed_after`` (the invalidation sequence number when the
+        computation started), only if ``user_id`` has not been invalidated since."""
+        with self._lock:
+            if user_id is not None and computed_after is not None and self._last_invalidation(user_id) > computed_after:
+                return False
+            self._set_local(key, value, user_id)
+        if self.shared is not None:
+            self.shared.set(key, value, user_id)
+            # The user may have been invalidated, and the shared rows deleted, while this row was written
+            if user_id is not None and computed_after is not None and self._last_invalidation(user_id) > computed_after:
+                self.shared.delete_user(user_id)
+        return True
+
+    def _set_local(self, key, value, user_id):
+        # Called with the lock held
+        self.local.set(key, value)
+        if user_id is None:
+            return
+        self._user_keys.setdefault(str(user_id), set()).add(key)
+        self._user_keys.move_to_end(str(user_id))
+        # Stop tracking the least recent user, dropping their entries so none outlive tracking
+        if len(self._user_keys) > self.max_tracked_users:
+            self.local.delete(self._user_keys.popitem(last=False)[1])
+
+    def _last_invalidation(self, user_id):
+        return self._invalidated.get(str(user_id), self._invalidated_floor)
+
+    def get_or_compute(self, key, compute, user_id=None):
+        """Return the cached value for ``key``, computing and storing it on a miss."""
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            started = self._sequence
+            generation = self._last_invalidation(user_id) if user_id is not None else None
+
+        def compute_and_store():
+            result = compute()
+            self.set(key, result, user_id, computed_after=started)
+            return result
+
+        if self.flights is None:
+            return compute_and_store()
+
+        def compute_once():
+            # A flight for this key may have finished between the miss above and joining here
+            cached = self.local.get(key)
+            if cached is not None:
+                return cached
+            return compute_and_store()
+
+        # Callers arriving after an invalidation start a new flight instead of sharing the stale one
+        return self.flights.do((key, generation), compute_once)
+
+    def invalidate_user(self, user_id):
+        """Drop every entry computed for ``user_id`` from both tiers."""
+        with self._lock:
+            self._sequence += 1
+            self._invalidated[str(user_id)] = self._sequence
+            self._invalidated.move_to_end(str(user_id))
+            if len(self._invalidated) > self.max_tracked_users:
+                self._invalidated_floor = max(self._invalidated_floor, self._invalidated.popitem(last=False)[1])
+            self.local.delete(self._user_keys.pop(str(user_id), set()))
+        if self.shared is not None:
+            self.shared.delete_user(user_id)
+        self._count("invalidations")
+
+    def clear(self):
+        self.local.clear()
+        with self._lock:
+            self._user_keys.clear()
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def snapshot(self):
+        """Hit/miss counters plus the current size of the in-process tier."""
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats["local_hits"] + stats["shared_hits"] + stats["misses"]
+        stats["hit_ratio"] = (stats["local_hits"] + stats["shared_hits"]) / lookups if lookups else 0.0
+        stats["local_entries"] = len(self.local)
+        if self.flights is not None:
+            stats["coalesced"] = self.flights.stats["coalesced"]
+        return stats
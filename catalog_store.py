@@ -0,0 +1,246 @@
+"""Columnar on-disk catalog, memory-mapped at startup instead of parsing the CSV.
+
+    python catalog_store.py models/final_data.csv models/catalog
+
+Numeric columns are stored as ``.npy`` arrays, low-cardinality columns (``Factory``)
+as integer codes plus a category list, and text columns as one UTF-8 byte buffer
+with an offsets array. Everything is opened with ``mmap_mode="r"``, so worker
+processes share the same page-cache pages and a text column is only touched
+when it is first read.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from content_index import catalog_fingerprint
+
+CATALOG_CSV = "models/final_data.csv"
+CATALOG_DIR = "models/catalog"
+CATEGORICAL_COLUMNS = ("Factory",)
+
+NUMERIC, CATEGORICAL, TEXT = "numeric", "categorical", "text"
+
+
+class StringColumn:
+    """Read-only sequence of strings decoded on demand from a byte buffer and an offsets array."""
+
+    def __init__(self, directory, name):
+        self.directory = directory
+        self.name = name
+        self._buffer = None
+        self._offsets = None
+        self._nulls = None
+
+    def _open(self):
+        if self._offsets is None:
+            path = os.path.join(self.directory, self.name)
+            self._buffer = np.load(f"{path}.bytes.npy", mmap_mode="r")
+            self._nulls = np.load(f"{path}.nulls.npy", mmap_mode="r") if os.path.exists(f"{path}.nulls.npy") else None
+            self._offsets = np.load(f"{path}.offsets.npy", mmap_mode="r")
+
+    def __len__(self):
+        self._open()
+        return len(self._offsets) - 1
+
+    def _value(self, position):
+        if self._nulls is not None and self._nulls[position]:
+            return None
+        start, end = self._offsets[position], self._offsets[position + 1]
+        return self._buffer[start:end].tobytes().decode("utf-8")
+
+    def __getitem__(self, position):
+        self._open()
+        if position < 0:
+            position += len(self)
+        return self._value(position)
+
+    def take(self, positions):
+        self._open()
+        return [self._value(position) for position in positions]
+
+    def __iter__(self):
+        self._open()
+        for position in range(len(self)):
+            yield self._value(position)
+
+
+class Catalog:
+    """Stand-in for the catalog DataFrame backed by the memory-mapped columns of :func:`build_catalog`.
+
+    ``catalog[column]`` gives a zero-copy ``pd.Series`` for numeric and categorical
+    columns and a lazy :class:`StringColumn` for text; :meth:`take` materialises a
+    DataFrame for just the requested rows.
+    """
+
+    def __init__(self, directory, meta):
+        self.directory = directory
+        self.meta = meta
+        self.kinds = meta["columns"]
+        self.tags_fingerprint = meta.get("tags_fingerprint")
+        self._columns = {}
+
+    @classmethod
+    def open(cls, directory=CATALOG_DIR):
+        with open(os.path.join(directory, "meta.json")) as f:
+            return cls(directory, json.load(f))
+
+    @property
+    def columns(self):
+        return list(self.kinds)
+
+    def __len__(self):
+        return self.meta["n_rows"]
+
+    def __contains__(self, column):
+        return column in self.kinds
+
+    def __getitem__(self, column):
+        if column not in self._columns:
+            kind = self.kinds[column]
+            path = os.path.join(self.directory, column)
+            if kind == NUMERIC:
+                values = pd.Series(np.load(f"{path}.npy", mmap_mode="r"), name=column, copy=False)
+            elif kind == CATEGORICAL:
+                codes = np.load(f"{path}.codes.npy", mmap_mode="r")
+                with open(f"{path}.categories.json") as f:
+                    categories = json.load(f)
+                values = pd.Series(pd.Categorical.from_codes(codes, categories), name=column)
+            else:
+                values = StringColumn(self.directory, column)
+            self._columns[column] = values
+        return self._columns[column]
+
+    def take(self, positions, columns=None):
+        """Rows at ``positions`` (in that order) as a DataFrame indexed by position, like ``iloc``."""
+        positions = np.asarray(positions, dtype=np.int64)
+        data = {}
+        for column in columns or self.columns:
+            values = self[column]
+            if isinstance(values, StringColumn):
+                data[column] = values.take(positions)
+            else:
+                data[column] = values.iloc[positions].to_numpy()
+        return pd.DataFrame(data, index=positions, columns=list(data))
+
+
+class CatalogOverlay:
+    """A catalog (DataFrame or :class:`Catalog`) plus rows appended after it was loaded.
+
+    Positions past the end of ``base`` address the appended rows, in step with the
+    rows appended to the content index. Overlays are never modified; :meth:`append`
+    returns a new one.
+    """
+
+    def __init__(self, base, extra):
+        self.base = base
+        self.extra = extra.reset_index(drop=True)
+        self._columns = {}
+
+    def append(self, rows):
+        return CatalogOverlay(self.base, pd.concat([self.extra, rows], ignore_index=True))
+
+    @property
+    def columns(self):
+        return list(self.base.columns)
+
+    def __len__(self):
+        return len(self.base) + len(self.extra)
+
+    def __contains__(self, column):
+        return column in self.base.columns
+
+    def __getitem__(self, column):
+        if column not in self._columns:
+            values = self.base[column]
+            values = np.asarray(list(values), dtype=object) if isinstance(values, StringColumn) else values.to_numpy()
+            self._columns[column] = pd.Series(np.concatenate([values, self.extra[column].to_numpy()]), name=column)
+        return self._columns[column]
+
+    def take(self, positions, columns=None):
+        positions = np.asarray(positions, dtype=np.int64)
+        columns = columns or self.columns
+        appended = positions >= len(self.base)
+        if not appended.any():
+            return take_rows(self.base, positions, columns)
+        rows = self.extra.iloc[positions[appended] - len(self.base)][columns].set_axis(positions[appended])
+        if appended.all():
+            return rows
+        rows = pd.concat([take_rows(self.base, positions[~appended], columns), rows])
+        order = np.concatenate([np.flatnonzero(~appended), np.flatnonzero(appended)])
+        return rows.iloc[np.argsort(order)]
+
+
+def take_rows(catalog, positions, columns=None):
+    """``catalog.iloc[positions][columns]`` for a DataFrame, a :class:`Catalog` or a :class:`CatalogOverlay`."""
+    if isinstance(catalog, pd.DataFrame):
+        rows = catalog.iloc[positions]
+        return rows if columns is None else rows[columns]
+    return catalog.take(positions, columns)
+
+
+def build_catalog(frame, directory=CATALOG_DIR, categorical=CATEGORICAL_COLUMNS, source=None):
+    """Write ``frame`` column by column to ``directory`` in the layout :class:`Catalog` reads."""
+    os.makedirs(directory, exist_ok=True)
+    kinds = {}
+    for column in frame.columns:
+        values = frame[column]
+        path = os.path.join(directory, column)
+        if column in categorical:
+            values = values.astype("category")
+            codes = values.cat.codes.to_numpy()
+            np.save(f"{path}.codes.npy", codes.astype(np.int16 if len(values.cat.categories) < 2 ** 15 else np.int32))
+            with open(f"{path}.categories.json", "w") as f:
+                json.dump([str(category) for category in values.cat.categories], f)
+            kinds[column] = CATEGORICAL
+        elif pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+            np.save(f"{path}.npy", values.to_numpy())
+            kinds[column] = NUMERIC
+        else:
+            nulls = values.isna().to_numpy()
+            encoded = [b"" if null else str(value).encode("utf-8") for value, null in zip(values, nulls)]
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            np.cumsum([len(value) for value in encoded], out=offsets[1:])
+            np.save(f"{path}.bytes.npy", np.frombuffer(b"".join(encoded), dtype=np.uint8))
+            np.save(f"{path}.offsets.npy", offsets)
+            if nulls.any():
+                np.save(f"{path}.nulls.npy", nulls)
+            kinds[column] = TEXT
+
+    meta = {"n_rows": len(frame), "columns": kinds}
+    if "Tags" in frame:
+        meta["tags_fingerprint"] = catalog_fingerprint(frame["Tags"])
+    if source is not None:
+        stat = os.stat(source)
+        meta["source"] = {"path": source, "size": stat.st_size, "mtime": stat.st_mtime}
+    with open(os.path.join(directory, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    return Catalog(directory, meta)
+
+
+def load_catalog(csv_path=CATALOG_CSV, directory=CATALOG_DIR):
+    """Open the columnar catalog, falling back to reading the CSV if it is missing or older than the CSV."""
+    if os.path.exists(os.path.join(directory, "meta.json")):
+        catalog = Catalog.open(directory)
+        source = catalog.meta.get("source")
+        if source is None or not os.path.exists(csv_path):
+            return catalog
+        stat = os.stat(csv_path)
+        if (stat.st_size, stat.st_mtime) == (source["size"], source["mtime"]):
+            return catalog
+        print(f"Catalog in '{directory}' is older than '{csv_path}', reading the CSV. Rebuild with catalog_store.py.")
+    return pd.read_csv(csv_path)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert the catalog CSV into the memory-mapped columnar store.")
+    parser.add_argument("catalog", nargs="?", default=CATALOG_CSV)
+    parser.add_argument("output", nargs="?", default=CATALOG_DIR)
+    parser.add_argument("--categorical", nargs="*", default=list(CATEGORICAL_COLUMNS))
+    args = parser.parse_args()
+
+    build_catalog(pd.read_csv(args.catalog), args.output, categorical=args.categorical, source=args.catalog)
+    print(f"Catalog written to '{args.output}'")
@@ -0,0 +1,291 @@
+"""Incremental content-index updates for products edited through the admin API.
+
+Edits are logged in the ``product_change`` table and applied to the live content
+snapshot by :class:`CatalogUpdater`. For each edit, the product's old position is
+tombstoned and its text is vectorized with the frozen vocabulary and appended, in
+the content index, the catalog and the name index alike. Every worker polls the
+log, so an edit becomes recommendable everywhere within ``poll_interval`` seconds.
+After ``refit_threshold`` updates, or ``refit_interval`` seconds with updates
+pending, a background refit drops the tombstones and refits the vocabulary over the
+live catalog.
+
+With a checkpoint directory, one worker at a time refits (under a file lock). It
+writes the refitted catalog and content index there, with a neighbour table
+rebuilt for the new index when the service uses one, and every worker then
+memory-maps those same files, as it does the ones built offline. The checkpoint
+records the last change it includes: workers starting up or polling later begin
+the change log there, and the changes up to it are pruned from the log. The
+checkpoint stands in for the catalog it was refitted from; rebuilding that catalog
+makes workers ignore it until the next refit.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+import traceback
+
+import numpy as np
+import pandas as pd
+
+from catalog_store import Catalog, CatalogOverlay, build_catalog, take_rows
+from content_index import ContentIndex
+from name_index import NameIndex
+from neighbours import NeighbourTable, build_neighbours
+
+CHECKPOINT_DIR = "models/content_checkpoint"
+
+
+def product_text(fields):
+    """Stands in for the Tags of a product added through the API: its name, factory and description."""
+    return " ".join(str(fields[key]) for key in ("Name", "Factory", "Description") if fields.get(key))
+
+
+def live_positions(content):
+    """``{product_id: position}`` for every product in ``content`` that is not tombstoned."""
+    deleted = content.content_index.deleted
+    return {int(product_id): position for position, product_id in enumerate(content.train_data['id'].to_numpy()) if not deleted[position]}
+
+
+def apply_changes(content, changes, positions, revision):
+    """Return ``content`` with ``(product_id, fields)`` changes applied; ``fields=None`` deletes the product.
+
+    The snapshot passed in is left untouched, so requests still holding it are
+    unaffected. ``positions`` (product id -> live position) is updated in place.
+    """
+    start = len(content.train_data)
+    rows, removed = [], []
+    for product_id, fields in changes:
+        old = positions.pop(product_id, None)
+        if old is not None:
+            removed.append(old)
+        if fields is not None:
+            positions[product_id] = start + len(rows)
+            rows.append(dict(fields, id=product_id, ReviewCount=0, Rating=0, Tags=product_text(fields)))
+
+    train_data = content.train_data
+    vectors = None
+    if rows:
+        added = pd.DataFrame(rows, columns=list(train_data.columns))
+        train_data = train_data.append(added) if isinstance(train_data, CatalogOverlay) else CatalogOverlay(train_data, added)
+        vectors = content.content_index.vectorize([row['Tags'] for row in rows])
+    content_index = content.content_index.with_updates(vectors, removed, revision)
+    name_index = content.name_index.with_updates([(start + i, row['Name']) for i, row in enumerate(rows)], removed)
+    return content._replace(train_data=train_data, content_index=content_index, name_index=name_index,
+                            similarity_backend=content.similarity_backend.with_index(content_index))
+
+
+def refit(content, make_backend):
+    """Rebuild ``content`` from its live rows: tombstones dropped, vocabulary refitted, backend rebuilt.
+
+    ``make_backend=None`` leaves the backend unset, for a snapshot that is only written to a checkpoint.
+    """
+    live = np.flatnonzero(~content.content_index.deleted)
+    train_data = take_rows(content.train_data, live).reset_index(drop=True)
+    content_index = ContentIndex.build(train_data['Tags'])
+    content_index.revision = content.content_index.revision
+    return content._replace(train_data=train_data, content_index=content_index, name_index=NameIndex(train_data['Name']),
+                            similarity_backend=make_backend(content_index) if make_backend is not None else None)
+
+
+def read_checkpoint(directory):
+    """The current checkpoint's ``{"name", "revision", "base_fingerprint"}``, or None if none was written."""
+    try:
+        with open(os.path.join(directory, "CURRENT")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_checkpoint(content, directory, revision, base_fingerprint, neighbours_k=None):
+    """Write a refitted snapshot's catalog and content index to ``directory`` and make them current.
+
+    With ``neighbours_k``, the neighbour table of the refitted index is built and written alongside.
+    The previous checkpoint is kept, since workers may still be reading it; older ones are removed.
+    """
+    previous = read_checkpoint(directory)
+    name = f"r{revision}-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+    path = os.path.join(directory, name)
+    build_catalog(content.train_data, os.path.join(path, "catalog"))
+    content.content_index.save(os.path.join(path, "content_index"))
+    if neighbours_k:
+        build_neighbours(os.path.join(path, "content_index"), os.path.join(path, "neighbours"), k=neighbours_k)
+
+    meta = {"name": name, "revision": revision, "base_fingerprint": base_fingerprint}
+    with open(os.path.join(directory, "CURRENT.tmp"), "w") as f:
+        json.dump(meta, f)
+    os.replace(os.path.join(directory, "CURRENT.tmp"), os.path.join(directory, "CURRENT"))
+
+    keep = {name, previous and previous["name"]}
+    for entry in os.listdir(directory):
+        if entry not in keep and os.path.isdir(os.path.join(directory, entry)):
+            shutil.rmtree(os.path.join(directory, entry), ignore_errors=True)
+    return meta
+
+
+def load_checkpoint(content, directory, meta, make_backend):
+    """``content`` replaced by the checkpoint ``meta`` names, memory-mapped from ``directory``."""
+    path = os.path.join(directory, meta["name"])
+    train_data = Catalog.open(os.path.join(path, "catalog"))
+    content_index = ContentIndex.load(os.path.join(path, "content_index"))
+    content_index.revision = meta["revision"]
+    table = NeighbourTable.load(os.path.join(path, "neighbours"))
+    return content._replace(train_data=train_data, content_index=content_index, name_index=NameIndex(train_data['Name']),
+                            similarity_backend=make_backend(content_index, table=table))
+
+
+class CatalogUpdater:
+    """Owns the live content snapshot and keeps it in step with the product change log.
+
+    ``fetch_changes(after_id)`` returns ``(last_id, [(product_id, fields or None), ...])``
+    for the changes logged after ``after_id``; ``make_backend(content_index, table=None)``
+    builds the similarity backend after a refit, answered from the neighbour ``table``
+    if one is given. With ``checkpoint_dir`` set, refits are shared through it, each
+    with a neighbour table ``neighbours_k`` wide (none if None), and
+    ``prune_changes(revision)`` deletes the logged changes up to ``revision`` once a
+    checkpoint includes them. Requests read :attr:`content` once and use that
+    snapshot throughout; updates swap in a new one.
+    """
+
+    def __init__(self, content, fetch_changes, make_backend, poll_interval=2.0, refit_threshold=1000, refit_interval=3600.0,
+                 checkpoint_dir=None, prune_changes=None, neighbours_k=None):
+        self.content = content
+        self._fetch_changes = fetch_changes
+        self._make_backend = make_backend
+        self.checkpoint_dir = checkpoint_dir
+        self._prune_changes = prune_changes
+        self.neighbours_k = neighbours_k
+        # Fingerprint of the catalog the service started from; checkpoints refitted from another one are ignored
+        self.base_fingerprint = content.content_index.fingerprint
+        self.checkpoint = None
+        self.poll_interval = poll_interval
+        self.refit_threshold = refit_threshold
+        self.refit_interval = refit_interval
+        self.revision = content.content_index.revision
+        self._positions = None
+        # Changes applied while a refit is running, re-applied to its result before the swap
+        self._replay = None
+        self._refitted_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.stats = {"changes": 0, "refits": 0, "errors": 0, "checkpoints_loaded": 0}
+
+    def _sync_checkpoint(self):
+        """Switch to a checkpoint written since the last look (by any worker); call with the lock held."""
+        if self.checkpoint_dir is None or self._replay is not None:
+            return False
+        meta = read_checkpoint(self.checkpoint_dir)
+        if meta is None or meta["name"] == self.checkpoint:
+            return False
+        if meta.get("base_fingerprint") != self.base_fingerprint:
+            if self.checkpoint is None:
+                print(f"Content checkpoint '{meta['name']}' was refitted from another catalog, ignoring it until the next refit")
+                self.checkpoint = meta["name"]
+            return False
+        self.content = load_checkpoint(self.content, self.checkpoint_dir, meta, self._make_backend)
+        self.revision = meta["revision"]
+        self.checkpoint = meta["name"]
+        self._positions = None
+        self._refitted_at = time.monotonic()
+        self.stats["checkpoints_loaded"] += 1
+        print(f"Content loaded from checkpoint '{meta['name']}' ({len(self.content.train_data)} products)")
+        return True
+
+    def poll(self):
+        """Apply the changes logged since the last poll (after loading a newer checkpoint); returns how many there were."""
+        with self._lock:
+            self._sync_checkpoint()
+            last_id, changes = self._fetch_changes(self.revision)
+            if not changes:
+                return 0
+            if self._positions is None:
+                self._positions = live_positions(self.content)
+            self.content = apply_changes(self.content, changes, self._positions, last_id)
+            self.revision = last_id
+            if self._replay is not None:
+                self._replay.extend(changes)
+            self.stats["changes"] += len(changes)
+        return len(changes)
+
+    def refit_due(self):
+        updates = self.content.content_index.n_updates
+        return updates >= self.refit_threshold or (updates > 0 and time.monotonic() - self._refitted_at >= self.refit_interval)
+
+    def refit(self):
+        """Refit the content snapshot in the calling thread while updates keep being applied to the old one.
+
+        With a checkpoint directory, returns False without refitting while another worker holds the refit lock.
+        """
+        lock = self._acquire_refit_lock()
+        if self.checkpoint_dir is not None and lock is None:
+            return False
+        try:
+            with self._lock:
+                # Another worker may have published a refit just before this one got the lock
+                if self._sync_checkpoint() and not self.refit_due():
+                    return False
+                base, revision = self.content, self.revision
+                self._replay = []
+            try:
+                content = refit(base, self._make_backend if self.checkpoint_dir is None else None)
+                if self.checkpoint_dir is not None:
+                    meta = save_checkpoint(content, self.checkpoint_dir, revision, self.base_fingerprint, self.neighbours_k)
+                    # Serve the files just written, mapped and shared like the ones built offline
+                    content = load_checkpoint(content, self.checkpoint_dir, meta, self._make_backend)
+            except Exception:
+                with self._lock:
+                    self._replay = None
+                raise
+
+            with self._lock:
+                positions = live_positions(content)
+                if self._replay:
+                    content = apply_changes(content, self._replay, positions, self.revision)
+                self.content, self._positions, self._replay = content, positions, None
+                if self.checkpoint_dir is not None:
+                    self.checkpoint = meta["name"]
+                self._refitted_at = time.monotonic()
+                self.stats["refits"] += 1
+            print(f"Content index refitted over {len(content.train_data)} products")
+            if self.checkpoint_dir is not None and self._prune_changes is not None:
+                self._prune_changes(revision)
+            return True
+        finally:
+            if lock is not None:
+                lock.close()
+
+    def _acquire_refit_lock(self):
+        """An open, exclusively locked file in the checkpoint directory, or None if another process holds it."""
+        if self.checkpoint_dir is None:
+            return None
+        import fcntl
+
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        lock = open(os.path.join(self.checkpoint_dir, "refit.lock"), "w")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            return None
+        return lock
+
+    def ensure_thread(self):
+        """Start the background poll and refit thread (again, in a forked worker) unless polling is disabled."""
+        if self.poll_interval <= 0:
+            return
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="catalog-updates", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.poll()
+                if self.refit_due():
+                    self.refit()
+            except Exception:
+                traceback.print_exc()
+                self.stats["errors"] += 1
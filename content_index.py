@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from metrics import span
+
+CONTENT_INDEX_DIR = "models/content_index"
+
+
+def catalog_fingerprint(tags):
+    """Hash the Tags column so a saved index can be matched to its catalog."""
+    digest = hashlib.sha1()
+    for tag in tags:
+        digest.update(str(tag).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ContentIndex:
+    """TF-IDF item index over the catalog Tags, fitted once and reused by every query.
+
+    Products edited after the fit live in a small ``delta`` matrix appended after the
+    fitted rows and vectorized with the frozen vocabulary; removed positions are
+    tombstoned in ``deleted`` and score ``-inf``. Both are folded back in by a refit.
+    """
+
+    def __init__(self, vectorizer, matrix, fingerprint=None, delta=None, deleted=None, revision=0):
+        self.vectorizer = vectorizer
+        self.matrix = matrix.tocsr()
+        self.fingerprint = fingerprint
+        self.delta = delta if delta is not None else sparse.csr_matrix((0, self.matrix.shape[1]), dtype=self.matrix.dtype)
+        self.deleted = deleted if deleted is not None else np.zeros(self.matrix.shape[0] + self.delta.shape[0], dtype=bool)
+        self.n_deleted = int(self.deleted.sum())
+        # Id of the last catalog change applied on top of the fitted rows
+        self.revision = revision
+
+    @classmethod
+    def build(cls, tags):
+        """Fit the vectorizer over all tags, exactly as the per-request path used to."""
+        vectorizer = TfidfVectorizer(stop_words='english')
+        with span("tfidf_fit"):
+            matrix = vectorizer.fit_transform(tags)
+        print(f"TF-IDF Matrix Shape: {matrix.shape}")
+        return cls(vectorizer, matrix, catalog_fingerprint(tags))
+
+    @property
+    def shape(self):
+        return (self.matrix.shape[0] + self.delta.shape[0], self.matrix.shape[1])
+
+    @property
+    def n_updates(self):
+        """Rows appended or tombstoned since the last fit."""
+        return self.delta.shape[0] + self.n_deleted
+
+    def vectorize(self, texts):
+        """TF-IDF rows for ``texts`` with the fitted vocabulary and idf weights; unseen terms are dropped."""
+        return self.vectorizer.transform(texts).tocsr()
+
+    def with_updates(self, rows=None, deleted=(), revision=None):
+        """A new index with ``rows`` appended and the ``deleted`` positions tombstoned; this one is unchanged."""
+        delta = self.delta if rows is None or rows.shape[0] == 0 else sparse.vstack([self.delta, rows]).tocsr()
+        mask = np.zeros(self.matrix.shape[0] + delta.shape[0], dtype=bool)
+        mask[:len(self.deleted)] = self.deleted
+        mask[np.asarray(deleted, dtype=np.int64)] = True
+        return ContentIndex(self.vectorizer, self.matrix, self.fingerprint, delta, mask,
+                            self.revision if revision is None else revision)
+
+    def rows(self, item_indices):
+        """TF-IDF rows of the items at ``item_indices``, fitted or appended, in the given order."""
+        item_indices = np.asarray(item_indices, dtype=np.int64)
+        n_fitted = self.matrix.shape[0]
+        appended = item_indices >= n_fitted
+        if not appended.any():
+            return self.matrix[item_indices]
+        stacked = sparse.vstack([self.matrix[item_indices[~appended]], self.delta[item_indices[appended] - n_fitted]]).tocsr()
+        order = np.concatenate([np.flatnonzero(~appended), np.flatnonzero(appended)])
+        return stacked[np.argsort(order)]
+
+    def _scores(self, rows):
+        scores = (self.matrix @ rows.T).T.toarray()
+        if self.delta.shape[0]:
+            scores = np.hstack([scores, (self.delta @ rows.T).T.toarray()])
+        if self.n_deleted:
+            scores[:, self.deleted] = -np.inf
+        return scores
+
+    def similarities(self, item_index):
+        """Cosine similarity between one item and every item in the catalog.
+
+        The vectorizer L2-normalises each row, so the cosine is a plain dot product
+        and only one sparse row-times-matrix product is needed.
+        """
+        return self._scores(self.rows([item_index])).ravel()
+
+    def similarities_block(self, item_indices):
+        """Cosine similarities of several items against the catalog, one row per item."""
+        return self._scores(self.rows(item_indices))
+
+    def save(self, directory):
+        """Write the sparse matrix, vocabulary and idf weights to ``directory``.
+
+        Only the fitted rows are saved; refit first to persist incremental updates.
+        """
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "data.npy"), self.matrix.data)
+        np.save(os.path.join(directory, "indices.npy"), self.matrix.indices)
+        np.save(os.path.join(directory, "indptr.npy"), self.matrix.indptr)
+        np.save(os.path.join(directory, "idf.npy"), self.vectorizer.idf_)
+        vocabulary = {term: int(column) for term, column in self.vectorizer.vocabulary_.items()}
+        with open(os.path.join(directory, "vocabulary.json"), "w") as f:
+            json.dump(vocabulary, f)
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump({"shape": list(self.matrix.shape), "fingerprint": self.fingerprint}, f)
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r"):
+        """Load an index written by :meth:`save` without refitting anything.
+
+        The arrays are memory-mapped by default, so every worker process shares one copy.
+        """
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        with open(os.path.join(directory, "vocabulary.json")) as f:
+            vocabulary = json.load(f)
+
+        vectorizer = TfidfVectorizer(stop_words='english', vocabulary=vocabulary)
+        vectorizer.idf_ = np.load(os.path.join(directory, "idf.npy"))
+
+        matrix = sparse.csr_matrix(
+            (
+                np.load(os.path.join(directory, "data.npy"), mmap_mode=mmap_mode),
+                np.load(os.path.join(directory, "indices.npy"), mmap_mode=mmap_mode),
+                np.load(os.path.join(directory, "indptr.npy"), mmap_mode=mmap_mode),
+            ),
+            shape=tuple(meta["shape"]),
+        )
+        return cls(vectorizer, matrix, meta.get("fingerprint"))
+
+
+def load_content_index(train_data, directory=CONTENT_INDEX_DIR):
+    """Load the saved index for this catalog, rebuilding and saving it if it is missing or stale."""
+    # A columnar Catalog stores the fingerprint, so its Tags column is only read on a rebuild
+    fingerprint = getattr(train_data, "tags_fingerprint", None) or catalog_fingerprint(train_data['Tags'])
+    if os.path.exists(os.path.join(directory, "meta.json")):
+        index = ContentIndex.load(directory)
+        if index.fingerprint == fingerprint and index.shape[0] == len(train_data):
+            return index
+        print(f"Content index in '{directory}' does not match the catalog, rebuilding.")
+
+    index = ContentIndex.build(train_data['Tags'])
+    index.save(directory)
+    return index
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Build the TF-IDF content index offline.")
+    parser.add_argument("catalog", nargs="?", default="models/final_data.csv")
+    parser.add_argument("output", nargs="?", default=CONTENT_INDEX_DIR)
+    args = parser.parse_args()
+
+    catalog = pd.read_csv(args.catalog)
+    ContentIndex.build(catalog['Tags']).save(args.output)
+    print(f"Content index written to '{args.output}'")
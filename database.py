@@ -0,0 +1,149 @@
+import os
+import sqlite3
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DEFAULT_DATABASE_URL = "sqlite:///ecom_db.sqlite"
+
+# Applied to every new SQLite connection. WAL lets readers run alongside the single
+# writer, and busy_timeout makes writers wait for the lock instead of failing at once.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(float(os.environ.get("SQLITE_BUSY_TIMEOUT", 30)) * 1000),
+    "cache_size": -64000,
+    "temp_store": "MEMORY",
+}
+
+
+def database_config(env=os.environ):
+    """Flask-SQLAlchemy settings for ``DATABASE_URL``.
+
+    SQLite (the default) gets a busy timeout and WAL pragmas; any other URL, for
+    example ``mysql+pymysql://...``, gets a connection pool sized by ``DB_POOL_SIZE``,
+    ``DB_MAX_OVERFLOW``, ``DB_POOL_TIMEOUT``, ``DB_POOL_RECYCLE`` and ``DB_POOL_PRE_PING``.
+    """
+    url = env.get("DATABASE_URL", DEFAULT_DATABASE_URL)
+    if url.startswith("sqlite"):
+        options = {
+            "connect_args": {"timeout": float(env.get("SQLITE_BUSY_TIMEOUT", 30)), "check_same_thread": False},
+        }
+    else:
+        options = {
+            "pool_size": int(env.get("DB_POOL_SIZE", 10)),
+            "max_overflow": int(env.get("DB_MAX_OVERFLOW", 20)),
+            "pool_timeout": float(env.get("DB_POOL_TIMEOUT", 30)),
+            "pool_recycle": int(env.get("DB_POOL_RECYCLE", 1800)),
+            "pool_pre_ping": env.get("DB_POOL_PRE_PING", "1") != "0",
+        }
+    return {"SQLALCHEMY_DATABASE_URI": url, "SQLALCHEMY_ENGINE_OPTIONS": options}
+
+
+@event.listens_for(Engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+# Bound to the Flask app by app.create_app(); scripts that only need the models import them from here
+db = SQLAlchemy()
+
+
+# Define the database models
+class Signup(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(100), nullable=False)
+    email = db.Column(db.String(100), nullable=False, unique=True)
+    password = db.Column(db.String(100), nullable=False)
+
+class Product(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    price = db.Column(db.Float, nullable=False, index=True)
+    img = db.Column(db.String(255), nullable=True)
+    category_id = db.Column(db.Integer, nullable=True)
+    factory = db.Column(db.String(100), nullable=True)
+    description = db.Column(db.String(500), nullable=True)
+
+class Cart(db.Model):
+    __table_args__ = (db.Index('ix_cart_user_email_product', 'user_email', 'product_id'),)
+    id = db.Column(db.Integer, primary_key=True)
+    user_email = db.Column(db.String(100), nullable=False)
+    product_id = db.Column(db.Integer, nullable=False)
+
+class UserInteraction(db.Model):
+    _tablename_ = 'user_interaction'
+    __table_args__ = (db.Index('ix_user_interaction_user_count', 'user_id', 'interaction_count'),
+                      # One row per pair, so concurrent flushes can upsert it (see flush_interactions in app.py)
+                      db.Index('ux_user_interaction_user_product', 'user_id', 'product_id', unique=True))
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    product_id = db.Column(db.Integer, nullable=False)
+    interaction_count = db.Column(db.Integer, default=1)
+
+class ProductChange(db.Model):
+    """Admin product edits, replayed into the content index by every worker (see catalog_updates.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, nullable=False)
+    deleted = db.Column(db.Boolean, nullable=False, default=False)
+
+
+def migrate():
+    """Create the tables and indexes the models declare that the database does not have yet.
+
+    Run by app.create_app(), so every entry point (gunicorn, uvicorn, app.py) upgrades an existing database.
+    """
+    from sqlalchemy.exc import OperationalError, ProgrammingError
+
+    for attempt in range(2):
+        try:
+            db.create_all()
+            ensure_indexes()
+            return
+        except (OperationalError, ProgrammingError):
+            # Another worker starting at the same time may have created them first; look again once
+            db.session.rollback()
+            if attempt:
+                raise
+
+
+def ensure_indexes():
+    """Create indexes declared on the models that an existing database does not have yet."""
+    from sqlalchemy import inspect
+
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            if index.unique and table is UserInteraction.__table__:
+                merge_duplicate_interactions()
+            index.create(db.engine)
+
+
+def merge_duplicate_interactions():
+    """Fold duplicate (user_id, product_id) rows into the oldest one, summing their counts."""
+    from sqlalchemy import func, select
+
+    table = UserInteraction.__table__
+    duplicates = db.session.execute(
+        select(table.c.user_id, table.c.product_id, func.min(table.c.id), func.sum(func.coalesce(table.c.interaction_count, 1)))
+        .group_by(table.c.user_id, table.c.product_id)
+        .having(func.count() > 1)).all()
+    for user_id, product_id, keep, total in duplicates:
+        db.session.execute(table.update().where(table.c.id == keep).values(interaction_count=total))
+        db.session.execute(table.delete().where(table.c.user_id == user_id, table.c.product_id == product_id, table.c.id != keep))
+    db.session.commit()
+    if duplicates:
+        print(f"Merged duplicate interaction rows for {len(duplicates)} (user_id, product_id) pairs")
+    return len(duplicates)
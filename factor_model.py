@@ -0,0 +1,286 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from interaction_store import normalise_id
+
+FACTORS_DIR = "models/factors"
+CURRENT_FILE = "CURRENT"
+
+
+def centered_operator(matrix, row_mean):
+    """``matrix - row_mean`` as a LinearOperator, so centering never densifies the sparse matrix."""
+    from scipy.sparse.linalg import LinearOperator
+
+    row_mean = row_mean.ravel()
+
+    def matvec(x):
+        x = np.asarray(x).ravel()
+        return matrix @ x - row_mean * x.sum()
+
+    def rmatvec(y):
+        y = np.asarray(y).ravel()
+        return matrix.T @ y - np.full(matrix.shape[1], row_mean @ y)
+
+    return LinearOperator(matrix.shape, matvec=matvec, rmatvec=rmatvec, dtype=np.float64)
+
+
+class FactorModel:
+    """Truncated SVD factors of the centred user x product interaction matrix.
+
+    Scoring a user is one ``(U[u] * sigma) @ Vt`` product; the dense reconstructed
+    matrix is never materialised. New users and products are folded in between
+    trainings by projecting their interactions onto the existing factors.
+    """
+
+    def __init__(self, U, sigma, Vt, user_mean, user_ids, product_ids, version=None, meta=None):
+        self.U = U
+        self.sigma = sigma
+        self.Vt = Vt
+        self.user_mean = user_mean
+        self.user_ids = list(user_ids)
+        self.product_ids = list(product_ids)
+        self.user_positions = {user_id: i for i, user_id in enumerate(self.user_ids)}
+        self.product_positions = {product_id: i for i, product_id in enumerate(self.product_ids)}
+        self.version = version
+        self.meta = meta or {}
+
+        # Fold-in overlays: user id -> (factor row, mean), and extra Vt columns for new products
+        self._lock = threading.Lock()
+        self._folded_users = {}
+        self._extra_Vt = np.zeros((len(sigma), 0))
+        self._inverse_sigma = np.divide(1.0, sigma, out=np.zeros(len(sigma)), where=sigma > 1e-10)
+        self._item_factor_sum = np.asarray(Vt.sum(axis=1), dtype=np.float64)
+        self._user_mean_factors = U.T @ user_mean
+
+    @property
+    def k(self):
+        return len(self.sigma)
+
+    @property
+    def n_trained_products(self):
+        return self.Vt.shape[1]
+
+    def has_user(self, user_id):
+        user_id = normalise_id(user_id)
+        return user_id in self.user_positions or user_id in self._folded_users
+
+    def has_product(self, product_id):
+        return normalise_id(product_id) in self.product_positions
+
+    def _user_factors(self, user_id):
+        user_id = normalise_id(user_id)
+        folded = self._folded_users.get(user_id)
+        if folded is not None:
+            return folded
+        user_idx = self.user_positions.get(user_id)
+        if user_idx is None:
+            return None
+        return self.U[user_idx], self.user_mean[user_idx]
+
+    def score_user(self, user_id):
+        """Predicted interaction scores of ``user_id`` for every product, or None if unknown."""
+        factors = self._user_factors(user_id)
+        if factors is None:
+            return None
+        user_vector, mean = factors
+        weighted = user_vector * self.sigma
+        scores = weighted @ self.Vt + mean
+        if self._extra_Vt.shape[1]:
+            scores = np.concatenate([scores, weighted @ self._extra_Vt + mean])
+        return scores
+
+    def score_users(self, user_ids):
+        """Score a block of users at once.
+
+        Returns the known user ids and a ``(len(known), n_products)`` score matrix;
+        unknown users are skipped.
+        """
+        known, vectors, means = [], [], []
+        for user_id in user_ids:
+            factors = self._user_factors(user_id)
+            if factors is not None:
+                known.append(user_id)
+                vectors.append(factors[0])
+                means.append(factors[1])
+        if not known:
+            return [], np.zeros((0, len(self.product_ids)))
+
+        weighted = np.vstack(vectors) * self.sigma
+        scores = weighted @ self.Vt
+        if self._extra_Vt.shape[1]:
+            scores = np.hstack([scores, weighted @ self._extra_Vt])
+        scores += np.asarray(means)[:, None]
+        return known, scores
+
+    def fold_in_user(self, user_id, product_counts):
+        """Project a user's ``{product_id: count}`` row onto the item factors.
+
+        ``u = (r - mean) V / sigma`` is the least-squares user row for the current
+        ``Vt``, so new or changed users are scored without re-running ``svds``.
+        """
+        columns, counts = self._columns_and_counts(product_counts, self.product_positions)
+        n_products = len(self.product_ids)
+        mean = counts.sum() / n_products if n_products else 0.0
+        user_vector = (self._item_factors(columns) @ counts - mean * self._item_factor_sum) * self._inverse_sigma
+        with self._lock:
+            self._folded_users[normalise_id(user_id)] = (user_vector, mean)
+
+    def fold_in_item(self, product_id, user_counts):
+        """Project a new product's ``{user_id: count}`` column onto the user factors.
+
+        ``v = U^T (c - user_mean) / sigma``, mirroring :meth:`fold_in_user`; only users
+        present in the trained ``U`` contribute.
+        """
+        product_id = normalise_id(product_id)
+        if product_id in self.product_positions:
+            return
+        rows, counts = self._columns_and_counts(user_counts, self.user_positions)
+        item_vector = (self.U[rows].T @ counts - self._user_mean_factors) * self._inverse_sigma
+        with self._lock:
+            self._extra_Vt = np.hstack([self._extra_Vt, item_vector[:, None]])
+            self._item_factor_sum = self._item_factor_sum + item_vector
+            self.product_positions[product_id] = len(self.product_ids)
+            self.product_ids.append(product_id)
+
+    def _columns_and_counts(self, id_counts, positions):
+        pairs = [(positions[normalise_id(i)], count) for i, count in id_counts.items() if normalise_id(i) in positions]
+        columns = np.fromiter((column for column, _ in pairs), dtype=np.intp, count=len(pairs))
+        counts = np.fromiter((count for _, count in pairs), dtype=np.float64, count=len(pairs))
+        return columns, counts
+
+    def _item_factors(self, columns):
+        """Columns of ``Vt`` for the given product columns, including folded-in products."""
+        trained = columns < self.n_trained_products
+        factors = np.empty((self.k, len(columns)))
+        factors[:, trained] = self.Vt[:, columns[trained]]
+        factors[:, ~trained] = self._extra_Vt[:, columns[~trained] - self.n_trained_products]
+        return factors
+
+    def product_columns(self, product_ids, n_columns=None):
+        """Model columns of the given product ids, skipping products the model has not seen.
+
+        With ``n_columns`` (the width of a score vector already computed), columns of
+        products folded in after those scores are skipped too, so every column indexes them.
+        """
+        columns = (self.product_positions.get(normalise_id(product_id)) for product_id in product_ids)
+        columns = np.fromiter((column for column in columns if column is not None), dtype=np.intp)
+        return columns if n_columns is None else columns[columns < n_columns]
+
+    def save(self, directory):
+        """Write the trained factors and id maps as ``.npy`` files plus a ``meta.json``.
+
+        Folded-in users and products are not saved; the next training includes them.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name in ("U", "sigma", "Vt", "user_mean"):
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+        np.save(os.path.join(directory, "user_ids.npy"), np.asarray(self.user_ids))
+        np.save(os.path.join(directory, "product_ids.npy"), np.asarray(self.product_ids[:self.n_trained_products]))
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump(dict(self.meta, version=self.version, k=self.k), f)
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r"):
+        """Load a snapshot written by :meth:`save`; the factor arrays are memory-mapped by default."""
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+                  for name in ("U", "sigma", "Vt", "user_mean")}
+        user_ids = np.load(os.path.join(directory, "user_ids.npy")).tolist()
+        product_ids = np.load(os.path.join(directory, "product_ids.npy")).tolist()
+        return cls(arrays["U"], arrays["sigma"], arrays["Vt"], arrays["user_mean"],
+                   user_ids, product_ids, version=meta.get("version"), meta=meta)
+
+
+def factorize(interaction_store, k=50):
+    """Run ``svds`` on the centred interaction matrix of ``interaction_store``.
+
+    Returns None while there are too few users or products to factorize.
+    """
+    from scipy.sparse.linalg import svds
+
+    started = time.time()
+    matrix = interaction_store.matrix()
+    n_users, n_products = matrix.shape
+    user_ids = interaction_store.user_ids[:n_users]
+    product_ids = interaction_store.product_ids[:n_products]
+
+    k = min(k, min(matrix.shape) - 1)
+    if k < 1:
+        return None
+
+    user_mean = np.asarray(matrix.mean(axis=1)).ravel()
+    U, sigma, Vt = svds(centered_operator(matrix, user_mean), k=k)
+    meta = {
+        "trained_at": started,
+        "train_seconds": time.time() - started,
+        "n_users": n_users,
+        "n_products": n_products,
+        "n_interactions": int(matrix.nnz),
+    }
+    return FactorModel(U, sigma, Vt, user_mean, user_ids, product_ids, meta=meta)
+
+
+def new_version():
+    return datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+
+
+def publish(model, directory=FACTORS_DIR):
+    """Save ``model`` as a new version and atomically point ``CURRENT`` at it."""
+    model.version = model.version or new_version()
+    model.save(os.path.join(directory, model.version))
+    pointer = os.path.join(directory, CURRENT_FILE)
+    with open(pointer + ".tmp", "w") as f:
+        f.write(model.version)
+    os.replace(pointer + ".tmp", pointer)
+    return model.version
+
+
+def current_version(directory=FACTORS_DIR):
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class ModelRegistry:
+    """Holds the live FactorModel and hot-swaps it when a newer version is published.
+
+    The ``CURRENT`` pointer is checked at most every ``check_interval`` seconds, so
+    request handlers can call :meth:`current` on every request.
+    """
+
+    def __init__(self, directory=FACTORS_DIR, check_interval=5.0):
+        self.directory = directory
+        self.check_interval = check_interval
+        self.model = None
+        self._checked_at = None
+
+    def current(self):
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            version = current_version(self.directory)
+            if version is not None and (self.model is None or self.model.version != version):
+                self.model = FactorModel.load(os.path.join(self.directory, version))
+                print(f"Loaded collaborative model version {version}")
+        return self.model
+
+    def publish(self, model):
+        """Save ``model`` as the newest version and start serving it immediately."""
+        publish(model, self.directory)
+        self.model = model
+        return model
+
+
+def fold_in_interaction(model, interaction_store, user_id, product_id):
+    """Refresh ``model`` after ``user_id`` viewed ``product_id``, folding in whichever is new."""
+    if not model.has_product(product_id):
+        model.fold_in_item(product_id, interaction_store.product_users(product_id))
+    model.fold_in_user(user_id, interaction_store.user_products(user_id))
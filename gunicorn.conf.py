@@ -0,0 +1,43 @@
+"""Gunicorn settings for serving app.py with the recommendation artifacts shared across workers.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+With ``preload_app`` the master imports app.py once and warms it up, loading the
+catalog, the content and name indexes and the published factor model, and then
+forks the workers. The catalog, TF-IDF matrix and factors are memory-mapped files, so
+every worker maps the same page-cache pages. Objects built in Python (the name
+index, the IVF lists) are inherited copy-on-write, and ``gc.freeze`` keeps the
+collector from writing to them and un-sharing their pages.
+Set GUNICORN_PRELOAD=0 to load everything separately in each worker.
+"""
+import gc
+import os
+import sys
+
+bind = os.environ.get("GUNICORN_BIND", "127.0.0.1:5000")
+workers = int(os.environ.get("GUNICORN_WORKERS", 4))
+threads = int(os.environ.get("GUNICORN_THREADS", 1))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") != "0"
+
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+    import app as app_module
+
+    # Everything app.py loads lazily is loaded here instead, in the master, so the workers inherit it
+    app_module.warm_up(app_module.app)
+    gc.collect()
+    gc.freeze()
+    server.log.info("Recommendation artifacts loaded before forking workers")
+
+
+def post_fork(server, worker):
+    if "app" not in sys.modules:
+        return
+    from database import db
+
+    # Connections opened by the master must not be shared with the workers; each opens its own
+    with sys.modules["app"].app.app_context():
+        db.engine.dispose(close=False)
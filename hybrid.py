@@ -0,0 +1,151 @@
+"""Vectorized hybrid scoring over the catalog's positions.
+
+Each signal is a float array with one entry per catalog position and NaN where
+the signal has nothing to say: content similarity for the top candidates of the
+query item, collaborative scores for the products in the factor model (aligned
+through a shared product-id index). Both are normalised, blended with weights
+and ranked with a single top-k over the blended array.
+"""
+import numpy as np
+
+from metrics import span
+from ranking import top_k_indices
+
+MINMAX, ZSCORE, RRF = "minmax", "zscore", "rrf"
+RRF_K = 60
+
+
+class ProductIndex:
+    """Maps product ids to live catalog positions with a sorted id array, no per-product Python objects."""
+
+    def __init__(self, product_ids, deleted=None):
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        live = np.flatnonzero(~deleted) if deleted is not None and deleted.any() else np.arange(len(product_ids))
+        order = np.argsort(product_ids[live], kind="stable")
+        self.sorted_ids = product_ids[live][order]
+        self.sorted_positions = live[order]
+        self._model = (None, 0, None)
+
+    def positions(self, product_ids):
+        """Catalog position of each id in ``product_ids``, -1 where the product is not in the catalog."""
+        if not isinstance(product_ids, np.ndarray):
+            product_ids = [_as_int(product_id) for product_id in product_ids]
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        if len(self.sorted_ids) == 0:
+            return np.full(len(product_ids), -1, dtype=np.int64)
+        found = np.minimum(np.searchsorted(self.sorted_ids, product_ids), len(self.sorted_ids) - 1)
+        return np.where(self.sorted_ids[found] == product_ids, self.sorted_positions[found], -1)
+
+    def model_positions(self, factor_model):
+        """Catalog position of every factor-model column, cached until the model changes or folds in products."""
+        model, n_products, positions = self._model
+        if model is not factor_model or n_products != len(factor_model.product_ids):
+            n_products = len(factor_model.product_ids)
+            positions = self.positions(factor_model.product_ids[:n_products])
+            self._model = (factor_model, n_products, positions)
+        return positions
+
+
+def _as_int(product_id):
+    try:
+        return int(product_id)
+    except (TypeError, ValueError):
+        return -1
+
+
+# One product index for the most recent content snapshot; rebuilt when the snapshot changes
+_product_index = (None, None)
+
+
+def product_index_for(train_data, content_index):
+    global _product_index
+    cached_for, index = _product_index
+    if cached_for is not content_index:
+        index = ProductIndex(train_data['id'].to_numpy(), content_index.deleted)
+        _product_index = (content_index, index)
+    return index
+
+
+def normalize_scores(scores, method=MINMAX, depth=None):
+    """Normalise one signal; NaN entries get the signal's lowest normalised value (no contribution for RRF).
+
+    ``minmax`` scales to [0, 1], ``zscore`` standardises, and ``rrf`` replaces the
+    ``depth`` best scores by ``1 / (RRF_K + rank)``.
+    """
+    present = ~np.isnan(scores)
+    normalised = np.zeros(len(scores))
+    if not present.any():
+        return normalised
+    values = scores[present]
+    if method == MINMAX:
+        spread = values.max() - values.min()
+        normalised[present] = (values - values.min()) / spread if spread > 0 else 1.0
+    elif method == ZSCORE:
+        std = values.std()
+        standardised = (values - values.mean()) / std if std > 0 else np.zeros(len(values))
+        normalised[:] = standardised.min()
+        normalised[present] = standardised
+    elif method == RRF:
+        best = top_k_indices(np.where(present, scores, -np.inf), depth or len(values))
+        normalised[best] = 1.0 / (RRF_K + 1 + np.arange(len(best)))
+    else:
+        raise ValueError(f"Unknown normalization '{method}', expected one of {MINMAX}, {ZSCORE}, {RRF}")
+    return normalised
+
+
+def hybrid_scores(n_positions, content=None, collaborative=None, content_weight=0.5, collaborative_weight=0.5,
+                  normalization=MINMAX, depth=None):
+    """Blend two aligned signals (arrays of length ``n_positions`` with NaN for missing, or None)."""
+    blended = np.zeros(n_positions)
+    has_signal = np.zeros(n_positions, dtype=bool)
+    for signal, weight in ((content, content_weight), (collaborative, collaborative_weight)):
+        if signal is None:
+            continue
+        blended += weight * normalize_scores(signal, normalization, depth)
+        has_signal |= ~np.isnan(signal)
+    return blended, has_signal
+
+
+def hybrid_rank(content_index, train_data, backend, name_index, item_name, factor_model, user_id, top_n=10,
+                content_weight=0.5, collaborative_weight=0.5, normalization=MINMAX, candidates=100, seen=()):
+    """Catalog positions of the ``top_n`` best blended products, best first, and their blended scores.
+
+    The content signal covers the ``candidates`` items most similar to ``item_name``,
+    or as many as a neighbour table backend holds if that is fewer; the collaborative
+    signal covers every product the model scores for ``user_id`` except those in
+    ``seen``. Either may be missing (unknown item or user).
+    """
+    n_positions = content_index.shape[0]
+    depth = max(candidates, top_n)
+    # Deeper than a neighbour table's width, every search would fall back to scoring the whole catalog
+    search_depth = max(min(depth, getattr(backend, "max_depth", depth)), top_n)
+
+    content = None
+    exclude = np.zeros(n_positions, dtype=bool)
+    with span("content_search"):
+        item_position = name_index.resolve(item_name)
+        if item_position is not None:
+            positions, scores = backend.search(item_position, search_depth)
+            content = np.full(n_positions, np.nan)
+            content[positions] = scores
+            exclude[item_position] = True
+
+    collaborative = None
+    if factor_model is not None and factor_model.has_user(user_id):
+        with span("collaborative_score"):
+            predicted = factor_model.score_user(user_id)
+        with span("hybrid_align"):
+            index = product_index_for(train_data, content_index)
+            columns = index.model_positions(factor_model)[:len(predicted)]
+            valid = columns >= 0
+            valid[factor_model.product_columns(seen, len(valid))] = False
+            collaborative = np.full(n_positions, np.nan)
+            collaborative[columns[valid]] = predicted[:len(columns)][valid]
+
+    with span("hybrid_blend"):
+        blended, has_signal = hybrid_scores(n_positions, content, collaborative, content_weight, collaborative_weight,
+                                            normalization, depth)
+        if content_index.n_deleted:
+            exclude |= content_index.deleted
+        best = top_k_indices(blended, top_n, exclude=exclude | ~has_signal)
+    return best, blended[best]
@@ -0,0 +1,129 @@
+import atexit
+import threading
+import time
+import traceback
+
+
+class InteractionBuffer:
+    """Write-behind queue for product views.
+
+    ``add`` only bumps an in-memory counter, coalescing repeated views of the same
+    (user_id, product_id) pair. A background thread hands the accumulated counts to
+    ``flush`` once ``max_pending`` views are waiting or ``max_delay`` seconds have
+    passed, whichever comes first, so at most that many views are at risk if the
+    process dies. Pending views are flushed at interpreter exit. ``max_delay=0``
+    writes every view through synchronously, and ``add`` raises if that write fails.
+    A failed flush keeps its views for the next one, until ``max_retries`` flushes
+    in a row have failed; from then on failed views are dropped and counted.
+    """
+
+    def __init__(self, flush, max_pending=500, max_delay=1.0, max_retries=5):
+        self._flush = flush
+        self.max_pending = max_pending
+        self.max_delay = max_delay
+        self.max_retries = max_retries
+        self._failures = 0
+        self._pending = {}
+        self._pending_views = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._closed = False
+        self.stats = {"views": 0, "flushes": 0, "rows_flushed": 0, "flush_errors": 0, "views_dropped": 0}
+        atexit.register(self.close)
+
+    def add(self, user_id, product_id, count=1):
+        key = (user_id, product_id)
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + count
+            self._pending_views += count
+            self.stats["views"] += count
+            full = self._pending_views >= self.max_pending
+
+        if self.max_delay <= 0:
+            try:
+                self.flush(raise_errors=True)
+            except Exception:
+                # The caller reports the failure, so this view is not also retried by a later flush
+                self._discard(key, count)
+                raise
+            return
+        if self._closed:
+            self.flush()
+            return
+        self._ensure_thread()
+        if full:
+            self._wake.set()
+
+    def _ensure_thread(self):
+        # Also restarts the thread in a forked worker, where the parent's thread does not exist
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="interaction-flush", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.max_delay)
+            self._wake.clear()
+            self.flush()
+
+    def _discard(self, key, count):
+        with self._lock:
+            # The failed flush may have dropped the view already rather than keeping it
+            pending = self._pending.get(key, 0)
+            if pending > count:
+                self._pending[key] = pending - count
+            else:
+                self._pending.pop(key, None)
+            self._pending_views -= min(count, pending)
+
+    def flush(self, raise_errors=False):
+        """Write all pending increments now; on failure they are kept and retried on the next flush, or
+        dropped after ``max_retries`` failures in a row (and, with ``raise_errors``, the exception is raised)."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                views, self._pending_views = self._pending_views, 0
+            if not batch:
+                return 0
+
+            started = time.perf_counter()
+            try:
+                self._flush(batch)
+            except Exception:
+                traceback.print_exc()
+                with self._lock:
+                    self._failures += 1
+                    self.stats["flush_errors"] += 1
+                    if self._failures >= self.max_retries:
+                        self.stats["views_dropped"] += views
+                        print(f"Dropped {views} buffered views after {self._failures} failed flushes in a row")
+                    else:
+                        for key, count in batch.items():
+                            self._pending[key] = self._pending.get(key, 0) + count
+                        self._pending_views += views
+                if raise_errors:
+                    raise
+                return 0
+
+            with self._lock:
+                self._failures = 0
+                self.stats["flushes"] += 1
+                self.stats["rows_flushed"] += len(batch)
+                self.stats["last_flush_seconds"] = time.perf_counter() - started
+            return len(batch)
+
+    @property
+    def pending(self):
+        return self._pending_views
+
+    def close(self):
+        """Stop the background thread and flush whatever is still pending."""
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self.flush()
@@ -0,0 +1,136 @@
+import threading
+
+import numpy as np
+from scipy import sparse
+
+
+def normalise_id(value):
+    """User and product ids arrive as ints from the database and as strings from JSON."""
+    if isinstance(value, str) and value.strip().lstrip('-').isdigit():
+        return int(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    return value
+
+
+class InteractionStore:
+    """In-process user x product interaction counts backed by a SciPy CSR matrix.
+
+    Loaded once from ``UserInteraction`` and kept current by ``increment``, so the
+    recommenders never re-read the interaction table or pivot it into a dense frame.
+    Increments of an existing (user, product) pair are written straight into the
+    CSR data array; new pairs are merged into the matrix on the next read.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.loaded = False
+        self.user_ids = []
+        self.product_ids = []
+        self.user_positions = {}
+        self.product_positions = {}
+        self._counts = {}
+        self._user_items = {}
+        self._product_users = {}
+        self._matrix = None
+        self.version = 0
+
+    @classmethod
+    def from_rows(cls, rows):
+        store = cls()
+        store.load(rows)
+        return store
+
+    def load(self, rows):
+        """Fill the store from ``(user_id, product_id, interaction_count)`` rows, once."""
+        with self._lock:
+            if self.loaded:
+                return
+            for user_id, product_id, count in rows:
+                self._add(user_id, product_id, count or 0)
+            self.loaded = True
+
+    def _position(self, value, ids, positions):
+        value = normalise_id(value)
+        position = positions.get(value)
+        if position is None:
+            position = len(ids)
+            positions[value] = position
+            ids.append(value)
+        return position
+
+    def _add(self, user_id, product_id, count):
+        row = self._position(user_id, self.user_ids, self.user_positions)
+        col = self._position(product_id, self.product_ids, self.product_positions)
+        key = (row, col)
+        if key in self._counts:
+            self._counts[key] += count
+            if self._matrix is not None:
+                self._update_in_place(row, col, count)
+        else:
+            self._counts[key] = count
+            self._matrix = None
+        self._user_items.setdefault(row, {})[col] = self._counts[key]
+        self._product_users.setdefault(col, {})[row] = self._counts[key]
+        self.version += 1
+
+    def _update_in_place(self, row, col, count):
+        start, end = self._matrix.indptr[row], self._matrix.indptr[row + 1]
+        offset = start + np.searchsorted(self._matrix.indices[start:end], col)
+        self._matrix.data[offset] += count
+
+    def increment(self, user_id, product_id, count=1):
+        """Record ``count`` more views of ``product_id`` by ``user_id``."""
+        with self._lock:
+            self._add(user_id, product_id, count)
+
+    def matrix(self):
+        """The users x products CSR matrix, rebuilt only after new pairs were added."""
+        with self._lock:
+            if self._matrix is None:
+                shape = (len(self.user_ids), len(self.product_ids))
+                if self._counts:
+                    rows, cols = zip(*self._counts.keys())
+                    values = np.fromiter(self._counts.values(), dtype=np.float64, count=len(self._counts))
+                else:
+                    rows, cols, values = (), (), np.zeros(0)
+                matrix = sparse.csr_matrix((values, (rows, cols)), shape=shape)
+                matrix.sort_indices()
+                self._matrix = matrix
+            return self._matrix
+
+    def has_user(self, user_id):
+        return normalise_id(user_id) in self.user_positions
+
+    def user_index(self, user_id):
+        return self.user_positions.get(normalise_id(user_id))
+
+    def product_index(self, product_id):
+        return self.product_positions.get(normalise_id(product_id))
+
+    def user_items(self, user_id):
+        """``{product column: count}`` for one user, without touching the matrix."""
+        row = self.user_index(user_id)
+        if row is None:
+            return {}
+        with self._lock:
+            return dict(self._user_items.get(row, {}))
+
+    def user_products(self, user_id):
+        """``{product_id: count}`` for one user."""
+        return {self.product_ids[col]: count for col, count in self.user_items(user_id).items()}
+
+    def product_users(self, product_id):
+        """``{user_id: count}`` for one product."""
+        col = self.product_index(product_id)
+        if col is None:
+            return {}
+        with self._lock:
+            return {self.user_ids[row]: count for row, count in self._product_users.get(col, {}).items()}
+
+    def seen_products(self, user_id):
+        """Ids of the products ``user_id`` has already viewed."""
+        return [self.product_ids[col] for col in self.user_items(user_id)]
+
+    def __len__(self):
+        return len(self._counts)
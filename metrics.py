@@ -0,0 +1,244 @@
+"""Request and stage instrumentation, exposed in the Prometheus text format at /metrics.
+
+``span(stage)`` times a block: the duration goes into the
+``recommender_stage_duration_seconds`` histogram and, inside a request, into that
+request's ``Server-Timing`` header. :func:`init_app` counts requests and errors
+per route, records their latency, and optionally hands slow requests to the
+:class:`SamplingProfiler`, which writes their stacks in the folded format read by
+flamegraph.pl and speedscope.
+
+Metrics live in the process that records them; under gunicorn each worker
+reports its own.
+"""
+import bisect
+import os
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_text(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_label_text(self.labels, key)} {value}"
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, tuple(labels), tuple(buckets)
+        # label values -> (count per bucket with +Inf last, sum)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                yield f"{self.name}_bucket{_label_text(self.labels, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_label_text(self.labels, key)} {total}"
+            yield f"{self.name}_count{_label_text(self.labels, key)} {cumulative}"
+
+
+REQUESTS = Counter("recommender_requests_total", "HTTP requests by route, method and status.", ("route", "method", "status"))
+ERRORS = Counter("recommender_errors_total", "Unhandled exceptions by route and exception type.", ("route", "exception"))
+REQUEST_SECONDS = Histogram("recommender_request_duration_seconds", "HTTP request latency by route.", ("route",))
+STAGE_SECONDS = Histogram("recommender_stage_duration_seconds", "Latency of the stages timed with metrics.span.", ("stage",))
+METRICS = [REQUESTS, ERRORS, REQUEST_SECONDS, STAGE_SECONDS]
+
+
+def register(metric):
+    """Add a Counter or Histogram defined elsewhere to the /metrics output."""
+    METRICS.append(metric)
+    return metric
+
+
+# Callables returning [(name, help, value, {label: value}), ...], read as gauges at scrape time
+_collectors = []
+
+
+def register_collector(collect):
+    _collectors.append(collect)
+    return collect
+
+
+def render():
+    """All metrics and collector gauges in the Prometheus text exposition format."""
+    lines = [line for metric in METRICS for line in metric.render()]
+    described = set()
+    for collect in _collectors:
+        try:
+            samples = list(collect())
+        except Exception as e:
+            print(f"Metrics collector {getattr(collect, '__name__', collect)} failed: {e}")
+            continue
+        for name, help, value, labels in samples:
+            if value is None or isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            if name not in described:
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+                described.add(name)
+            lines.append(f"{name}{_label_text(labels, labels.values())} {value}")
+    return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def span(stage):
+    """Time a block as ``stage`` in the stage histogram and the current request's Server-Timing."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        if has_request_context() and "stages" in g:
+            g.stages[stage] = g.stages.get(stage, 0.0) + elapsed
+
+
+def server_timing(stages):
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in stages.items())
+
+
+class SamplingProfiler:
+    """Samples the stacks of in-flight requests every ``interval`` seconds and keeps those of slow ones.
+
+    One background thread reads ``sys._current_frames()`` for the threads that
+    registered with :meth:`begin`; :meth:`end` writes the folded stacks
+    (``outer;inner count`` per line) of a request that took at least ``threshold``
+    seconds to ``directory``.
+    """
+
+    def __init__(self, directory="profiles", threshold=1.0, interval=0.005):
+        self.directory = directory
+        self.threshold = threshold
+        self.interval = interval
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.stats = {"samples": 0, "profiles_written": 0}
+
+    def _ensure_thread(self):
+        # Also restarts the thread in a forked worker, where the parent's thread does not exist
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+                    self._thread.start()
+
+    def begin(self):
+        self._ensure_thread()
+        with self._lock:
+            self._active[threading.get_ident()] = StackCounter()
+
+    def end(self, name, seconds):
+        with self._lock:
+            stacks = self._active.pop(threading.get_ident(), None)
+        if not stacks or seconds < self.threshold:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{name.strip('/').replace('/', '_') or 'root'}-{int(seconds * 1000)}ms.folded")
+        with open(path, "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        self.stats["profiles_written"] += 1
+        return path
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                active = list(self._active.items())
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for thread_id, stacks in active:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    stacks[_fold(frame)] += 1
+                    self.stats["samples"] += 1
+
+
+def _fold(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def init_app(app, profiler=None):
+    """Count and time every request of ``app``, add Server-Timing headers, and profile slow requests."""
+    from flask import got_request_exception
+
+    def route():
+        return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+    @app.before_request
+    def start_request():
+        g.started = time.perf_counter()
+        g.stages = {}
+        if profiler is not None:
+            profiler.begin()
+
+    @app.after_request
+    def finish_request(response):
+        if "started" not in g:
+            return response
+        seconds = time.perf_counter() - g.started
+        REQUESTS.inc(route=route(), method=request.method, status=response.status_code)
+        REQUEST_SECONDS.observe(seconds, route=route())
+        response.headers["Server-Timing"] = server_timing(dict(g.stages, total=seconds))
+        if profiler is not None:
+            path = profiler.end(route(), seconds)
+            if path is not None:
+                print(f"Slow request {request.method} {request.path} ({seconds * 1000:.0f} ms), stacks written to '{path}'")
+        return response
+
+    def count_exception(sender, exception, **extra):
+        ERRORS.inc(route=route(), exception=type(exception).__name__)
+
+    got_request_exception.connect(count_exception, app, weak=False)
@@ -0,0 +1,130 @@
+import copy
+from collections import defaultdict
+
+import numpy as np
+
+EXACT, PREFIX, SUBSTRING = 0, 1, 2
+MATCH_KINDS = {EXACT: "exact", PREFIX: "prefix", SUBSTRING: "substring"}
+
+
+def _ngrams(text, n):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class NameIndex:
+    """Case-insensitive product-name resolver built once when the catalog is loaded.
+
+    Keeps the lower-cased names, an exact-name lookup and an n-gram inverted index,
+    so a query only verifies the few names that share all of its n-grams. Names
+    added or removed since the build live in a small delta layered over these
+    (like ``ContentIndex.delta``); rebuilding the index merges it.
+    """
+
+    def __init__(self, names, ngram=3):
+        self.ngram = ngram
+        self.names = [str(name) for name in names]
+        self.lowered = [name.lower() for name in self.names]
+
+        self.exact = {}
+        postings = defaultdict(list)
+        for position, name in enumerate(self.lowered):
+            self.exact.setdefault(name, position)
+            for gram in _ngrams(name, ngram):
+                postings[gram].append(position)
+        self.postings = {gram: np.asarray(positions, dtype=np.int64) for gram, positions in postings.items()}
+
+        # Delta: names appended after the built ones, their exact lookup and postings, and removed positions
+        self.added = []
+        self.added_lowered = []
+        self.added_exact = {}
+        self.added_postings = {}
+        self.removed = frozenset()
+
+    def __len__(self):
+        return len(self.names) + len(self.added)
+
+    def name(self, position):
+        return self.names[position] if position < len(self.names) else self.added[position - len(self.names)]
+
+    def _lowered(self, position):
+        # An empty name never equals, starts with or contains a non-empty query
+        if position in self.removed:
+            return ""
+        return self.lowered[position] if position < len(self.lowered) else self.added_lowered[position - len(self.lowered)]
+
+    def with_updates(self, added=(), removed=()):
+        """A copy with the ``added`` ``(position, name)`` pairs indexed and the ``removed`` positions unmatchable.
+
+        Added positions must continue the catalog (``len(self)``, ``len(self) + 1``, ...).
+        Only the delta is copied; the built lists and postings are shared. This index
+        is left unchanged, so requests still using it are unaffected.
+        """
+        index = copy.copy(self)
+        index.added = list(self.added)
+        index.added_lowered = list(self.added_lowered)
+        index.added_exact = dict(self.added_exact)
+        index.added_postings = dict(self.added_postings)
+        index.removed = self.removed.union(removed)
+
+        for position, name in added:
+            name = str(name)
+            index.added.append(name)
+            index.added_lowered.append(name.lower())
+            index.added_exact.setdefault(name.lower(), position)
+            for gram in _ngrams(name.lower(), self.ngram):
+                index.added_postings[gram] = index.added_postings.get(gram, ()) + (position,)
+        for name, position in list(index.added_exact.items()):
+            if position in index.removed:
+                del index.added_exact[name]
+        return index
+
+    def _substring_candidates(self, query):
+        if len(query) < self.ngram:
+            return range(len(self))
+
+        lists = []
+        for gram in _ngrams(query, self.ngram):
+            base, added = self.postings.get(gram), self.added_postings.get(gram)
+            if base is None and added is None:
+                return []
+            if added is None:
+                lists.append(base)
+            else:
+                added = np.asarray(added, dtype=np.int64)
+                lists.append(added if base is None else np.concatenate([base, added]))
+        lists.sort(key=len)
+        positions = lists[0]
+        for other in lists[1:]:
+            positions = np.intersect1d(positions, other, assume_unique=True)
+            if len(positions) == 0:
+                break
+        return positions.tolist()
+
+    def search(self, query, limit=10):
+        """Return up to ``limit`` ``(position, kind)`` matches, exact before prefix before substring."""
+        query = (query or "").lower()
+        if not query:
+            return []
+
+        matches = []
+        for position in self._substring_candidates(query):
+            name = self._lowered(position)
+            if name == query:
+                matches.append((EXACT, position))
+            elif name.startswith(query):
+                matches.append((PREFIX, position))
+            elif query in name:
+                matches.append((SUBSTRING, position))
+        matches.sort()
+        return [(position, kind) for kind, position in matches[:limit]]
+
+    def resolve(self, query):
+        """Return the catalog position of the best match for ``query``, or None."""
+        if query is None:
+            return None
+        query_lower = query.lower()
+        position = self.exact.get(query_lower, self.added_exact.get(query_lower))
+        if position is not None and position not in self.removed:
+            return position
+        matches = self.search(query, limit=1)
+        return matches[0][0] if matches else None
@@ -0,0 +1,208 @@
+"""Precomputed top-K content neighbours for every catalog item, served by lookup.
+
+    python neighbours.py --k 100 --workers 8
+
+The offline build scores the saved content index against itself in blocks of rows
+(one sparse block product each) spread over a process pool, and keeps the ``k``
+best neighbours per item in two arrays, ``indices`` (int32) and ``scores``
+(float32), of shape ``(n_items, k)``. The service memory-maps them, so a request
+for a catalog item is a row lookup; items appended since the build, requests for
+more than ``k`` neighbours and catalogs the table no longer matches fall back to
+the live similarity backend. A refit checkpoint (see catalog_updates.py) gets a
+table of its own, built with the refit, so refits keep the lookups; run by hand,
+the build writes the latest checkpoint's table when there is one.
+"""
+import copy
+import json
+import os
+
+import numpy as np
+
+from ranking import top_k_indices, top_k_rows
+
+NEIGHBOURS_DIR = "models/neighbours"
+
+# Content index opened once per build worker by _init_worker
+_worker = {}
+
+
+def _init_worker(content_index_dir):
+    from content_index import ContentIndex
+
+    _worker["index"] = ContentIndex.load(content_index_dir)
+
+
+def _block_neighbours(block, k=None):
+    """Top-``k`` neighbours of the items ``block = (start, stop)``, excluding each item itself."""
+    start, stop = block
+    index = _worker["index"]
+    scores = index.similarities_block(np.arange(start, stop))
+    rows = np.arange(stop - start)
+    indices, best = top_k_rows(scores, k, exclude=(rows, rows + start))
+    return start, indices.astype(np.int32), best.astype(np.float32)
+
+
+def build_neighbours(content_index_dir, directory=NEIGHBOURS_DIR, k=100, workers=1, block_size=1024):
+    """Compute the neighbour table of the index saved in ``content_index_dir`` and write it to ``directory``."""
+    from concurrent.futures import ProcessPoolExecutor
+    from functools import partial
+
+    from content_index import ContentIndex
+    from util import MAX_BLOCK_CELLS
+
+    index = ContentIndex.load(content_index_dir)
+    n_items = index.shape[0]
+    k = max(1, min(k, n_items - 1))
+    block_size = max(1, min(block_size, MAX_BLOCK_CELLS // max(n_items, 1)))
+    blocks = [(start, min(start + block_size, n_items)) for start in range(0, n_items, block_size)]
+
+    os.makedirs(directory, exist_ok=True)
+    # Written under temporary names and renamed at the end, so a running service never maps a half-written table
+    indices = np.lib.format.open_memmap(os.path.join(directory, "indices.tmp.npy"), mode="w+", dtype=np.int32, shape=(n_items, k))
+    scores = np.lib.format.open_memmap(os.path.join(directory, "scores.tmp.npy"), mode="w+", dtype=np.float32, shape=(n_items, k))
+
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(content_index_dir,))
+    else:
+        _init_worker(content_index_dir)
+    map_function = executor.map if executor is not None else map
+    try:
+        for done, (start, block_indices, block_scores) in enumerate(map_function(partial(_block_neighbours, k=k), blocks), 1):
+            indices[start:start + len(block_indices)] = block_indices
+            scores[start:start + len(block_scores)] = block_scores
+            if done % 100 == 0 or done == len(blocks):
+                print(f"{min(done * block_size, n_items)}/{n_items} items")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    indices.flush()
+    scores.flush()
+    del indices, scores
+    os.replace(os.path.join(directory, "indices.tmp.npy"), os.path.join(directory, "indices.npy"))
+    os.replace(os.path.join(directory, "scores.tmp.npy"), os.path.join(directory, "scores.npy"))
+    with open(os.path.join(directory, "meta.json"), "w") as f:
+        json.dump({"k": k, "n_items": n_items, "fingerprint": index.fingerprint}, f)
+    return NeighbourTable.load(directory)
+
+
+class NeighbourTable:
+    """The ``(n_items, k)`` neighbour indices and scores of one fitted content index."""
+
+    def __init__(self, indices, scores, fingerprint=None):
+        self.indices = indices
+        self.scores = scores
+        self.fingerprint = fingerprint
+        self.n_items, self.k = indices.shape
+
+    @classmethod
+    def load(cls, directory=NEIGHBOURS_DIR, mmap_mode="r"):
+        """Memory-map the table in ``directory``; None if it has not been built."""
+        if not os.path.exists(os.path.join(directory, "meta.json")):
+            return None
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        return cls(np.load(os.path.join(directory, "indices.npy"), mmap_mode=mmap_mode),
+                   np.load(os.path.join(directory, "scores.npy"), mmap_mode=mmap_mode), meta.get("fingerprint"))
+
+    def matches(self, content_index):
+        """Whether the table was built from the fitted rows of ``content_index``."""
+        return self.fingerprint == content_index.fingerprint and self.n_items == content_index.matrix.shape[0]
+
+
+class NeighbourBackend:
+    """Similarity search answered from a :class:`NeighbourTable`, with ``live`` as the fallback.
+
+    Tombstoned neighbours are skipped and items appended to the content index since
+    the fit are scored against the query and merged in, so the answer matches the
+    live one as long as at least ``top_n`` of the stored neighbours are still live.
+    """
+
+    name = "neighbours"
+
+    def __init__(self, table, live):
+        self.table = table
+        self.live = live
+        self.index = live.index
+        self.stats = {"lookups": 0, "fallbacks": 0}
+
+    @property
+    def max_depth(self):
+        """The most neighbours :meth:`search` answers from the table."""
+        return self.table.k
+
+    def with_index(self, content_index):
+        backend = copy.copy(self)
+        backend.live = self.live.with_index(content_index)
+        backend.index = content_index
+        return backend
+
+    def search(self, item_index, top_n=10):
+        """Return the ``top_n`` most similar item positions and their scores."""
+        if item_index >= self.table.n_items or top_n > self.table.k:
+            self.stats["fallbacks"] += 1
+            return self.live.search(item_index, top_n)
+
+        positions = np.asarray(self.table.indices[item_index], dtype=np.int64)
+        scores = np.asarray(self.table.scores[item_index], dtype=np.float64)
+        if self.index.n_deleted:
+            live = ~self.index.deleted[positions]
+            if live.sum() < top_n and not live.all():
+                # Too many stored neighbours were removed; the next ones are not in the table
+                self.stats["fallbacks"] += 1
+                return self.live.search(item_index, top_n)
+            positions, scores = positions[live], scores[live]
+
+        n_appended = self.index.delta.shape[0]
+        if n_appended:
+            appended = (self.index.delta @ self.index.rows([item_index]).T).toarray().ravel()
+            appended_positions = np.arange(self.table.n_items, self.table.n_items + n_appended)
+            if self.index.n_deleted:
+                appended[self.index.deleted[appended_positions]] = -np.inf
+            positions = np.concatenate([positions, appended_positions])
+            scores = np.concatenate([scores, appended])
+
+        self.stats["lookups"] += 1
+        best = top_k_indices(scores, top_n)
+        return positions[best].tolist(), scores[best].tolist()
+
+
+def make_backend(name, content_index, table=None, **options):
+    """The ``name`` similarity backend, answered from ``table`` while it matches ``content_index``."""
+    from similarity import make_backend as make_live_backend
+
+    live = make_live_backend(name, content_index, **options)
+    if table is not None and table.matches(content_index):
+        return NeighbourBackend(table, live)
+    return live
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from catalog_store import CATALOG_CSV, load_catalog
+    from catalog_updates import CHECKPOINT_DIR, read_checkpoint
+    from content_index import CONTENT_INDEX_DIR, load_content_index
+
+    parser = argparse.ArgumentParser(description="Precompute the top-K content neighbours of every catalog item.")
+    parser.add_argument("--catalog", default=CATALOG_CSV)
+    parser.add_argument("--content-index", help=f"default: the latest refit checkpoint's, else {CONTENT_INDEX_DIR}")
+    parser.add_argument("--output", help=f"default: next to the checkpoint's content index, else {NEIGHBOURS_DIR}")
+    parser.add_argument("--checkpoint-dir", default=os.environ.get("CONTENT_CHECKPOINT_DIR", CHECKPOINT_DIR))
+    parser.add_argument("--k", type=int, default=100, help="neighbours kept per item (at least HYBRID_CANDIDATES)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--block-size", type=int, default=1024, help="items scored per sparse block product")
+    args = parser.parse_args()
+
+    checkpoint = read_checkpoint(args.checkpoint_dir) if args.content_index is None and args.checkpoint_dir else None
+    if checkpoint is not None:
+        # The service serves the latest refit (see catalog_updates.py), which loads the table kept beside its index
+        path = os.path.join(args.checkpoint_dir, checkpoint["name"])
+        content_index_dir, output = os.path.join(path, "content_index"), args.output or os.path.join(path, "neighbours")
+    else:
+        content_index_dir, output = args.content_index or CONTENT_INDEX_DIR, args.output or NEIGHBOURS_DIR
+        # Makes sure the saved content index matches the catalog the service will load
+        load_content_index(load_catalog(args.catalog), content_index_dir)
+    table = build_neighbours(content_index_dir, output, k=args.k, workers=args.workers, block_size=args.block_size)
+    print(f"Neighbour table of {table.n_items} items x {table.k} written to '{output}'")
@@ -0,0 +1,52 @@
+import numpy as np
+
+
+def top_k_indices(scores, k, exclude=None):
+    """Positions of the ``k`` highest ``scores``, best first.
+
+    ``exclude`` is a boolean mask or an array of positions that must not be returned
+    (the query item, products the user has already seen). Selection is an
+    ``np.argpartition`` over the whole array followed by a sort of only the ``k``
+    winners, so ranking stays O(n) and never builds per-item Python objects.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    if exclude is not None and np.size(exclude):
+        scores = scores.copy()
+        scores[exclude] = -np.inf
+        available = int(np.count_nonzero(scores != -np.inf))
+    else:
+        available = len(scores)
+
+    k = min(int(k), available)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def top_k_rows(scores, k, exclude=None):
+    """Row-wise :func:`top_k_indices` for a block of score vectors.
+
+    ``exclude`` is a boolean mask or a ``(rows, columns)`` pair of index arrays.
+    Returns ``(indices, scores)``, both of shape ``(n_rows, k)`` and best first;
+    excluded positions that still had to fill a row come back with ``-inf``.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    if exclude is not None and np.size(exclude):
+        scores = scores.copy()
+        scores[exclude] = -np.inf
+
+    n_rows, n_columns = scores.shape
+    k = min(int(k), n_columns)
+    if k <= 0:
+        return np.empty((n_rows, 0), dtype=np.intp), np.empty((n_rows, 0))
+    if k < n_columns:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(n_columns), (n_rows, n_columns))
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
@@ -0,0 +1,165 @@
+import copy
+import time
+
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import TruncatedSVD
+from sklearn.preprocessing import normalize
+
+from ranking import top_k_indices
+
+
+class ExactBackend:
+    """Exact cosine search: scores the query item against every item in the catalog."""
+
+    name = "exact"
+
+    def __init__(self, content_index):
+        self.index = content_index
+
+    def with_index(self, content_index):
+        """The same backend over an incrementally updated ``content_index``."""
+        return ExactBackend(content_index)
+
+    def search(self, item_index, top_n=10):
+        """Return the ``top_n`` most similar item positions and their scores."""
+        scores = self.index.similarities(item_index)
+        best = top_k_indices(scores, top_n, exclude=[item_index])
+        best = best[scores[best] != -np.inf]
+        return best.tolist(), scores[best].tolist()
+
+
+class IVFBackend:
+    """Approximate search with an inverted-file index over TruncatedSVD-reduced TF-IDF vectors.
+
+    Items are clustered in the reduced space; a query only visits the ``n_probe``
+    closest clusters and re-ranks those candidates with the exact TF-IDF cosine.
+    Items appended to the content index after the clusters were built are always
+    candidates, until the backend is rebuilt after the next refit.
+    """
+
+    name = "ivf"
+
+    def __init__(self, content_index, n_components=128, n_lists=None, n_probe=8, random_state=0):
+        self.index = content_index
+        self.n_probe = n_probe
+        n_items, n_features = content_index.matrix.shape
+
+        self.svd = TruncatedSVD(n_components=max(1, min(n_components, n_features - 1)), random_state=random_state)
+        self.reduced = normalize(self.svd.fit_transform(content_index.matrix)).astype(np.float32)
+
+        if n_lists is None:
+            n_lists = int(np.sqrt(n_items))
+        n_lists = max(1, min(n_lists, n_items))
+        kmeans = MiniBatchKMeans(n_clusters=n_lists, random_state=random_state, n_init=3)
+        labels = kmeans.fit_predict(self.reduced)
+        self.centroids = normalize(kmeans.cluster_centers_).astype(np.float32)
+
+        # Inverted lists as one array of item positions sorted by cluster plus offsets
+        self.order = np.argsort(labels, kind="stable")
+        self.offsets = np.searchsorted(labels[self.order], np.arange(n_lists + 1))
+
+    def with_index(self, content_index):
+        """The same clusters over an incrementally updated ``content_index``."""
+        backend = copy.copy(self)
+        backend.index = content_index
+        return backend
+
+    def _reduced(self, item_index):
+        if item_index < len(self.reduced):
+            return self.reduced[item_index]
+        return normalize(self.svd.transform(self.index.rows([item_index])))[0].astype(np.float32)
+
+    def candidates(self, item_index, n_probe=None):
+        """Item positions in the clusters closest to the query item."""
+        n_probe = min(n_probe or self.n_probe, len(self.centroids))
+        centroid_scores = self.centroids @ self._reduced(item_index)
+        probes = np.argpartition(-centroid_scores, n_probe - 1)[:n_probe]
+        lists = [self.order[self.offsets[c]:self.offsets[c + 1]] for c in probes]
+        lists.append(np.arange(len(self.reduced), self.index.shape[0]))
+        candidates = np.concatenate(lists)
+        keep = candidates != item_index
+        if self.index.n_deleted:
+            keep &= ~self.index.deleted[candidates]
+        return candidates[keep]
+
+    def search(self, item_index, top_n=10, n_probe=None):
+        """Return the approximate ``top_n`` most similar item positions and their scores."""
+        candidates = self.candidates(item_index, n_probe)
+        if len(candidates) == 0:
+            return [], []
+        row = self.index.rows([item_index])
+        scores = np.asarray((self.index.rows(candidates) @ row.T).todense()).ravel()
+        best = top_k_indices(scores, top_n)
+        return candidates[best].tolist(), scores[best].tolist()
+
+
+BACKENDS = {
+    ExactBackend.name: ExactBackend,
+    IVFBackend.name: IVFBackend,
+}
+
+
+def make_backend(name, content_index, **options):
+    """Create the similarity backend registered under ``name``."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown similarity backend '{name}', expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name](content_index, **options)
+
+
+def _percentiles(samples):
+    values = np.asarray(samples) * 1000
+    return {f"p{p}_ms": float(np.percentile(values, p)) for p in (50, 95, 99)}
+
+
+def evaluate_backend(backend, exact, item_indices, top_n=10):
+    """Report recall@k of ``backend`` against ``exact`` and the latency of both."""
+    recalls, approx_times, exact_times = [], [], []
+    for item_index in item_indices:
+        start = time.perf_counter()
+        expected, _ = exact.search(item_index, top_n)
+        exact_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        found, _ = backend.search(item_index, top_n)
+        approx_times.append(time.perf_counter() - start)
+
+        if expected:
+            recalls.append(len(set(expected) & set(found)) / len(expected))
+
+    return {
+        "backend": backend.name,
+        "k": top_n,
+        "queries": len(item_indices),
+        f"recall@{top_n}": float(np.mean(recalls)) if recalls else 0.0,
+        "latency": _percentiles(approx_times),
+        "exact_latency": _percentiles(exact_times),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    import pandas as pd
+
+    from content_index import load_content_index
+
+    parser = argparse.ArgumentParser(description="Compare an approximate similarity backend with exact search.")
+    parser.add_argument("--catalog", default="models/final_data.csv")
+    parser.add_argument("--backend", default=IVFBackend.name)
+    parser.add_argument("--n-probe", type=int, default=8)
+    parser.add_argument("--n-lists", type=int, default=None)
+    parser.add_argument("--top-n", type=int, default=10)
+    parser.add_argument("--sample", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    catalog = pd.read_csv(args.catalog)
+    content_index = load_content_index(catalog)
+    options = {"n_probe": args.n_probe, "n_lists": args.n_lists} if args.backend == IVFBackend.name else {}
+    backend = make_backend(args.backend, content_index, **options)
+
+    rng = np.random.default_rng(args.seed)
+    sample = rng.choice(len(catalog), size=min(args.sample, len(catalog)), replace=False)
+    print(json.dumps(evaluate_backend(backend, ExactBackend(content_index), sample, args.top_n), indent=2))
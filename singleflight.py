@@ -0,0 +1,61 @@
+"""Request coalescing: concurrent callers asking for the same key share one computation.
+
+When many requests for the same product arrive together, e.g. for a product
+that has just gone viral, the first one computes the recommendations. The
+others wait for that computation and get its result, rather than each scoring
+the whole catalog in parallel. An exception raised by the computation is raised
+in every caller that was waiting for it. Only computations in flight are shared;
+keeping results afterwards is the response cache's job.
+"""
+import threading
+
+
+class _Call:
+    __slots__ = ("done", "value", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Runs at most one computation per key at a time; callers arriving meanwhile wait for its result."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {"leaders": 0, "coalesced": 0}
+
+    def do(self, key, compute):
+        """Return ``compute()``, or the result of the call already computing ``key``."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.stats["leaders"] += 1
+            else:
+                call.waiters += 1
+                self.stats["coalesced"] += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = compute()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value
+
+    @property
+    def in_flight(self):
+        return len(self._calls)
@@ -0,0 +1,183 @@
+"""Offline tag extraction for the product feed, the step data_cleaning.ipynb runs by hand.
+
+    python tag_pipeline.py walmart_products.tsv --output train_data_with_tags.csv --workers 8
+
+The TSV is read in chunks. Category, Brand and Desc are cleaned with spaCy
+(``nlp.pipe`` in batches, spread over a process pool) and joined into Tags, and
+each chunk is appended to the output as soon as it is done. A SQLite state file
+keeps a content hash and the cleaned text per product id, so later runs only send
+new or changed products through spaCy and reuse the stored result for the rest.
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+COLUMN_NAME_MAPPING = {
+    'Uniq Id': 'ID',
+    'Product Id': 'PID',
+    'Product Rating': 'Rating',
+    'Product Reviews Count': 'ReviewCount',
+    'Product Category': 'Category',
+    'Product Brand': 'Brand',
+    'Product Name': 'Name',
+    'Product Price': 'Price',
+    'Product Image Url': 'ImgURL',
+    'Product Description': 'Desc',
+    'Product Tags': 'Tags',
+}
+FILL_VALUES = {'Rating': 0, 'ReviewCount': 0, 'Price': 100.0, 'Category': '', 'Brand': '', 'Desc': ''}
+COLUMNS_TO_EXTRACT = ['Category', 'Brand', 'Desc']
+
+# spaCy pipeline loaded once per worker process by _init_worker
+_worker = {}
+
+
+def _init_worker(model, batch_size):
+    try:
+        import spacy
+        from spacy.lang.en.stop_words import STOP_WORDS
+    except ImportError:
+        raise SystemExit(f"Tag extraction needs spaCy: pip install spacy && python -m spacy download {model}")
+
+    # Tags only use the token text, so everything after the tokenizer is switched off
+    nlp = spacy.load(model, disable=["tok2vec", "tagger", "parser", "attribute_ruler", "lemmatizer", "ner"])
+    _worker.update(nlp=nlp, stop_words=STOP_WORDS, batch_size=batch_size)
+
+
+def _clean_texts(texts):
+    """clean_and_extract_tags from data_cleaning.ipynb, over a batch of texts with nlp.pipe."""
+    stop_words = _worker["stop_words"]
+    return [
+        ', '.join(token.text for token in doc if token.text.isalnum() and token.text not in stop_words)
+        for doc in _worker["nlp"].pipe((text.lower() for text in texts), batch_size=_worker["batch_size"])
+    ]
+
+
+def content_hash(row):
+    digest = hashlib.sha1()
+    for column in COLUMNS_TO_EXTRACT:
+        digest.update(str(row[column]).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class TagState:
+    """Content hash and cleaned columns per product id, kept in a SQLite file between runs."""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS product_tags ("
+            " id TEXT PRIMARY KEY, hash TEXT NOT NULL, category TEXT, brand TEXT, descr TEXT)"
+        )
+
+    def lookup(self, ids, chunk_size=500):
+        """``{id: (hash, category, brand, desc)}`` for the ids already processed."""
+        found = {}
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            rows = self.conn.execute(
+                f"SELECT id, hash, category, brand, descr FROM product_tags WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+            found.update((row[0], row[1:]) for row in rows)
+        return found
+
+    def store(self, rows):
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO product_tags (id, hash, category, brand, descr) VALUES (?, ?, ?, ?, ?)", rows)
+
+    def close(self):
+        self.conn.close()
+
+
+def _split(values, parts):
+    size = max(1, -(-len(values) // parts))
+    return [values[start:start + size] for start in range(0, len(values), size)]
+
+
+def _read_chunks(path, chunk_size):
+    chunks = pd.read_csv(path, sep='\t', usecols=list(COLUMN_NAME_MAPPING), dtype={'Uniq Id': str}, chunksize=chunk_size)
+    for chunk in chunks:
+        chunk = chunk.rename(columns=COLUMN_NAME_MAPPING)
+        yield chunk.fillna(FILL_VALUES)
+
+
+def process_chunk(chunk, state, map_function=map, parts=1):
+    """Fill the cleaned Category/Brand/Desc and Tags of ``chunk``, running spaCy only on changed products.
+
+    ``map_function`` is ``map`` or a process pool's ``map``; the changed texts are split into ``parts`` tasks.
+    """
+    ids = chunk['ID'].astype(str).tolist()
+    hashes = [content_hash(row) for row in chunk[COLUMNS_TO_EXTRACT].to_dict(orient="records")]
+    known = state.lookup(ids)
+
+    changed = [i for i, (product_id, digest) in enumerate(zip(ids, hashes)) if product_id not in known or known[product_id][0] != digest]
+    cleaned = {}
+    if changed:
+        texts = [str(chunk[column].iat[i]) for i in changed for column in COLUMNS_TO_EXTRACT]
+        results = [tags for part in map_function(_clean_texts, _split(texts, parts)) for tags in part]
+        width = len(COLUMNS_TO_EXTRACT)
+        cleaned = {i: results[n * width:(n + 1) * width] for n, i in enumerate(changed)}
+        state.store([(ids[i], hashes[i], *cleaned[i]) for i in changed])
+
+    columns = [cleaned[i] if i in cleaned else list(known[ids[i]][1:]) for i in range(len(ids))]
+    for position, column in enumerate(COLUMNS_TO_EXTRACT):
+        chunk[column] = [values[position] for values in columns]
+    chunk['Tags'] = [', '.join(values) for values in columns]
+
+    chunk['ID'] = chunk['ID'].astype(str).str.extract(r'(\d+)', expand=False).astype(float)
+    chunk['PID'] = chunk['PID'].astype(str).str.extract(r'(\d+)', expand=False).astype(float)
+    return chunk, len(changed)
+
+
+def run(path, output, state_path, model="en_core_web_sm", workers=1, chunk_size=10000, batch_size=256):
+    """Tag every product in the TSV at ``path`` and write the result to ``output`` (CSV)."""
+    state = TagState(state_path)
+    partial = f"{output}.partial"
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model, batch_size))
+    else:
+        _init_worker(model, batch_size)
+    map_function = executor.map if executor is not None else map
+
+    total = processed = 0
+    try:
+        for n, chunk in enumerate(_read_chunks(path, chunk_size)):
+            chunk, changed = process_chunk(chunk, state, map_function, parts=workers)
+            chunk.to_csv(partial, mode="w" if n == 0 else "a", header=n == 0, index=False)
+            total += len(chunk)
+            processed += changed
+            print(f"{total} products written, {processed} tagged, {total - processed} unchanged")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        state.close()
+
+    # Readers never see a half-written file
+    os.replace(partial, output)
+    return total, processed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract product tags from the product TSV feed in parallel and incrementally.")
+    parser.add_argument("input", help="product feed TSV (the Walmart export format)")
+    parser.add_argument("--output", default="train_data_with_tags.csv")
+    parser.add_argument("--state", help="SQLite state file (default: <output>.state.sqlite)")
+    parser.add_argument("--model", default="en_core_web_sm", help="spaCy model whose tokenizer is used")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=10000, help="TSV rows read and written at a time")
+    parser.add_argument("--batch-size", type=int, default=256, help="texts per nlp.pipe batch")
+    args = parser.parse_args()
+
+    total, processed = run(args.input, args.output, args.state or f"{args.output}.state.sqlite",
+                           model=args.model, workers=args.workers, chunk_size=args.chunk_size, batch_size=args.batch_size)
+    print(f"Tags for {total} products written to '{args.output}' ({processed} new or changed)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# app.py creates its module-level app on import; keep that one off the real database
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.sqlite')}")
+os.environ.setdefault("INTERACTION_FLUSH_INTERVAL", "0")
@@ -0,0 +1,16 @@
+from cache import RecommendationCache
+
+
+def test_invalidate_user_drops_entry_copied_from_shared_tier(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    # Two workers sharing one SQLite tier
+    first, second = RecommendationCache(shared_path=path), RecommendationCache(shared_path=path)
+    key = RecommendationCache.make_key("collaborative_recommendations", 1, user_id=7)
+
+    first.set(key, [1, 2, 3], user_id=7)
+    assert second.get(key) == [1, 2, 3]
+    assert second.stats["shared_hits"] == 1
+
+    second.invalidate_user(7)
+    assert second.get(key) is None
+    assert first.shared.get(key) is None
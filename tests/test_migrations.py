@@ -0,0 +1,28 @@
+import sqlite3
+
+from app import create_app, fetch_product_changes
+
+# The tables of a database created before product edits were logged
+BASELINE_SCHEMA = """
+CREATE TABLE product (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, quantity INTEGER NOT NULL, price FLOAT NOT NULL,
+                      img VARCHAR(255), category_id INTEGER, factory VARCHAR(100), description VARCHAR(500));
+CREATE TABLE user_interaction (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, product_id INTEGER NOT NULL,
+                               interaction_count INTEGER);
+"""
+
+
+def test_create_app_migrates_database_without_product_change(tmp_path):
+    path = tmp_path / "baseline.sqlite"
+    with sqlite3.connect(path) as conn:
+        conn.executescript(BASELINE_SCHEMA)
+
+    app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}"})
+    response = app.test_client().post("/products", json={"Name": "Lip balm", "Quantity": 3, "Price": 4.5})
+
+    assert response.status_code == 201
+    last_id, changes = fetch_product_changes(app, 0)
+    assert last_id == 1
+    assert changes == [(1, {"Name": "Lip balm", "Factory": None, "Img": None, "Description": None})]
+    with sqlite3.connect(path) as conn:
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert "ux_user_interaction_user_product" in indexes
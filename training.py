@@ -0,0 +1,81 @@
+import argparse
+import os
+import shutil
+import time
+
+from factor_model import FACTORS_DIR, current_version, factorize, publish
+from interaction_store import InteractionStore
+
+
+def load_store_from_database():
+    """Read every UserInteraction row into a fresh InteractionStore."""
+    from app import app
+    from database import db, UserInteraction
+
+    with app.app_context():
+        rows = db.session.query(UserInteraction.user_id, UserInteraction.product_id, UserInteraction.interaction_count).all()
+    return InteractionStore.from_rows(rows)
+
+
+def count_interactions():
+    """Total number of recorded views, used to decide when a retrain is due."""
+    from sqlalchemy import func
+    from app import app
+    from database import db, UserInteraction
+
+    with app.app_context():
+        return db.session.query(func.coalesce(func.sum(UserInteraction.interaction_count), 0)).scalar()
+
+
+def train_once(store, directory=FACTORS_DIR, k=50):
+    """Factorize ``store`` and publish the factors as a new version."""
+    model = factorize(store, k=k)
+    if model is None:
+        print("Not enough interactions to train the collaborative model yet.")
+        return None
+    version = publish(model, directory)
+    print(f"Published collaborative model version {version} "
+          f"(k={model.k}, {model.meta['n_users']} users, {model.meta['n_products']} products, "
+          f"{model.meta['train_seconds']:.2f}s)")
+    return model
+
+
+def prune(directory=FACTORS_DIR, keep=3):
+    """Delete all but the ``keep`` newest versions, never the one ``CURRENT`` points at."""
+    current = current_version(directory)
+    versions = sorted(name for name in os.listdir(directory) if os.path.isdir(os.path.join(directory, name)))
+    for version in versions[:-keep] if keep else versions:
+        if version != current:
+            shutil.rmtree(os.path.join(directory, version), ignore_errors=True)
+
+
+def watch(directory=FACTORS_DIR, k=50, interval=3600, min_new_interactions=1000, poll=30, keep=3):
+    """Retrain every ``interval`` seconds, or sooner once ``min_new_interactions`` new views arrive."""
+    trained_at, trained_count = None, None
+    while True:
+        count = count_interactions()
+        if (trained_at is None
+                or time.monotonic() - trained_at >= interval
+                or count - trained_count >= min_new_interactions):
+            train_once(load_store_from_database(), directory, k)
+            prune(directory, keep)
+            trained_at, trained_count = time.monotonic(), count
+        time.sleep(poll)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train and publish versioned collaborative filtering factors.")
+    parser.add_argument("--output", default=FACTORS_DIR)
+    parser.add_argument("--k", type=int, default=50)
+    parser.add_argument("--watch", action="store_true", help="keep running and retrain periodically")
+    parser.add_argument("--interval", type=float, default=3600, help="seconds between scheduled retrains")
+    parser.add_argument("--min-new-interactions", type=int, default=1000, help="retrain early after this many new views")
+    parser.add_argument("--poll", type=float, default=30, help="seconds between interaction-count checks")
+    parser.add_argument("--keep", type=int, default=3, help="number of versions to keep on disk")
+    args = parser.parse_args()
+
+    if args.watch:
+        watch(args.output, args.k, args.interval, args.min_new_interactions, args.poll, args.keep)
+    else:
+        train_once(load_store_from_database(), args.output, args.k)
+        prune(args.output, args.keep)
@@ -0,0 +1,100 @@
+"""Live product popularity over a sliding time window.
+
+Views are counted in a ring of ``n_buckets`` time buckets covering ``window``
+seconds; a bucket is cleared when the ring wraps around to it, so views older
+than the window drop out without a sweep. Each bucket keeps at most about
+``2 * capacity`` products: past that it is pruned to its ``capacity`` most viewed
+ones, which bounds memory while keeping every product that is actually trending.
+The ranking is recomputed from the buckets at most once per ``refresh_interval``,
+by one caller at a time while the others read the previous one, so reads mostly
+return a list that already exists.
+
+Each process counts the views it records; behind a load balancer every worker
+sees a random share of the traffic and ranks the same products on top.
+"""
+import heapq
+import threading
+import time
+
+
+class TrendingCounter:
+    """Sliding-window (optionally exponentially decayed) view counts per product.
+
+    With ``half_life`` set, a view ``age`` seconds old counts ``0.5 ** (age / half_life)``.
+    """
+
+    def __init__(self, window=3600.0, n_buckets=60, capacity=10000, half_life=None, refresh_interval=1.0, clock=time.time):
+        self.window = window
+        self.n_buckets = n_buckets
+        self.bucket_seconds = window / n_buckets
+        self.capacity = capacity
+        self.half_life = half_life
+        self.refresh_interval = refresh_interval
+        self._clock = clock
+        self._buckets = [{} for _ in range(n_buckets)]
+        self._bucket_ids = [None] * n_buckets
+        self._lock = threading.Lock()
+        # Held by the one thread recomputing the ranking; separate so views keep being counted meanwhile
+        self._refresh_lock = threading.Lock()
+        # (computed_at, [(product_id, score), ...] best first), replaced whole on refresh
+        self._ranking = (None, [])
+        self.version = 0
+        self.stats = {"views": 0, "prunes": 0, "refreshes": 0}
+
+    def _bucket(self, bucket_id):
+        slot = bucket_id % self.n_buckets
+        if self._bucket_ids[slot] != bucket_id:
+            self._buckets[slot] = {}
+            self._bucket_ids[slot] = bucket_id
+        return self._buckets[slot]
+
+    def add(self, product_id, count=1):
+        with self._lock:
+            bucket = self._bucket(int(self._clock() // self.bucket_seconds))
+            bucket[product_id] = bucket.get(product_id, 0) + count
+            self.stats["views"] += count
+            if len(bucket) > 2 * self.capacity:
+                kept = heapq.nlargest(self.capacity, bucket.items(), key=lambda item: item[1])
+                bucket.clear()
+                bucket.update(kept)
+                self.stats["prunes"] += 1
+
+    def _rank(self, now):
+        current = int(now // self.bucket_seconds)
+        scores = {}
+        with self._lock:
+            buckets = [(bucket_id, dict(bucket)) for bucket_id, bucket in zip(self._bucket_ids, self._buckets)
+                       if bucket_id is not None and current - bucket_id < self.n_buckets]
+        for bucket_id, bucket in buckets:
+            weight = 1.0
+            if self.half_life:
+                age = (current - bucket_id) * self.bucket_seconds
+                weight = 0.5 ** (age / self.half_life)
+            for product_id, count in bucket.items():
+                scores[product_id] = scores.get(product_id, 0.0) + weight * count
+        return heapq.nlargest(self.capacity, scores.items(), key=lambda item: item[1])
+
+    def top(self, n=8):
+        """The ``n`` most viewed products in the window as ``[(product_id, score), ...]``, best first."""
+        now = self._clock()
+        computed_at, ranking = self._ranking
+        if computed_at is not None and now - computed_at < self.refresh_interval:
+            return ranking[:n]
+        # One caller recomputes; the others keep reading the previous ranking (or wait for the first one)
+        if not self._refresh_lock.acquire(blocking=computed_at is None):
+            return ranking[:n]
+        try:
+            computed_at, ranking = self._ranking
+            if computed_at is None or now - computed_at >= self.refresh_interval:
+                ranking = self._rank(now)
+                self._ranking = (now, ranking)
+                self.version += 1
+                self.stats["refreshes"] += 1
+        finally:
+            self._refresh_lock.release()
+        return ranking[:n]
+
+    def snapshot(self):
+        with self._lock:
+            products = sum(len(bucket) for bucket in self._buckets)
+        return dict(self.stats, window=self.window, n_buckets=self.n_buckets, bucket_entries=products, version=self.version)
@@ -1,7 +1,15 @@
 import pandas as pd
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+
+from content_index import ContentIndex
+from catalog_store import take_rows
+from similarity import ExactBackend
+from name_index import NameIndex
+from interaction_store import InteractionStore
+from factor_model import factorize
+from ranking import top_k_indices, top_k_rows
+from hybrid import hybrid_rank
+from metrics import span
 
 
 def truncate(text, length):
@@ -11,105 +19,125 @@ def truncate(text, length):
     else:
         return text
 
-def content_based_recommendations(train_data, item_name, top_n=10):
+def content_based_recommendations(train_data, item_name, top_n=10, content_index=None, backend=None, name_index=None):
     """Generate content-based recommendations based on product tags."""
-    if not train_data['Name'].apply(lambda x: item_name.lower() in x.lower()).any():
+    if name_index is None:
+        name_index = NameIndex(train_data['Name'])
+    item_index = name_index.resolve(item_name)
+    if item_index is None:
         print(f"Item '{item_name}' not found in the training data.")
         return pd.DataFrame()
     
-    tfidf_vectorizer = TfidfVectorizer(stop_words='english')
-    tfidf_matrix_content = tfidf_vectorizer.fit_transform(train_data['Tags'])
-    
-    print(f"TF-IDF Matrix Shape: {tfidf_matrix_content.shape}")
-    
-    cosine_similarities_content = cosine_similarity(tfidf_matrix_content, tfidf_matrix_content)
-    item_index = train_data[train_data['Name'].apply(lambda x: item_name.lower() in x.lower())].index[0]
-    similar_items = list(enumerate(cosine_similarities_content[item_index]))
-    
-    similar_items = sorted(similar_items, key=lambda x: x[1], reverse=True)
-    top_similar_items = similar_items[1:top_n+1]
+    if backend is None:
+        if content_index is None:
+            content_index = ContentIndex.build(train_data['Tags'])
+        backend = ExactBackend(content_index)
     
-    recommended_item_indices = [x[0] for x in top_similar_items]
+    with span("content_search"):
+        recommended_item_indices, _ = backend.search(item_index, top_n)
     
-    recommended_items_details = train_data.iloc[recommended_item_indices][['id','Name', 'ReviewCount', 'Factory', 'Img', 'Rating','Description']]
+    with span("rows"):
+        recommended_items_details = take_rows(train_data, recommended_item_indices, ['id','Name', 'ReviewCount', 'Factory', 'Img', 'Rating','Description'])
     
     return recommended_items_details
 
 
 # Collaborative recommendations
 
-def collaborative_recommendations(user_id):
-    from app import UserInteraction
-    
-    interactions = UserInteraction.query.all()
-
-    interaction_data = [(i.user_id, i.product_id, i.interaction_count) for i in interactions]
-    interaction_df = pd.DataFrame(interaction_data, columns=['user_id', 'product_id', 'interaction_count'])
-
-    user_item_matrix = interaction_df.pivot_table(index='user_id', columns='product_id', values='interaction_count', fill_value=0)
-    reconstructed_matrix, user_mean, user_ids, product_ids = perform_svd(user_item_matrix)
+def load_interaction_store():
+    """Build an InteractionStore straight from the database (used when no shared store is passed)."""
+    from database import UserInteraction
 
-    return recommend_products(user_id, reconstructed_matrix, user_mean, user_ids, product_ids)
+    rows = UserInteraction.query.with_entities(UserInteraction.user_id, UserInteraction.product_id, UserInteraction.interaction_count)
+    return InteractionStore.from_rows(rows)
 
-def perform_svd(interaction_matrix, k=50):
-    from scipy.sparse.linalg import svds
-
-    interaction_matrix_np = interaction_matrix.values
-    user_mean = interaction_matrix_np.mean(axis=1).reshape(-1, 1)
-    interaction_matrix_centered = interaction_matrix_np - user_mean
+def collaborative_recommendations(user_id, factor_model=None, top_n=5, interaction_store=None):
+    if interaction_store is None:
+        with span("interaction_load"):
+            interaction_store = load_interaction_store()
+    if factor_model is None:
+        factor_model = perform_svd(interaction_store)
+    if factor_model is None:
+        return []
 
-    U, sigma, Vt = svds(interaction_matrix_centered, k=k)
-    sigma = np.diag(sigma)
-    reconstructed_matrix = np.dot(np.dot(U, sigma), Vt) + user_mean
+    with span("collaborative_score"):
+        return recommend_products(user_id, factor_model, top_n=top_n, seen=interaction_store.seen_products(user_id))
 
-    return reconstructed_matrix, user_mean, interaction_matrix.index, interaction_matrix.columns
+def perform_svd(interaction_store, k=50):
+    """Factorize the centred interaction matrix; returns a FactorModel, or None if it is too small."""
+    with span("svd"):
+        return factorize(interaction_store, k=k)
 
-def recommend_products(user_id, reconstructed_matrix, user_mean, user_ids, product_ids, top_n=5):
-    if user_id not in user_ids:
+def recommend_products(user_id, factor_model, top_n=5, seen=()):
+    predicted_scores = factor_model.score_user(user_id)
+    if predicted_scores is None:
         return []
     
-    user_idx = user_ids.get_loc(user_id)
-    predicted_scores = reconstructed_matrix[user_idx]
-    recommended_indices = predicted_scores.argsort()[::-1]
-
-    recommended_product_ids = [product_ids[i] for i in recommended_indices if i not in user_ids[user_id]]
-
-    return recommended_product_ids[:top_n]
+    recommended_indices = top_k_indices(predicted_scores, top_n, exclude=factor_model.product_columns(seen, len(predicted_scores)))
 
+    return [factor_model.product_ids[i] for i in recommended_indices]
 
-def hybrid_recommendations(train_data, user_id, item_name, user_item_matrix, top_n=10, content_weight=0.5, collaborative_weight=0.5):
-    """Generate hybrid recommendations by combining content-based and collaborative filtering."""
-    from scipy.sparse.linalg import svds
 
-    U, sigma, Vt = svds(user_item_matrix, k=50)
-    sigma = np.diag(sigma)
-
-    # Content-based recommendations
-    content_rec = content_based_recommendations(train_data, item_name, top_n=top_n)
-    content_rec_ids = content_rec['id'].tolist()
-    content_scores = {id: rank for rank, id in enumerate(content_rec_ids)}
-
-    # Collaborative filtering predictions
-    if user_id not in user_item_matrix.index:
+def hybrid_recommendations(train_data, user_id, item_name, factor_model, top_n=10, content_weight=0.5, collaborative_weight=0.5, content_index=None, backend=None, name_index=None, interaction_store=None, normalization="minmax", candidates=100):
+    """Generate hybrid recommendations by blending normalised content and collaborative scores (see hybrid.py)."""
+    if name_index is None:
+        name_index = NameIndex(train_data['Name'])
+    if backend is None:
+        if content_index is None:
+            content_index = ContentIndex.build(train_data['Tags'])
+        backend = ExactBackend(content_index)
+    if factor_model is not None and not factor_model.has_user(user_id):
         print(f"User ID {user_id} not found in interaction data. Skipping collaborative filtering.")
-        collaborative_rec_ids = []
-        collaborative_scores = {}
-    else:
-        user_idx = user_item_matrix.index.get_loc(user_id)
-        predicted_scores = np.dot(np.dot(U, sigma), Vt)[user_idx]
-        product_ids = user_item_matrix.columns
-        collaborative_scores = {product_ids[i]: predicted_scores[i] for i in range(len(product_ids))}
-        collaborative_rec_ids = sorted(collaborative_scores, key=collaborative_scores.get, reverse=True)
-
-    # Merging both
-    combined_scores = {}
-    for id in set(content_rec_ids + collaborative_rec_ids):
-        combined_scores[id] = (
-            content_weight * content_scores.get(id, float('inf')) +
-            collaborative_weight * -collaborative_scores.get(id, float('-inf'))
-        )
-
-    hybrid_rec_ids = sorted(combined_scores, key=combined_scores.get)[:top_n]
-
-    hybrid_recommendations = train_data[train_data['id'].isin(hybrid_rec_ids)]
-    return hybrid_recommendations
+    seen = interaction_store.seen_products(user_id) if interaction_store is not None and factor_model is not None else ()
+
+    positions, _ = hybrid_rank(backend.index, train_data, backend, name_index, item_name, factor_model, user_id, top_n=top_n,
+                               content_weight=content_weight, collaborative_weight=collaborative_weight,
+                               normalization=normalization, candidates=candidates, seen=seen)
+    with span("rows"):
+        return take_rows(train_data, positions)
+
+
+# Batch recommendations
+
+# Upper bound on the cells of one dense score block (16M float64 values, 128 MB)
+MAX_BLOCK_CELLS = 2 ** 24
+
+def _blocks(values, block_size, n_columns):
+    block_size = max(1, min(block_size, MAX_BLOCK_CELLS // max(n_columns, 1)))
+    for start in range(0, len(values), block_size):
+        yield values[start:start + block_size]
+
+def batch_collaborative_recommendations(user_ids, factor_model, top_n=5, interaction_store=None, block_size=256):
+    """Yield ``{"user_id", "recommendations"}`` per user, scoring a whole block of users per matrix product."""
+    for block in _blocks(list(user_ids), block_size, len(factor_model.product_ids)):
+        known, scores = factor_model.score_users(block)
+
+        exclude = None
+        if interaction_store is not None and known:
+            seen = [factor_model.product_columns(interaction_store.seen_products(user_id), scores.shape[1]) for user_id in known]
+            rows = np.repeat(np.arange(len(known)), [len(columns) for columns in seen])
+            exclude = (rows, np.concatenate(seen))
+
+        indices, top_scores = top_k_rows(scores, top_n, exclude=exclude)
+        recommended = {
+            user_id: [factor_model.product_ids[i] for i, score in zip(row_indices, row_scores) if score != -np.inf]
+            for user_id, row_indices, row_scores in zip(known, indices, top_scores)
+        }
+        for user_id in block:
+            yield {"user_id": user_id, "recommendations": recommended.get(user_id, [])}
+
+def batch_content_based_recommendations(train_data, item_names, content_index, name_index, top_n=5, block_size=256):
+    """Yield ``{"item_name", "recommendations"}`` per item name, one sparse block product per block of items."""
+    product_ids = train_data['id'].to_numpy()
+    resolved = [(item_name, name_index.resolve(item_name)) for item_name in item_names]
+    for block in _blocks(resolved, block_size, content_index.shape[0]):
+        found = [position for _, position in block if position is not None]
+        recommended = {}
+        if found:
+            positions = np.asarray(found)
+            scores = content_index.similarities_block(positions)
+            indices, top_scores = top_k_rows(scores, top_n, exclude=(np.arange(len(positions)), positions))
+            for position, row_indices, row_scores in zip(found, indices, top_scores):
+                recommended[position] = [product_ids[i].item() for i, score in zip(row_indices, row_scores) if score != -np.inf]
+        for item_name, position in block:
+            yield {"item_name": item_name, "recommendations": recommended.get(position, [])}